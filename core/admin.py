@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Camera, MediaFile, Tag
+from .models import CustomUser, Camera, MediaFile, Tag, Job, PurgeEntry
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -22,10 +22,10 @@ class CustomUserAdmin(UserAdmin):
 
 @admin.register(Camera)
 class CameraAdmin(admin.ModelAdmin):
-    list_display = ('name', 'latitude', 'longitude', 'orientation', 'created_at')
+    list_display = ('name', 'latitude', 'longitude', 'orientation', 'media_count', 'latest_media_date', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('name',)
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('media_count', 'latest_media_date', 'created_at', 'updated_at')
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -40,3 +40,16 @@ class MediaFileAdmin(admin.ModelAdmin):
     search_fields = ('camera__name', 'description')
     readonly_fields = ('created_at', 'updated_at')
     filter_horizontal = ('tags',)
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_after', 'locked_by', 'created_at')
+    list_filter = ('name', 'status')
+    readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(PurgeEntry)
+class PurgeEntryAdmin(admin.ModelAdmin):
+    list_display = ('name', 'is_rendition', 'attempts', 'created_at')
+    list_filter = ('is_rendition',)
+    search_fields = ('name',)
+    readonly_fields = ('created_at',)
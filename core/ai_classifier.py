@@ -1,60 +1,102 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from PIL import Image
 import tflite_runtime.interpreter as tflite
 from django.conf import settings
 
 class DeerClassifier:
-    def __init__(self):
+    def __init__(self, batch_size=32, preprocess_workers=4):
         self.model_path = os.path.join(settings.BASE_DIR, 'core', 'ai_models', 'deer_classifier.tflite')
         self.input_size = (224, 224)  # Standard input size for many models
         self.confidence_threshold = 0.7  # Minimum confidence to apply a tag
-        self.interpreter = None
-        
+        self.batch_size = batch_size  # Maximum images per interpreter invocation
+        self.preprocess_workers = preprocess_workers
+
         # Labels for our classifier
         self.labels = ['buck', 'doe']
-        
-        # Load model if it exists, otherwise use mock predictions
-        if os.path.exists(self.model_path):
-            self.load_model()
-        else:
+
+        # Interpreters are not thread-safe, so each thread loads its own lazily
+        self._local = threading.local()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+        # Use mock predictions if there is no model
+        self.has_model = os.path.exists(self.model_path)
+        if not self.has_model:
             print("No model found, using mock predictions")
-    
+
+    @property
+    def interpreter(self):
+        """The TFLite interpreter owned by the current thread."""
+        if not self.has_model:
+            return None
+        if not hasattr(self._local, 'interpreter'):
+            self.load_model()
+        return self._local.interpreter
+
+    @property
+    def executor(self):
+        """Thread pool used to decode and resize images."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.preprocess_workers,
+                    thread_name_prefix='classifier-preprocess'
+                )
+            return self._executor
+
     def load_model(self):
-        """Load the TFLite model."""
+        """Load the TFLite model for the current thread."""
         try:
-            self.interpreter = tflite.Interpreter(model_path=self.model_path)
-            self.interpreter.allocate_tensors()
+            interpreter = tflite.Interpreter(model_path=self.model_path)
+            interpreter.allocate_tensors()
+            # Tensor details never change for a loaded model, so look them up once
+            self._local.input_index = interpreter.get_input_details()[0]['index']
+            self._local.output_index = interpreter.get_output_details()[0]['index']
+            self._local.batch_size = 1
+            self._local.interpreter = interpreter
             print("Model loaded successfully")
         except Exception as e:
             print(f"Error loading model: {e}")
-            self.interpreter = None
-    
-    def preprocess_image(self, image_path):
-        """Preprocess the image for model input."""
+            self._local.interpreter = None
+
+    def load_image(self, image_path):
+        """Decode and resize an image (path or binary file) to the model input size, without a batch dimension."""
+        if image_path is None:
+            return None
         try:
             with Image.open(image_path) as img:
+                # Let the JPEG decoder downscale while decoding (no-op for other formats)
+                img.draft('RGB', self.input_size)
+
                 # Convert to RGB if necessary
                 if img.mode != 'RGB':
                     img = img.convert('RGB')
-                
+
                 # Resize to expected input size
                 img = img.resize(self.input_size, Image.Resampling.LANCZOS)
-                
+
                 # Convert to numpy array and normalize
-                img_array = np.array(img, dtype=np.float32)
-                img_array = img_array / 255.0
-                
-                # Add batch dimension
-                img_array = np.expand_dims(img_array, axis=0)
-                
-                return img_array
+                return np.asarray(img, dtype=np.float32) / 255.0
         except Exception as e:
             print(f"Error preprocessing image: {e}")
             return None
-    
+
+    def preprocess_image(self, image_path):
+        """Preprocess the image for model input."""
+        img_array = self.load_image(image_path)
+        if img_array is None:
+            return None
+
+        # Add batch dimension
+        return np.expand_dims(img_array, axis=0)
+
     def mock_predict(self, image_path):
         """Mock prediction function for testing without a real model."""
+        if image_path is None:
+            return None
         # Use image hash to make "random" but consistent predictions
         try:
             with Image.open(image_path) as img:
@@ -62,10 +104,10 @@ class DeerClassifier:
                 img_hash = hash(img.tobytes())
                 # Use hash to determine prediction
                 is_buck = img_hash % 2 == 0
-                
+
                 # Generate mock confidence scores
                 confidence = 0.7 + (img_hash % 1000) / 10000  # Between 0.7 and 0.8
-                
+
                 if is_buck:
                     return {'buck': confidence, 'doe': 1 - confidence}
                 else:
@@ -73,53 +115,82 @@ class DeerClassifier:
         except Exception as e:
             print(f"Error in mock prediction: {e}")
             return None
-    
+
     def predict(self, image_path):
         """Predict whether the image contains a buck or doe."""
+        return self.predict_batch([image_path])[0]
+
+    def predict_batch(self, image_paths):
+        """
+        Predict buck/doe scores for many images at once.
+
+        Images may be paths or open binary files (see storage_utils.prefetch);
+        None entries are skipped.
+
+        Images are decoded and resized on a thread pool, stacked into one
+        batch tensor and run through the interpreter in a single invocation
+        per ``batch_size`` images.
+
+        Returns:
+            list: One predictions dict per path, or None where an image
+                  could not be processed (same order as ``image_paths``)
+        """
+        image_paths = list(image_paths)
+
         # If no real model is loaded, use mock predictions
         if self.interpreter is None:
-            return self.mock_predict(image_path)
-        
-        try:
-            # Preprocess image
-            input_data = self.preprocess_image(image_path)
-            if input_data is None:
-                return None
-            
-            # Get input and output details
-            input_details = self.interpreter.get_input_details()
-            output_details = self.interpreter.get_output_details()
-            
-            # Set input tensor
-            self.interpreter.set_tensor(input_details[0]['index'], input_data)
-            
-            # Run inference
-            self.interpreter.invoke()
-            
-            # Get prediction results
-            output_data = self.interpreter.get_tensor(output_details[0]['index'])
-            scores = output_data[0]
-            
-            # Convert to dictionary
-            predictions = {
-                self.labels[i]: float(score)
-                for i, score in enumerate(scores)
-            }
-            
-            return predictions
-        except Exception as e:
-            print(f"Error during prediction: {e}")
-            return None
-    
+            return list(self.executor.map(self.mock_predict, image_paths))
+
+        results = [None] * len(image_paths)
+        for start in range(0, len(image_paths), self.batch_size):
+            chunk = image_paths[start:start + self.batch_size]
+            arrays = list(self.executor.map(self.load_image, chunk))
+            positions = [i for i, array in enumerate(arrays) if array is not None]
+            if not positions:
+                continue
+
+            try:
+                scores = self.invoke(np.stack([arrays[i] for i in positions]))
+            except Exception as e:
+                print(f"Error during prediction: {e}")
+                continue
+
+            for i, image_scores in zip(positions, scores):
+                # Convert to dictionary
+                results[start + i] = {
+                    self.labels[j]: float(score)
+                    for j, score in enumerate(image_scores)
+                }
+
+        return results
+
+    def invoke(self, batch):
+        """Run the current thread's interpreter on a stacked batch tensor."""
+        interpreter = self.interpreter
+        local = self._local
+
+        # Resize the input tensor only when the batch size changes
+        if batch.shape[0] != local.batch_size:
+            interpreter.resize_tensor_input(
+                local.input_index,
+                [batch.shape[0], *self.input_size, 3]
+            )
+            interpreter.allocate_tensors()
+            local.batch_size = batch.shape[0]
+
+        interpreter.set_tensor(local.input_index, batch)
+        interpreter.invoke()
+        return interpreter.get_tensor(local.output_index)
+
     def get_best_prediction(self, predictions):
         """Get the highest confidence prediction above threshold."""
         if not predictions:
             return None, 0
-        
+
         best_label = max(predictions.items(), key=lambda x: x[1])
         if best_label[1] >= self.confidence_threshold:
             return best_label
         return None, 0
 
 # Global instance
-classifier = DeerClassifier() 
\ No newline at end of file
+classifier = DeerClassifier()
@@ -1,4 +1,12 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(sender, using, **kwargs):
+    """Reinstall the search index triggers that table rebuilds drop on SQLite."""
+    from .search_utils import install_search_index
+    install_search_index(connections[using])
 
 
 class CoreConfig(AppConfig):
@@ -6,5 +14,7 @@ class CoreConfig(AppConfig):
     name = 'core'
 
     def ready(self):
-        """Import signals when the app is ready."""
+        """Import signals and register background jobs when the app is ready."""
         import core.signals
+        import core.tasks
+        post_migrate.connect(ensure_search_index, sender=self)
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import threading
+from uuid import uuid4
+from django.core.cache import caches
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Cached view payloads, invalidated by signals (see core/signals.py)
+DASHBOARD = 'dashboard'
+CAMERA_MAP = 'camera_map'
+NAMESPACES = [DASHBOARD, CAMERA_MAP]
+
+# Generation of the in-memory perceptual hash indexes (see utils.PerceptualHashIndex)
+HASH_INDEX = 'hash_index'
+
+CACHE_ALIAS = 'default'
+
+_pending = threading.local()
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+def get_generation(namespace):
+    """
+    Current generation token of a namespace.
+
+    Every cache key includes the token, so replacing it invalidates all
+    entries of the namespace at once, whatever filters they were built for.
+    """
+    return get_cache().get_or_set(f'generation:{namespace}', uuid4().hex, timeout=None)
+
+def make_key(namespace, params=None):
+    """Cache key for a namespace, its current generation and a set of filters."""
+    digest = hashlib.md5(
+        json.dumps(params or {}, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return f'{namespace}:{get_generation(namespace)}:{digest}'
+
+def count(namespace, outcome):
+    """Increment the hit or miss counter of a namespace."""
+    cache = get_cache()
+    key = f'stats:{namespace}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter missing (first use or evicted)
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+def cached(namespace, params, compute):
+    """
+    Return the cached value for a namespace and filter set, computing it on a miss.
+
+    Args:
+        namespace (str): One of NAMESPACES
+        params (dict): Filters the value depends on
+        compute (callable): Builds the value; it must be picklable
+
+    Returns:
+        The cached or freshly computed value
+    """
+    cache = get_cache()
+    try:
+        key = make_key(namespace, params)
+        value = cache.get(key)
+        count(namespace, 'hits' if value is not None else 'misses')
+    except Exception as e:
+        # A broken cache backend must not take the page down
+        logger.error(f'Error reading {namespace} cache: {str(e)}')
+        return compute()
+
+    if value is not None:
+        return value
+
+    value = compute()
+    try:
+        cache.set(key, value, timeout=None)
+    except Exception as e:
+        logger.error(f'Error writing {namespace} cache: {str(e)}')
+    return value
+
+def invalidate(*namespaces):
+    """Start a new generation for each namespace, dropping its cached entries."""
+    cache = get_cache()
+    for namespace in namespaces:
+        try:
+            cache.set(f'generation:{namespace}', uuid4().hex, timeout=None)
+        except Exception as e:
+            logger.error(f'Error invalidating {namespace} cache: {str(e)}')
+
+def schedule_invalidation(*namespaces):
+    """
+    Invalidate namespaces once the current transaction commits.
+
+    Invalidating only after commit (and after any rollup refresh scheduled
+    earlier in the transaction) means a concurrent request cannot cache
+    data from before the change.
+    """
+    pending = _pending.__dict__.setdefault('namespaces', set())
+    pending.update(namespaces)
+    transaction.on_commit(flush_invalidation)
+
+def flush_invalidation():
+    namespaces = getattr(_pending, 'namespaces', None)
+    if namespaces:
+        _pending.namespaces = set()
+        invalidate(*namespaces)
+
+def get_cache_stats():
+    """Hit/miss counters and hit ratio for every namespace."""
+    cache = get_cache()
+    keys = [
+        f'stats:{namespace}:{outcome}'
+        for namespace in NAMESPACES
+        for outcome in ('hits', 'misses')
+    ]
+    values = cache.get_many(keys)
+
+    stats = {}
+    for namespace in NAMESPACES:
+        hits = values.get(f'stats:{namespace}:hits', 0)
+        misses = values.get(f'stats:{namespace}:misses', 0)
+        stats[namespace] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None
+        }
+    return stats
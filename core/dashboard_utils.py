@@ -1,119 +1,164 @@
-from django.db.models import Count, Q
+from django.conf import settings
+from django.db.models import Case, IntegerField, Q, Sum, Value, When
 from django.utils import timezone
 from datetime import timedelta
 from collections import defaultdict
-from .models import MediaFile, Tag, WeatherData
+from .models import SightingRollup
 
-def get_basic_stats():
-    """Get basic statistics about media files."""
-    total_files = MediaFile.objects.count()
-    buck_count = MediaFile.objects.filter(tags__name='buck').count()
-    doe_count = MediaFile.objects.filter(tags__name='doe').count()
-    
+# All dashboard statistics read the pre-aggregated rollup table
+# (see core/rollup_utils.py), never the media, tag or weather tables.
+
+# Temperature range boundaries in whole degrees Celsius; ranges are (low, high]
+DEFAULT_TEMPERATURE_EDGES = [0, 10, 20, 30]
+
+# Tags counted separately as sightings
+DEFAULT_SIGHTING_TAGS = ['buck', 'doe']
+
+def get_temperature_edges():
+    return getattr(settings, 'DASHBOARD_TEMPERATURE_EDGES', DEFAULT_TEMPERATURE_EDGES)
+
+def get_sighting_tags():
+    return getattr(settings, 'DASHBOARD_SIGHTING_TAGS', DEFAULT_SIGHTING_TAGS)
+
+def temperature_range_labels(edges):
+    """Labels such as 'Below 0°C', '0-10°C', ..., 'Above 30°C' for the given edges."""
+    labels = [f'Below {edges[0]}°C']
+    labels += [f'{low}-{high}°C' for low, high in zip(edges, edges[1:])]
+    labels.append(f'Above {edges[-1]}°C')
+    return labels
+
+def tag_counts(tags):
+    """Conditional Sum aggregates counting each tag, keyed tag_<n>."""
     return {
-        'total_files': total_files,
-        'buck_count': buck_count,
-        'doe_count': doe_count
+        f'tag_{i}': Sum('count', filter=Q(tag__name=tag))
+        for i, tag in enumerate(tags)
+    }
+
+def get_sighting_summary(temperature_edges=None, tags=None):
+    """
+    Compute the basic statistics and temperature ranges in one grouped query.
+
+    Each rollup row is assigned a temperature range with CASE/WHEN on its
+    temperature bucket (rows without weather get range -1), and totals and
+    per-tag counts are taken with conditional aggregation. Overall totals
+    are the sum over all ranges.
+
+    Args:
+        temperature_edges (list[int], optional): Range boundaries in whole °C
+        tags (list[str], optional): Tags to count separately
+
+    Returns:
+        dict: ``basic_stats`` (total_files and <tag>_count) and
+              ``temp_stats`` (one dict per range with range, total and
+              <tag>_count)
+    """
+    edges = temperature_edges or get_temperature_edges()
+    tags = tags or get_sighting_tags()
+
+    # Buckets hold temperatures rounded up, so bucket <= edge means temp <= edge
+    range_index = Case(
+        When(temperature_bucket__isnull=True, then=Value(-1)),
+        *[
+            When(temperature_bucket__lte=edge, then=Value(i))
+            for i, edge in enumerate(edges)
+        ],
+        default=Value(len(edges)),
+        output_field=IntegerField()
+    )
+
+    rows = (
+        SightingRollup.objects
+        .filter(Q(tag__isnull=True) | Q(tag__name__in=tags))
+        .annotate(range_index=range_index)
+        .values('range_index')
+        .annotate(total=Sum('count', filter=Q(tag__isnull=True)), **tag_counts(tags))
+        .order_by()
+    )
+    by_range = {row['range_index']: row for row in rows}
+
+    def counts(row):
+        return {
+            f'{tag}_count': (row or {}).get(f'tag_{i}') or 0
+            for i, tag in enumerate(tags)
+        }
+
+    temp_stats = [
+        {
+            'range': label,
+            'total': (by_range.get(i) or {}).get('total') or 0,
+            **counts(by_range.get(i))
+        }
+        for i, label in enumerate(temperature_range_labels(edges))
+    ]
+
+    basic_stats = {
+        'total_files': sum(row['total'] or 0 for row in by_range.values()),
+        **{
+            f'{tag}_count': sum(row[f'tag_{i}'] or 0 for row in by_range.values())
+            for i, tag in enumerate(tags)
+        }
     }
 
+    return {'basic_stats': basic_stats, 'temp_stats': temp_stats}
+
+def get_basic_stats():
+    """Get basic statistics about media files."""
+    return get_sighting_summary()['basic_stats']
+
+def get_temperature_ranges():
+    """Analyze sightings across temperature ranges."""
+    return get_sighting_summary()['temp_stats']
+
 def get_upload_timeline(days=30):
     """Get daily upload counts for the specified number of days."""
     end_date = timezone.now()
     start_date = end_date - timedelta(days=days)
-    
+
     daily_uploads = (
-        MediaFile.objects
-        .filter(upload_date__gte=start_date)
-        .extra({'date': "DATE(upload_date)"})
+        SightingRollup.objects
+        .filter(tag__isnull=True, date__gte=start_date.date())
         .values('date')
-        .annotate(count=Count('id'))
+        .annotate(count=Sum('count'))
         .order_by('date')
     )
-    
+
     # Create a complete date range with zeros for missing dates
     date_counts = defaultdict(int)
     current_date = start_date.date()
     while current_date <= end_date.date():
         date_counts[current_date.isoformat()] = 0
         current_date += timedelta(days=1)
-    
+
     # Fill in actual counts
     for entry in daily_uploads:
         date_counts[entry['date'].isoformat()] = entry['count']
-    
+
     return {
         'labels': list(date_counts.keys()),
         'counts': list(date_counts.values())
     }
 
-def get_weather_impact():
+def get_weather_impact(tags=None):
     """Analyze correlation between weather conditions and sightings."""
+    tags = tags or get_sighting_tags()
+
+    # One row per condition with a conditional count for every tag
     weather_stats = (
-        WeatherData.objects
-        .filter(media_file__tags__name__in=['buck', 'doe'])
-        .values(
-            'weather_condition',
-            'media_file__tags__name'
-        )
-        .annotate(count=Count('id'))
-        .order_by('-count')
+        SightingRollup.objects
+        .filter(has_weather=True, tag__name__in=tags)
+        .values('weather_condition')
+        .annotate(total=Sum('count'), **tag_counts(tags))
+        .order_by('-total')
     )
-    
-    # Organize data by weather condition
-    weather_impact = defaultdict(lambda: {'buck': 0, 'doe': 0, 'total': 0})
-    for stat in weather_stats:
-        condition = stat['weather_condition']
-        animal = stat['media_file__tags__name']
-        count = stat['count']
-        
-        weather_impact[condition][animal] = count
-        weather_impact[condition]['total'] += count
-    
-    # Convert to list and sort by total sightings
-    impact_data = [
+
+    return [
         {
-            'condition': condition,
-            'buck_count': data['buck'],
-            'doe_count': data['doe'],
-            'total': data['total']
+            'condition': stat['weather_condition'],
+            **{
+                f'{tag}_count': stat[f'tag_{i}'] or 0
+                for i, tag in enumerate(tags)
+            },
+            'total': stat['total']
         }
-        for condition, data in weather_impact.items()
-    ]
-    impact_data.sort(key=lambda x: x['total'], reverse=True)
-    
-    return impact_data
-
-def get_temperature_ranges():
-    """Analyze sightings across temperature ranges."""
-    temp_ranges = [
-        {'min': float('-inf'), 'max': 0, 'label': 'Below 0°C'},
-        {'min': 0, 'max': 10, 'label': '0-10°C'},
-        {'min': 10, 'max': 20, 'label': '10-20°C'},
-        {'min': 20, 'max': 30, 'label': '20-30°C'},
-        {'min': 30, 'max': float('inf'), 'label': 'Above 30°C'}
+        for stat in weather_stats
     ]
-    
-    temp_stats = []
-    for temp_range in temp_ranges:
-        query = Q(temperature__gt=temp_range['min'])
-        if temp_range['max'] != float('inf'):
-            query &= Q(temperature__lte=temp_range['max'])
-        
-        stats = (
-            WeatherData.objects
-            .filter(query)
-            .aggregate(
-                total=Count('id'),
-                buck_count=Count('media_file__tags', filter=Q(media_file__tags__name='buck')),
-                doe_count=Count('media_file__tags', filter=Q(media_file__tags__name='doe'))
-            )
-        )
-        
-        temp_stats.append({
-            'range': temp_range['label'],
-            'total': stats['total'],
-            'buck_count': stats['buck_count'],
-            'doe_count': stats['doe_count']
-        })
-    
-    return temp_stats 
\ No newline at end of file
@@ -0,0 +1,181 @@
+from collections import namedtuple
+from datetime import datetime
+from django.utils import timezone
+from PIL import Image, ExifTags
+from .storage_utils import read_header, read_range
+
+# Typed result of EXIF extraction, with the values stored on MediaFile
+ExifRecord = namedtuple('ExifRecord', [
+    'capture_date',
+    'camera_make',
+    'camera_model',
+    'exposure_time',
+    'f_number',
+    'iso_speed',
+    'focal_length',
+])
+
+# MediaFile fields written from an ExifRecord
+EXIF_FIELDS = list(ExifRecord._fields) + ['has_exif']
+
+JPEG_SOI = b'\xff\xd8'
+EXIF_HEADER = b'Exif\x00\x00'
+APP1 = 0xE1
+# Markers that end the header segments (start of scan, end of image)
+END_MARKERS = (0xDA, 0xD9)
+# Markers without a length field
+STANDALONE_MARKERS = {0x01, 0xD8, *range(0xD0, 0xD8)}
+
+# First read; EXIF APP1 segments are at most 64 KB and usually come first
+EXIF_READ_SIZE = 64 * 1024
+
+def find_exif_block(header, read_more):
+    """
+    Locate and return the EXIF APP1 payload of a JPEG without decoding it.
+
+    Only segment headers are walked; ``read_more(start, length)`` is called
+    when a segment extends past the bytes read so far.
+
+    Args:
+        header (bytes): The first bytes of the file
+        read_more (callable): Reads more bytes of the file
+
+    Returns:
+        bytes: The TIFF-formatted EXIF data, or None
+    """
+    data = header
+    if not data.startswith(JPEG_SOI):
+        return None
+
+    def ensure(end):
+        nonlocal data
+        if end > len(data):
+            # Read ahead so walking many small segments stays one request
+            data += read_more(len(data), max(end - len(data), EXIF_READ_SIZE))
+        return end <= len(data)
+
+    pos = 2
+    while ensure(pos + 4):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker in STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker in END_MARKERS:
+            return None
+
+        length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+        if marker == APP1 and ensure(pos + 10) and data[pos + 4:pos + 10] == EXIF_HEADER:
+            end = pos + 2 + length
+            return data[pos + 10:end] if ensure(end) else None
+        pos += 2 + length
+    return None
+
+def ratio(value):
+    """(numerator, denominator) of an EXIF rational, tuple or number."""
+    if isinstance(value, tuple):
+        return value[0], value[1]
+    if hasattr(value, 'numerator') and hasattr(value, 'denominator'):
+        return value.numerator, value.denominator
+    return value, 1
+
+def text(value, max_length):
+    if isinstance(value, bytes):
+        value = value.decode('ascii', 'ignore')
+    return str(value).strip('\x00 ')[:max_length] if value is not None else ''
+
+def parse_exif(block):
+    """Build an ExifRecord from TIFF-formatted EXIF data."""
+    exif = Image.Exif()
+    exif.load(block)
+    tags = {**dict(exif), **exif.get_ifd(ExifTags.IFD.Exif)}
+    Base = ExifTags.Base
+
+    capture_date = None
+    if Base.DateTimeOriginal in tags:
+        try:
+            # EXIF DateTime format: 'YYYY:MM:DD HH:MM:SS'
+            capture_date = timezone.make_aware(datetime.strptime(
+                text(tags[Base.DateTimeOriginal], 19),
+                '%Y:%m:%d %H:%M:%S'
+            ))
+        except (ValueError, TypeError):
+            pass
+
+    exposure_time = ''
+    if Base.ExposureTime in tags:
+        numerator, denominator = ratio(tags[Base.ExposureTime])
+        exposure_time = f"{numerator}/{denominator}"
+
+    f_number = ''
+    if Base.FNumber in tags:
+        numerator, denominator = ratio(tags[Base.FNumber])
+        if denominator:
+            f_number = f"f/{numerator/denominator:.1f}"
+
+    focal_length = ''
+    if Base.FocalLength in tags:
+        numerator, denominator = ratio(tags[Base.FocalLength])
+        if denominator:
+            focal_length = f"{numerator/denominator:.1f}mm"
+
+    return ExifRecord(
+        capture_date=capture_date,
+        camera_make=text(tags.get(Base.Make), 100),
+        camera_model=text(tags.get(Base.Model), 100),
+        exposure_time=exposure_time,
+        f_number=f_number,
+        iso_speed=text(tags.get(Base.ISOSpeedRatings), 50),
+        focal_length=focal_length,
+    )
+
+def read_exif(header, read_more):
+    """ExifRecord from a JPEG header, or None if there is no (valid) EXIF."""
+    try:
+        block = find_exif_block(header, read_more)
+        return parse_exif(block) if block else None
+    except Exception as e:
+        print(f"Error extracting EXIF data: {e}")
+        return None
+
+def read_file_exif(f):
+    """ExifRecord of an open binary file (such as an upload); rewinds the file."""
+    def read_more(start, length):
+        f.seek(start)
+        return f.read(length)
+
+    try:
+        f.seek(0)
+        return read_exif(f.read(EXIF_READ_SIZE), read_more)
+    finally:
+        f.seek(0)
+
+def read_media_exif(name, storage=None):
+    """ExifRecord of a stored media file, fetching only its header."""
+    try:
+        header = read_header(name, EXIF_READ_SIZE, storage)
+    except Exception as e:
+        print(f"Error reading media file header: {e}")
+        return None
+    return read_exif(header, lambda start, length: read_range(name, start, length, storage))
+
+def apply_exif(media_file, record, keep_capture_date=False):
+    """
+    Copy an ExifRecord onto a MediaFile without saving it.
+
+    Args:
+        media_file (MediaFile): File to update
+        record (ExifRecord): Extracted EXIF data
+        keep_capture_date (bool): Keep a capture date that is already set
+                          (a manual date entered at upload)
+    """
+    for field, value in record._asdict().items():
+        if field == 'capture_date' and (value is None or (keep_capture_date and media_file.capture_date)):
+            continue
+        setattr(media_file, field, value)
+    media_file.has_exif = True
@@ -0,0 +1,134 @@
+import hashlib
+import logging
+from django.db import transaction
+from django.utils import timezone
+from .models import MediaFile, Tag, media_file_type, HASH_CHUNK_SIZE
+from .jobs import enqueue_enrichment
+from .rollup_utils import cells_for, schedule_rollup_refresh, record_camera_uploads
+from .cache_utils import CAMERA_MAP, schedule_invalidation
+from .utils import compute_image_hash, read_image_size, resolve_duplicates, resolve_bursts
+from .exif_utils import apply_exif, read_file_exif
+from .search_utils import build_search_document
+from .purge_utils import delete_objects
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT statement when creating media files and tag links
+BULK_BATCH_SIZE = 500
+
+def hash_upload(upload):
+    """
+    SHA-256 of an uploaded file.
+
+    Uploads that came through the hashing upload handlers already carry
+    their digest; anything else is read once in large chunks.
+    """
+    if getattr(upload, 'sha256', None):
+        return upload.sha256
+    
+    sha256_hash = hashlib.sha256()
+    for chunk in upload.chunks(chunk_size=HASH_CHUNK_SIZE):
+        sha256_hash.update(chunk)
+    upload.seek(0)
+    return sha256_hash.hexdigest()
+
+def build_media_file(upload, camera, description='', capture_date=None):
+    """Store an uploaded file and return an unsaved MediaFile for it."""
+    media_file = MediaFile(
+        camera=camera,
+        description=description,
+        capture_date=capture_date,
+        upload_date=timezone.now(),
+        file_type=media_file_type(upload.name)
+    )
+    media_file.file_hash = hash_upload(upload)
+    media_file.file_size = upload.size
+    if media_file.file_type == 'image':
+        media_file.width, media_file.height = read_image_size(upload)
+        media_file.perceptual_hash = compute_image_hash(upload)
+    # EXIF comes from the upload header and is written with the row
+    # (a manual capture date overrides the EXIF one)
+    record = read_file_exif(upload)
+    if record:
+        apply_exif(media_file, record, keep_capture_date=True)
+    upload.seek(0)
+    # Writes to storage without saving the model
+    media_file.file.save(upload.name, upload, save=False)
+    return media_file
+
+def ingest_media_files(uploads, camera, description='', tags=(), capture_date=None):
+    """
+    Ingest a batch of uploaded files without per-file ``save()`` cascades.
+    
+    Files are hashed and stored as they are read, the rows are written with
+    one ``bulk_create``, the tag links with another, and duplicates and
+    bursts are resolved as set-based passes over the whole batch. EXIF is
+    read from the upload headers before the insert; weather, renditions and
+    classification are queued as background jobs. If anything fails, the
+    files already stored are deleted again.
+    
+    Args:
+        uploads (iterable[UploadedFile]): The uploaded files
+        camera (Camera): Camera the files came from
+        description (str): Description applied to every file
+        tags (iterable[Tag]): Tags applied to every file
+        capture_date (datetime, optional): Capture date overriding EXIF data
+    
+    Returns:
+        list[MediaFile]: The created media files
+    """
+    media_files = []
+    try:
+        for upload in uploads:
+            media_files.append(build_media_file(upload, camera, description, capture_date))
+        if not media_files:
+            return []
+        insert_media_files(media_files, camera, description, tags)
+    except Exception:
+        # No row points at the stored files, so they must not outlive the batch
+        discard_stored_files(media_files)
+        raise
+    return media_files
+
+def discard_stored_files(media_files):
+    """Delete the stored files of media files whose rows were never written."""
+    errors = delete_objects([media_file.file.name for media_file in media_files if media_file.file])
+    for name, error in errors.items():
+        logger.error(f"Could not delete orphaned upload {name}: {error}")
+
+def insert_media_files(media_files, camera, description, tags):
+    """Write the rows and tag links of a built batch in one transaction."""
+    # Every file of the batch shares the camera, description and tags
+    search_document = build_search_document(camera.name, description, [tag.name for tag in tags])
+    for media_file in media_files:
+        media_file.search_document = search_document
+    
+    with transaction.atomic():
+        MediaFile.objects.bulk_create(media_files, batch_size=BULK_BATCH_SIZE)
+        
+        TagLink = MediaFile.tags.through
+        TagLink.objects.bulk_create(
+            [
+                TagLink(mediafile_id=media_file.id, tag_id=tag.id)
+                for media_file in media_files
+                for tag in tags
+            ],
+            batch_size=BULK_BATCH_SIZE
+        )
+        
+        resolve_duplicates(media_files)
+        resolve_bursts(media_files)
+        
+        # bulk_create sends no signals, so update the dashboard rollups here
+        schedule_rollup_refresh(cells_for(media_files))
+        record_camera_uploads(camera.id, media_files)
+        schedule_invalidation(CAMERA_MAP)
+        transaction.on_commit(lambda: enqueue_enrichment(media_files))
+
+def get_or_create_tags(tag_names):
+    """Return Tag objects for the given names, creating missing ones."""
+    tags = []
+    for tag_name in tag_names:
+        tag, created = Tag.objects.get_or_create(name=tag_name.lower())
+        tags.append(tag)
+    return tags
@@ -0,0 +1,237 @@
+import logging
+import os
+import socket
+import threading
+import traceback
+from collections import namedtuple
+from datetime import timedelta
+from uuid import uuid4
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JobHandler = namedtuple('JobHandler', ['func', 'concurrency', 'max_attempts'])
+
+# Registered handlers by job name
+_handlers = {}
+
+# Retry backoff: 30s, 1m, 2m, ... capped at one hour
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=1)
+
+def job(name, concurrency=None, max_attempts=5):
+    """
+    Register a function as the handler for a named job.
+
+    Args:
+        name (str): Job name used when enqueueing
+        concurrency (int, optional): Maximum number of jobs with this name
+                    running at once across all workers. None means unlimited.
+        max_attempts (int): Attempts before the job is marked as failed
+    """
+    def decorator(func):
+        _handlers[name] = JobHandler(func, concurrency, max_attempts)
+        return func
+    return decorator
+
+def get_handler(name):
+    return _handlers.get(name)
+
+def enqueue(name, delay=None, **payload):
+    """Add a single job to the queue and return it."""
+    return enqueue_many(name, [payload], delay=delay)[0]
+
+def enqueue_many(name, payloads, delay=None):
+    """Add one job per payload to the queue with a single INSERT."""
+    handler = get_handler(name)
+    run_after = timezone.now() + (delay or timedelta())
+    return Job.objects.bulk_create([
+        Job(
+            name=name,
+            payload=payload,
+            max_attempts=handler.max_attempts if handler else 5,
+            run_after=run_after
+        )
+        for payload in payloads
+    ])
+
+def enqueue_enrichment(media_files):
+    """Queue the configured enrichment stages for a batch of media files.
+
+    One job per stage covers the whole batch so handlers can work in bulk.
+    """
+    media_file_ids = [media_file.id for media_file in media_files]
+    if not media_file_ids:
+        return []
+    return [
+        enqueue(stage, media_file_ids=media_file_ids)
+        for stage in settings.ENRICHMENT_JOBS
+    ]
+
+def make_worker_id():
+    """Unique identifier for a worker process, used to lock claimed jobs."""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}'
+
+def heartbeat_interval():
+    """Seconds between lock refreshes, well inside JOB_LOCK_TIMEOUT."""
+    return settings.JOB_LOCK_TIMEOUT / 4
+
+def heartbeat(worker_id):
+    """
+    Refresh the locks of the jobs a live worker is running.
+
+    Returns:
+        int: Number of running jobs refreshed
+    """
+    return Job.objects.filter(status=Job.STATUS_RUNNING, locked_by=worker_id).update(
+        locked_at=timezone.now()
+    )
+
+def release_stale_jobs(timeout=None):
+    """
+    Put jobs locked by a worker that died back on the queue.
+
+    Live workers refresh ``locked_at`` every ``heartbeat_interval()``, so
+    only the jobs of workers that stopped doing so for ``timeout`` are
+    released, however long a job runs.
+    """
+    timeout = timeout or timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return Job.objects.filter(
+        status=Job.STATUS_RUNNING,
+        locked_at__lt=timezone.now() - timeout
+    ).update(status=Job.STATUS_PENDING, locked_by='', locked_at=None)
+
+def claim_jobs(worker_id, limit, names=None):
+    """
+    Atomically claim up to ``limit`` due jobs for a worker.
+
+    Per-handler concurrency limits are applied against the jobs already
+    running across all workers. The conditional UPDATE means two workers
+    can never claim the same job, even on databases without row locks.
+
+    Returns:
+        list[Job]: The claimed jobs, now marked as running
+    """
+    if limit <= 0:
+        return []
+
+    now = timezone.now()
+    with transaction.atomic():
+        running = dict(
+            Job.objects
+            .filter(status=Job.STATUS_RUNNING)
+            .values_list('name')
+            .annotate(count=Count('id'))
+        )
+
+        due = Job.objects.filter(status=Job.STATUS_PENDING, run_after__lte=now)
+        if names:
+            due = due.filter(name__in=names)
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+
+        job_ids = []
+        for job_id, name in due.values_list('id', 'name')[:limit * 4]:
+            handler = get_handler(name)
+            if handler and handler.concurrency is not None:
+                if running.get(name, 0) >= handler.concurrency:
+                    continue
+            running[name] = running.get(name, 0) + 1
+            job_ids.append(job_id)
+            if len(job_ids) >= limit:
+                break
+
+        if not job_ids:
+            return []
+
+        Job.objects.filter(id__in=job_ids, status=Job.STATUS_PENDING).update(
+            status=Job.STATUS_RUNNING,
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1
+        )
+
+    return list(Job.objects.filter(
+        id__in=job_ids,
+        status=Job.STATUS_RUNNING,
+        locked_by=worker_id
+    ))
+
+def retry_delay(attempts):
+    """Exponential backoff delay before the next attempt."""
+    return min(RETRY_BASE_DELAY * (2 ** max(attempts - 1, 0)), RETRY_MAX_DELAY)
+
+def run_job(job):
+    """
+    Run a claimed job and record the outcome.
+
+    Successful jobs are deleted. Failed jobs are retried with exponential
+    backoff until ``max_attempts`` is reached, then kept as failed.
+
+    Returns:
+        bool: True if the job succeeded
+    """
+    handler = get_handler(job.name)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job "{job.name}"')
+        handler.func(**job.payload)
+    except Exception as e:
+        logger.error(f'Job {job} failed (attempt {job.attempts}): {str(e)}')
+        job.last_error = traceback.format_exc()
+        job.locked_by = ''
+        job.locked_at = None
+        if handler is not None and job.attempts < job.max_attempts:
+            job.status = Job.STATUS_PENDING
+            job.run_after = timezone.now() + retry_delay(job.attempts)
+        else:
+            job.status = Job.STATUS_FAILED
+        job.save(update_fields=[
+            'status', 'run_after', 'last_error', 'locked_by', 'locked_at', 'updated_at'
+        ])
+        return False
+
+    job.delete()
+    return True
+
+def run_job_in_thread(job):
+    """Run a job from a worker thread, closing the thread's DB connection."""
+    try:
+        return run_job(job)
+    finally:
+        connection.close()
+
+class Worker:
+    """Polls the queue and runs jobs on a pool of threads."""
+
+    def __init__(self, concurrency=2, names=None):
+        self.concurrency = concurrency
+        self.names = names
+        self.worker_id = make_worker_id()
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def free_slots(self):
+        with self.lock:
+            return self.concurrency - self.active
+
+    def _finish(self, future):
+        with self.lock:
+            self.active -= 1
+
+    def heartbeat(self):
+        """Keep the jobs this worker is running from being released as stale."""
+        return heartbeat(self.worker_id)
+
+    def run_once(self, executor):
+        """Claim as many jobs as there are free threads and start them."""
+        jobs = claim_jobs(self.worker_id, self.free_slots(), self.names)
+        for claimed in jobs:
+            with self.lock:
+                self.active += 1
+            executor.submit(run_job_in_thread, claimed).add_done_callback(self._finish)
+        return len(jobs)
@@ -0,0 +1,141 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from core.models import MediaFile, Checkpoint
+from core.storage_utils import open_media, read_header
+from core.utils import read_image_size
+import io
+import time
+
+METADATA_FIELDS = ['file_size', 'width', 'height']
+
+def read_metadata(media_file):
+    """
+    (file_size, width, height) of a stored media file.
+
+    The size is one stat (a HEAD request on S3) and the dimensions are
+    parsed from the file header; the whole file is only fetched when the
+    header is too short to hold the image size.
+    """
+    name = media_file.file.name
+    try:
+        file_size = default_storage.size(name)
+    except Exception as e:
+        print(f"Error reading size of {name}: {e}")
+        return None, None, None
+
+    width = height = None
+    if media_file.file_type == 'image':
+        try:
+            width, height = read_image_size(io.BytesIO(read_header(name)))
+            if width is None:
+                with open_media(name) as f:
+                    width, height = read_image_size(f)
+        except Exception as e:
+            print(f"Error reading dimensions of {name}: {e}")
+    return file_size, width, height
+
+class Command(BaseCommand):
+    help = 'Store the size and dimensions of media files uploaded before they were recorded at ingest'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--camera',
+            type=str,
+            help='Process files only from a specific camera (by name)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes'
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Restart from the beginning instead of resuming'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.MEDIA_PREFETCH_WORKERS,
+            help='Number of files read concurrently'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of files read and written per batch'
+        )
+
+    def handle(self, *args, **options):
+        # Get queryset based on options
+        queryset = MediaFile.objects.filter(file_size__isnull=True)
+        if options['camera']:
+            queryset = queryset.filter(camera__name=options['camera'])
+
+        checkpoint_name = f"backfill_file_metadata:{options['camera'] or '*'}"
+        if options['reset'] and not options['dry_run']:
+            Checkpoint.reset(checkpoint_name)
+
+        last_id = 0 if options['dry_run'] else Checkpoint.get_last_id(checkpoint_name)
+        if last_id:
+            self.stdout.write(f'Resuming after media file {last_id}')
+
+        queryset = queryset.filter(id__gt=last_id).order_by('id')
+        total = queryset.count()
+        self.stdout.write(f'Processing {total} files...')
+
+        processed = 0
+        updated = 0
+        start_time = time.time()
+
+        # Storage reads are I/O bound, so threads are enough
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                media_files = list(
+                    queryset
+                    .filter(id__gt=last_id)
+                    .only('id', 'file', 'file_type')
+                    [:options['batch_size']]
+                )
+                if not media_files:
+                    break
+                last_id = media_files[-1].id
+
+                changed = []
+                for media_file, metadata in zip(media_files, executor.map(read_metadata, media_files)):
+                    if metadata[0] is None:
+                        continue
+                    media_file.file_size, media_file.width, media_file.height = metadata
+                    changed.append(media_file)
+                updated += len(changed)
+                processed += len(media_files)
+
+                if options['dry_run']:
+                    for media_file in changed:
+                        self.stdout.write(
+                            f'Would set media file {media_file.id} to {media_file.file_size} bytes '
+                            f'({media_file.width}x{media_file.height})'
+                        )
+                else:
+                    MediaFile.objects.bulk_update(changed, METADATA_FIELDS)
+                    Checkpoint.set_last_id(checkpoint_name, last_id)
+
+                elapsed = time.time() - start_time
+                self.stdout.write(
+                    f'Processed {processed}/{total} files '
+                    f'({processed / max(elapsed, 0.001):.1f} files/sec)...'
+                )
+
+        elapsed = time.time() - start_time
+
+        # Print summary
+        self.stdout.write(self.style.SUCCESS(
+            f'\nProcessed {processed} files in {elapsed:.1f} seconds '
+            f'({processed / max(elapsed, 0.001):.1f} files/sec)'
+        ))
+        if not options['dry_run']:
+            self.stdout.write(f'Stored size and dimensions of {updated} files')
+        else:
+            self.stdout.write('Dry run completed - no changes made')
@@ -0,0 +1,193 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core.models import MediaFile, Tag, Checkpoint
+from core.rollup_utils import cells_for, refresh_rollups, rebuild_rollups
+from core.search_utils import refresh_search_documents
+from core.storage_utils import prefetch
+import multiprocessing
+import os
+import time
+
+CLASS_LABELS = ['buck', 'doe']
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Classifier owned by each worker process (one interpreter per process)
+_classifier = None
+
+def init_worker(batch_size):
+    global _classifier
+    from core.ai_classifier import DeerClassifier
+    _classifier = DeerClassifier(batch_size=batch_size)
+
+def classify_shard(shard):
+    """Classify a shard of ``(id, file name)`` pairs in a worker process.
+
+    Files are fetched through the storage API, so remote storage works too.
+    Returns ``(id, label, confidence)`` for every image, with ``label`` None
+    when no prediction clears the confidence threshold.
+    """
+    media_ids, names = zip(*shard)
+    images = [image for _, image in prefetch(names)]
+    try:
+        all_predictions = _classifier.predict_batch(images)
+    finally:
+        for image in images:
+            if image is not None:
+                image.close()
+    results = []
+    for media_id, predictions in zip(media_ids, all_predictions):
+        label, confidence = _classifier.get_best_prediction(predictions)
+        results.append((media_id, label, confidence))
+    return results
+
+class Command(BaseCommand):
+    help = 'Classify existing media files as buck or doe using a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--camera',
+            type=str,
+            help='Process files only from a specific camera (by name)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes'
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Remove existing buck/doe tags and restart from the beginning'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=64,
+            help='Number of images per inference batch'
+        )
+
+    def handle(self, *args, **options):
+        # Get queryset based on options
+        queryset = MediaFile.objects.all()
+        if options['camera']:
+            queryset = queryset.filter(camera__name=options['camera'])
+
+        checkpoint_name = f"classify_media:{options['camera'] or '*'}"
+
+        # Reset if requested
+        if options['reset']:
+            if options['dry_run']:
+                self.stdout.write('Would remove buck/doe tags and reset the checkpoint')
+            else:
+                self.stdout.write('Removing buck/doe tags and resetting the checkpoint...')
+                links = MediaFile.tags.through.objects.filter(
+                    mediafile__in=queryset,
+                    tag__name__in=CLASS_LABELS
+                )
+                untagged_ids = list(links.values_list('mediafile_id', flat=True).distinct())
+                links.delete()
+                Checkpoint.reset(checkpoint_name)
+                # Queryset deletes send no m2m_changed, so rebuild the rollups
+                # and the search documents of the untagged files
+                for camera_id in queryset.order_by().values_list('camera_id', flat=True).distinct():
+                    rebuild_rollups(camera_id)
+                refresh_search_documents(MediaFile.objects.filter(id__in=untagged_ids))
+
+        last_id = 0 if options['dry_run'] else Checkpoint.get_last_id(checkpoint_name)
+        if last_id:
+            self.stdout.write(f'Resuming after media file {last_id}')
+
+        queryset = queryset.filter(id__gt=last_id).order_by('id')
+        if not options['reset']:
+            # Files already tagged buck/doe are skipped (reset removes those tags)
+            queryset = queryset.exclude(tags__name__in=CLASS_LABELS)
+        total = queryset.count()
+        self.stdout.write(f'Processing {total} files...')
+
+        tags = {
+            label: Tag.objects.get_or_create(name=label)[0]
+            for label in CLASS_LABELS
+        }
+        TagLink = MediaFile.tags.through
+
+        batch_size = options['batch_size']
+        workers = options['workers']
+        chunk_size = batch_size * workers * 4
+
+        processed = 0
+        tagged = 0
+        start_time = time.time()
+
+        # Worker processes are forked, so they must not share our DB connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(workers, initializer=init_worker, initargs=(batch_size,)) as pool:
+            while True:
+                rows = list(queryset.filter(id__gt=last_id).values_list('id', 'file')[:chunk_size])
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+
+                images = [
+                    (media_id, name)
+                    for media_id, name in rows
+                    if name.lower().endswith(IMAGE_EXTENSIONS)
+                ]
+                shards = [
+                    images[i:i + batch_size]
+                    for i in range(0, len(images), batch_size)
+                ]
+
+                # Results come back in order, so the checkpoint only moves forward
+                for results in pool.imap(classify_shard, shards):
+                    links = [
+                        TagLink(mediafile_id=media_id, tag_id=tags[label].id)
+                        for media_id, label, confidence in results
+                        if label
+                    ]
+                    tagged += len(links)
+                    processed += len(results)
+
+                    if options['dry_run']:
+                        for media_id, label, confidence in results:
+                            if label:
+                                self.stdout.write(
+                                    f'Would tag media file {media_id} as {label} ({confidence:.2f})'
+                                )
+                    else:
+                        TagLink.objects.bulk_create(links, ignore_conflicts=True)
+                        # bulk_create sends no m2m_changed, so refresh the rollups
+                        # and search documents here
+                        tagged_files = MediaFile.objects.filter(id__in=[link.mediafile_id for link in links])
+                        refresh_rollups(cells_for(tagged_files.only('camera_id', 'upload_date')))
+                        refresh_search_documents(tagged_files)
+                        Checkpoint.set_last_id(checkpoint_name, results[-1][0])
+
+                # Skipped non-image rows count as processed for the checkpoint
+                processed += len(rows) - len(images)
+                if not options['dry_run']:
+                    Checkpoint.set_last_id(checkpoint_name, last_id)
+
+                elapsed = time.time() - start_time
+                self.stdout.write(
+                    f'Processed {processed}/{total} files '
+                    f'({processed / max(elapsed, 0.001):.1f} images/sec)...'
+                )
+
+        elapsed = time.time() - start_time
+
+        # Print summary
+        self.stdout.write(self.style.SUCCESS(
+            f'\nProcessed {processed} files in {elapsed:.1f} seconds '
+            f'({processed / max(elapsed, 0.001):.1f} images/sec)'
+        ))
+        if not options['dry_run']:
+            self.stdout.write(f'Tagged {tagged} files')
+        else:
+            self.stdout.write('Dry run completed - no changes made')
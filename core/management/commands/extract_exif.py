@@ -0,0 +1,158 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core.models import MediaFile, Checkpoint
+from core.exif_utils import EXIF_FIELDS, apply_exif, read_media_exif
+from core.utils import resolve_bursts
+import multiprocessing
+import os
+import time
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg')
+
+def extract_shard(names):
+    """Read the EXIF headers of a shard of stored files in a worker process."""
+    return [read_media_exif(name) for name in names]
+
+class Command(BaseCommand):
+    help = 'Extract EXIF data from existing media files using a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--camera',
+            type=str,
+            help='Process files only from a specific camera (by name)'
+        )
+        parser.add_argument(
+            '--directory',
+            type=str,
+            help='Process files only under a storage directory (e.g. media/2024/05)'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Re-extract files that already have EXIF data, replacing their capture dates'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes'
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Restart from the beginning instead of resuming'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of files read and written per batch'
+        )
+
+    def handle(self, *args, **options):
+        # Get queryset based on options
+        queryset = MediaFile.objects.all()
+        if options['camera']:
+            queryset = queryset.filter(camera__name=options['camera'])
+        if options['directory']:
+            queryset = queryset.filter(file__startswith=options['directory'].rstrip('/') + '/')
+        if not options['all']:
+            queryset = queryset.filter(has_exif=False)
+
+        checkpoint_name = (
+            f"extract_exif:{options['camera'] or '*'}:{options['directory'] or '*'}"
+            f":{'all' if options['all'] else 'missing'}"
+        )
+        if options['reset'] and not options['dry_run']:
+            Checkpoint.reset(checkpoint_name)
+
+        last_id = 0 if options['dry_run'] else Checkpoint.get_last_id(checkpoint_name)
+        if last_id:
+            self.stdout.write(f'Resuming after media file {last_id}')
+
+        queryset = queryset.filter(id__gt=last_id).order_by('id')
+        total = queryset.count()
+        self.stdout.write(f'Processing {total} files...')
+
+        batch_size = options['batch_size']
+        workers = options['workers']
+        shard_size = max(batch_size // workers, 1)
+
+        processed = 0
+        extracted = 0
+        start_time = time.time()
+
+        # Worker processes are forked, so they must not share our DB connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(workers) as pool:
+            while True:
+                media_files = list(
+                    queryset
+                    .filter(id__gt=last_id)
+                    .only('id', 'file', 'camera_id', 'capture_date', 'burst_group', 'burst_sequence')
+                    [:batch_size]
+                )
+                if not media_files:
+                    break
+                last_id = media_files[-1].id
+
+                images = [
+                    media_file for media_file in media_files
+                    if media_file.file.name.lower().endswith(IMAGE_EXTENSIONS)
+                ]
+                names = [media_file.file.name for media_file in images]
+                shards = [
+                    names[i:i + shard_size]
+                    for i in range(0, len(names), shard_size)
+                ]
+                records = [
+                    record
+                    for shard_records in pool.map(extract_shard, shards)
+                    for record in shard_records
+                ]
+
+                changed = []
+                for media_file, record in zip(images, records):
+                    if record:
+                        # Files without EXIF applied keep a manual capture date
+                        apply_exif(media_file, record, keep_capture_date=not options['all'])
+                        changed.append(media_file)
+                extracted += len(changed)
+                processed += len(media_files)
+
+                if options['dry_run']:
+                    for media_file in changed:
+                        self.stdout.write(
+                            f'Would set EXIF for media file {media_file.id} '
+                            f'(captured {media_file.capture_date})'
+                        )
+                else:
+                    MediaFile.objects.bulk_update(changed, EXIF_FIELDS)
+                    # Capture dates changed, so regroup the affected bursts
+                    resolve_bursts(changed)
+                    Checkpoint.set_last_id(checkpoint_name, last_id)
+
+                elapsed = time.time() - start_time
+                self.stdout.write(
+                    f'Processed {processed}/{total} files '
+                    f'({processed / max(elapsed, 0.001):.1f} files/sec)...'
+                )
+
+        elapsed = time.time() - start_time
+
+        # Print summary
+        self.stdout.write(self.style.SUCCESS(
+            f'\nProcessed {processed} files in {elapsed:.1f} seconds '
+            f'({processed / max(elapsed, 0.001):.1f} files/sec)'
+        ))
+        if not options['dry_run']:
+            self.stdout.write(f'Extracted EXIF data from {extracted} files')
+        else:
+            self.stdout.write('Dry run completed - no changes made')
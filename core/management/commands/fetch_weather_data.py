@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from core.models import MediaFile
-from core.weather_utils import fetch_weather_for_media
+from core.models import MediaFile, WeatherData
+from core.rollup_utils import cells_for, schedule_rollup_refresh
+from core.weather_utils import fetch_weather_for_batch
 from datetime import datetime
 import time
 
@@ -35,6 +36,12 @@ class Command(BaseCommand):
             default=100,
             help='Number of files to process in each batch'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.WEATHER_FETCH_WORKERS,
+            help='Number of weather lookups made concurrently (the rate limit still applies)'
+        )
 
     def handle(self, *args, **options):
         # Build queryset based on filters
@@ -62,10 +69,10 @@ class Command(BaseCommand):
         # If reset option is used, clear existing weather data
         if options['reset']:
             self.stdout.write('Clearing existing weather data...')
-            queryset.filter(weather_data__isnull=False).delete()
-        else:
-            # Only process files without weather data
-            queryset = queryset.filter(weather_data__isnull=True)
+            WeatherData.objects.filter(media_file__in=queryset).delete()
+        
+        # Only process files without weather data
+        queryset = queryset.filter(weather_data__isnull=True).order_by('id')
         
         total_count = queryset.count()
         if total_count == 0:
@@ -75,25 +82,30 @@ class Command(BaseCommand):
         self.stdout.write(f'Processing {total_count} media files...')
         processed = 0
         success = 0
-        batch_size = options['batch_size']
+        last_id = 0
+        start_time = time.time()
         
-        # Process in batches
-        for i in range(0, total_count, batch_size):
-            batch = queryset[i:i + batch_size]
-            with transaction.atomic():
-                for media_file in batch:
-                    processed += 1
-                    if fetch_weather_for_media(media_file):
-                        success += 1
-                    
-                    # Show progress
-                    if processed % 10 == 0:
-                        self.stdout.write(f'Processed {processed}/{total_count} files...')
-                    
-                    # Small delay to avoid API rate limits
-                    time.sleep(0.1)
+        # Files leave the queryset as their weather is saved, so batches are
+        # taken by id; each one is fetched concurrently and saved in bulk
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            
+            created = fetch_weather_for_batch(batch, workers=options['workers'])
+            # Weather is bulk created without signals
+            schedule_rollup_refresh(cells_for(batch))
+            processed += len(batch)
+            success += len(created)
+            
+            elapsed = time.time() - start_time
+            self.stdout.write(
+                f'Processed {processed}/{total_count} files '
+                f'({processed / max(elapsed, 0.001):.1f} files/sec)...'
+            )
         
         self.stdout.write(self.style.SUCCESS(
             f'Finished processing {processed} files. '
             f'Successfully fetched weather data for {success} files.'
-        )) 
\ No newline at end of file
+        ))
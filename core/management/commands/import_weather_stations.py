@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.weather_stations import build_station_archive
+import time
+
+class Command(BaseCommand):
+    help = 'Build the offline weather station archive from a CSV or Parquet export of station observations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'source',
+            type=str,
+            help='CSV or Parquet file of station observations (Parquet needs pyarrow)'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=settings.WEATHER_STATION_DIR,
+            help='Archive directory (defaults to WEATHER_STATION_DIR)'
+        )
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+        self.stdout.write(f"Importing weather stations from {options['source']}...")
+
+        try:
+            stations, observations = build_station_archive(options['source'], options['output'])
+        except (OSError, ImportError, KeyError, ValueError) as e:
+            raise CommandError(f'Could not import weather stations: {e}')
+
+        elapsed = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {observations} observations from {stations} stations "
+            f"into {options['output']} in {elapsed:.1f} seconds"
+        ))
+        self.stdout.write(
+            'Set WEATHER_PROVIDER=core.weather_stations.StationWeatherProvider to use it'
+        )
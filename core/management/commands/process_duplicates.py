@@ -1,11 +1,90 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
-from core.models import MediaFile
-from core.utils import check_duplicates, check_burst
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from core.models import MediaFile, HASH_CHUNK_SIZE
+from core.storage_utils import prefetch
+from core.utils import (
+    compute_image_hash,
+    invalidate_hash_index,
+    rebuild_bursts,
+    resolve_bursts,
+    resolve_camera_duplicates
+)
+import hashlib
+import multiprocessing
+import os
 import time
 
+def backfill_hashes(queryset, dry_run=False):
+    """
+    Compute missing SHA-256 and perceptual hashes, reading each file once.
+
+    Only images get a perceptual hash, so videos are read again only while
+    their SHA-256 is missing.
+    """
+    media_files = list(
+        queryset
+        .filter(Q(file_hash='') | Q(file_type='image', perceptual_hash__isnull=True))
+        .only('id', 'file', 'file_type', 'file_hash', 'perceptual_hash')
+    )
+    if dry_run:
+        return len(media_files)
+
+    by_name = {media_file.file.name: media_file for media_file in media_files}
+    new_perceptual_hashes = 0
+    for name, f in prefetch(by_name):
+        if f is None:
+            continue
+        media_file = by_name[name]
+        with f:
+            if not media_file.file_hash:
+                sha256_hash = hashlib.sha256()
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                    sha256_hash.update(chunk)
+                media_file.file_hash = sha256_hash.hexdigest()
+                f.seek(0)
+            if media_file.file_type == 'image' and media_file.perceptual_hash is None:
+                media_file.perceptual_hash = compute_image_hash(f)
+                new_perceptual_hashes += media_file.perceptual_hash is not None
+
+    MediaFile.objects.bulk_update(media_files, ['file_hash', 'perceptual_hash'], batch_size=1000)
+    if new_perceptual_hashes:
+        # Long-lived processes only pick up hashes of new rows by themselves
+        invalidate_hash_index()
+    return len(media_files)
+
+def process_camera(task):
+    """Resolve the duplicates and bursts of one camera in a worker process."""
+    camera_id, since, reset, dry_run = task
+    start_time = time.time()
+
+    scope = MediaFile.objects.filter(camera_id=camera_id)
+    if since:
+        scope = scope.filter(upload_date__gte=since)
+    hashed = backfill_hashes(scope, dry_run)
+
+    duplicates = resolve_camera_duplicates(camera_id, since, reset, save=not dry_run)
+
+    # Full segmentation, unless only recent uploads are being processed
+    if since and not reset:
+        photos = list(scope.only('id', 'camera_id', 'capture_date', 'burst_group', 'burst_sequence'))
+        bursts = [] if dry_run else resolve_bursts(photos)
+    else:
+        bursts = rebuild_bursts(camera_id, save=not dry_run)
+
+    return {
+        'camera_id': camera_id,
+        'files': scope.count(),
+        'hashed': hashed,
+        'duplicates': sum(1 for media_file in duplicates if media_file.is_duplicate),
+        'bursts': len(bursts),
+        'elapsed': time.time() - start_time,
+    }
+
 class Command(BaseCommand):
-    help = 'Process existing media files to detect duplicates and burst sequences'
+    help = 'Process existing media files to detect duplicates and burst sequences, one camera per worker'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -21,82 +100,99 @@ class Command(BaseCommand):
         parser.add_argument(
             '--reset',
             action='store_true',
-            help='Reset existing duplicate and burst information before processing'
+            help='Recompute existing duplicate and burst information'
+        )
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Only process files uploaded on or after this date (YYYY-MM-DD or ISO datetime)'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes (each handles one camera at a time)'
+        )
+
+    def parse_since(self, value):
+        since = parse_datetime(value)
+        if since is None:
+            date = parse_date(value)
+            if date is None:
+                raise CommandError(f'Invalid --since value: {value}')
+            since = timezone.datetime.combine(date, timezone.datetime.min.time())
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
 
     def handle(self, *args, **options):
         # Get queryset based on options
         queryset = MediaFile.objects.all()
         if options['camera']:
             queryset = queryset.filter(camera__name=options['camera'])
-        
-        # Reset if requested
+        since = self.parse_since(options['since']) if options['since'] else None
+        if since:
+            queryset = queryset.filter(upload_date__gte=since)
+
         if options['reset']:
-            if options['dry_run']:
-                self.stdout.write('Would reset duplicate and burst information')
-            else:
-                self.stdout.write('Resetting duplicate and burst information...')
-                queryset.update(
-                    is_duplicate=False,
-                    duplicate_of=None,
-                    burst_group='',
-                    burst_sequence=None
-                )
-        
+            self.stdout.write(
+                'Would recompute duplicate and burst information' if options['dry_run']
+                else 'Recomputing duplicate and burst information...'
+            )
+
+        # Largest cameras first, so one big camera does not finish last
+        camera_ids = [
+            row['camera_id'] for row in
+            queryset
+            .order_by()
+            .values('camera_id')
+            .annotate(files=Count('id'))
+            .order_by('-files')
+        ]
         total = queryset.count()
-        self.stdout.write(f'Processing {total} files...')
-        
+        self.stdout.write(f'Processing {total} files from {len(camera_ids)} cameras...')
+
+        processed = 0
+        hashed = 0
         duplicates = 0
         bursts = 0
         start_time = time.time()
-        
-        # Process files
-        for i, media_file in enumerate(queryset.iterator(), 1):
-            if i % 100 == 0:
-                self.stdout.write(f'Processed {i}/{total} files...')
-            
-            if not options['dry_run']:
-                with transaction.atomic():
-                    # Compute file hash if missing
-                    if not media_file.file_hash:
-                        media_file.file_hash = media_file.compute_file_hash() or ''
-                        media_file.save()
-                    
-                    # Check for duplicates
-                    was_duplicate = media_file.is_duplicate
-                    check_duplicates(media_file)
-                    if not was_duplicate and media_file.is_duplicate:
-                        duplicates += 1
-                    
-                    # Check for bursts
-                    had_burst = bool(media_file.burst_group)
-                    check_burst(media_file)
-                    if not had_burst and media_file.burst_group:
-                        bursts += 1
-            
-            else:
-                # In dry-run mode, just check what would be done
-                if not media_file.file_hash:
-                    self.stdout.write(f'Would compute hash for {media_file}')
-                check_duplicates(media_file)
-                if media_file.is_duplicate:
-                    self.stdout.write(
-                        f'Would mark {media_file} as duplicate of {media_file.duplicate_of}'
-                    )
-                check_burst(media_file)
-                if media_file.burst_group:
-                    self.stdout.write(
-                        f'Would add {media_file} to burst group {media_file.burst_group}'
-                    )
-        
+
+        tasks = [
+            (camera_id, since, options['reset'], options['dry_run'])
+            for camera_id in camera_ids
+        ]
+
+        # Worker processes are forked, so they must not share our DB connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(max(min(options['workers'], len(tasks)), 1)) as pool:
+            for result in pool.imap_unordered(process_camera, tasks):
+                processed += result['files']
+                hashed += result['hashed']
+                duplicates += result['duplicates']
+                bursts += result['bursts']
+
+                elapsed = time.time() - start_time
+                self.stdout.write(
+                    f"Camera {result['camera_id']}: {result['files']} files in "
+                    f"{result['elapsed']:.1f}s. Processed {processed}/{total} files "
+                    f"({processed / max(elapsed, 0.001):.1f} files/sec)..."
+                )
+
         elapsed = time.time() - start_time
-        
+
         # Print summary
         self.stdout.write(self.style.SUCCESS(
-            f'\nProcessed {total} files in {elapsed:.1f} seconds'
+            f'\nProcessed {total} files in {elapsed:.1f} seconds '
+            f'({total / max(elapsed, 0.001):.1f} files/sec)'
         ))
         if not options['dry_run']:
+            self.stdout.write(f'Computed missing hashes for {hashed} files')
             self.stdout.write(f'Found {duplicates} new duplicates')
-            self.stdout.write(f'Found {bursts} new burst sequences')
+            self.stdout.write(f'Updated burst information for {bursts} files')
         else:
-            self.stdout.write('Dry run completed - no changes made') 
\ No newline at end of file
+            self.stdout.write(f'Would compute missing hashes for {hashed} files')
+            self.stdout.write(f'Would mark {duplicates} new duplicates')
+            self.stdout.write(f'Would update burst information for {bursts} files')
+            self.stdout.write('Dry run completed - no changes made')
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from core.models import Camera
+from core.rollup_utils import rebuild_rollups, refresh_camera_stats
+import time
+
+class Command(BaseCommand):
+    help = 'Rebuild the dashboard sighting rollups and camera media stats from the media files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--camera',
+            type=str,
+            help='Rebuild rollups only for a specific camera (by name)'
+        )
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+
+        if options['camera']:
+            try:
+                camera = Camera.objects.get(name=options['camera'])
+            except Camera.DoesNotExist:
+                self.stderr.write(f"Camera {options['camera']} not found")
+                return
+            self.stdout.write(f'Rebuilding rollups for camera {camera.name}...')
+            created = rebuild_rollups(camera.id)
+            refresh_camera_stats([camera.id])
+        else:
+            self.stdout.write('Rebuilding all rollups...')
+            created = rebuild_rollups()
+            refresh_camera_stats()
+
+        elapsed = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} rollup rows in {elapsed:.1f} seconds'
+        ))
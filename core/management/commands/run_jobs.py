@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from core.jobs import Worker, heartbeat_interval, release_stale_jobs
+from core.models import Job
+import time
+
+class Command(BaseCommand):
+    help = 'Run the background job worker (weather, EXIF, classification, dedup)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=2,
+            help='Number of jobs to run at the same time'
+        )
+        parser.add_argument(
+            '--job',
+            action='append',
+            dest='names',
+            help='Only run jobs with this name (can be repeated)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait between polls when the queue is empty'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no more jobs are due instead of polling forever'
+        )
+
+    def handle(self, *args, **options):
+        worker = Worker(concurrency=options['concurrency'], names=options['names'])
+        self.stdout.write(
+            f'Worker {worker.worker_id} started with concurrency {worker.concurrency}'
+        )
+
+        last_stale_check = 0
+        last_heartbeat = time.time()
+        with ThreadPoolExecutor(max_workers=worker.concurrency) as executor:
+            try:
+                while True:
+                    # Long jobs keep their locks while this process is alive
+                    if time.time() - last_heartbeat > heartbeat_interval():
+                        worker.heartbeat()
+                        last_heartbeat = time.time()
+
+                    # Reclaim jobs from crashed workers once a minute
+                    if time.time() - last_stale_check > 60:
+                        released = release_stale_jobs()
+                        if released:
+                            self.stdout.write(f'Released {released} stale jobs')
+                        last_stale_check = time.time()
+
+                    started = worker.run_once(executor)
+                    if started:
+                        continue
+
+                    if options['once'] and worker.free_slots() == worker.concurrency:
+                        break
+                    time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                self.stdout.write('Stopping worker, waiting for running jobs...')
+
+        failed = Job.objects.filter(status=Job.STATUS_FAILED).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Worker stopped. {failed} failed jobs in the queue.'
+        ))
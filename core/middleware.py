@@ -1,17 +1,28 @@
+from asgiref.sync import iscoroutinefunction
 from django.db import DatabaseError
 from django.http import HttpResponseServerError
+from django.utils.decorators import sync_and_async_middleware
 import logging
 
 logger = logging.getLogger(__name__)
 
-class DatabaseErrorMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
+def database_error_response(e):
+    logger.error(f"Database error: {str(e)}")
+    return HttpResponseServerError("A database error occurred. Please try again later.")
 
-    def __call__(self, request):
-        try:
-            response = self.get_response(request)
-            return response
-        except DatabaseError as e:
-            logger.error(f"Database error: {str(e)}")
-            return HttpResponseServerError("A database error occurred. Please try again later.") 
\ No newline at end of file
+@sync_and_async_middleware
+def database_error_middleware(get_response):
+    """Answer database errors with a 500 page; runs natively under WSGI and ASGI."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            try:
+                return await get_response(request)
+            except DatabaseError as e:
+                return database_error_response(e)
+    else:
+        def middleware(request):
+            try:
+                return get_response(request)
+            except DatabaseError as e:
+                return database_error_response(e)
+    return middleware
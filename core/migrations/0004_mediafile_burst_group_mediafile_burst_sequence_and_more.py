@@ -0,0 +1,65 @@
+# Generated by Django 4.2.9 on 2026-10-18 11:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_mediafile_camera_make_mediafile_camera_model_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediafile',
+            name='burst_group',
+            field=models.CharField(blank=True, help_text='Identifier for grouping burst photos', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='burst_sequence',
+            field=models.IntegerField(blank=True, help_text='Sequence number within a burst group', null=True),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='Reference to the original file if this is a duplicate', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='core.mediafile'),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='file_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 hash of the image file', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='is_duplicate',
+            field=models.BooleanField(default=False, help_text='Whether this file is a duplicate of another'),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='perceptual_hash',
+            field=models.BigIntegerField(blank=True, db_index=True, help_text='64-bit perceptual hash of the image, used for near-duplicate detection', null=True),
+        ),
+        migrations.CreateModel(
+            name='WeatherData',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('temperature', models.FloatField(blank=True, help_text='Temperature in Celsius', null=True)),
+                ('feels_like', models.FloatField(blank=True, help_text='Feels like temperature in Celsius', null=True)),
+                ('humidity', models.IntegerField(blank=True, help_text='Humidity percentage', null=True)),
+                ('wind_speed', models.FloatField(blank=True, help_text='Wind speed in meters/sec', null=True)),
+                ('wind_direction', models.IntegerField(blank=True, help_text='Wind direction in degrees', null=True)),
+                ('weather_condition', models.CharField(blank=True, help_text='Weather condition description', max_length=100, null=True)),
+                ('weather_icon', models.CharField(blank=True, help_text='Weather condition icon code', max_length=10, null=True)),
+                ('fetch_date', models.DateTimeField(auto_now_add=True, help_text='When this weather data was fetched')),
+                ('data_timestamp', models.DateTimeField(help_text='Timestamp of the weather data')),
+                ('media_file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='weather_data', to='core.mediafile')),
+            ],
+            options={
+                'verbose_name': 'Weather Data',
+                'verbose_name_plural': 'Weather Data',
+                'indexes': [models.Index(fields=['data_timestamp'], name='core_weathe_data_ti_e186f8_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.9 on 2026-10-18 11:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Checkpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('last_id', models.BigIntegerField(default=0, help_text='Highest MediaFile id processed so far')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
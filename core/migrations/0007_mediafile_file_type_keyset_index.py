@@ -0,0 +1,39 @@
+# Generated by Django 4.2.9 on 2026-10-18 11:55
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.wmv')
+
+
+def set_video_file_type(apps, schema_editor):
+    MediaFile = apps.get_model('core', 'MediaFile')
+    is_video = Q()
+    for extension in VIDEO_EXTENSIONS:
+        is_video |= Q(file__iendswith=extension)
+    MediaFile.objects.filter(is_video).update(file_type='video')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='mediafile',
+            options={'ordering': ['-upload_date', '-id']},
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='file_type',
+            field=models.CharField(choices=[('image', 'Image'), ('video', 'Video')], default='image', help_text='Set from the file extension at ingest', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(fields=['-upload_date', '-id'], name='mediafile_upload_date_id_idx'),
+        ),
+        migrations.RunPython(set_video_file_type, migrations.RunPython.noop),
+    ]
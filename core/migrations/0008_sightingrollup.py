@@ -0,0 +1,43 @@
+# Generated by Django 4.2.9 on 2026-10-18 11:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+from core.rollup_utils import aggregate_rollups
+
+
+def build_rollups(apps, schema_editor):
+    MediaFile = apps.get_model('core', 'MediaFile')
+    SightingRollup = apps.get_model('core', 'SightingRollup')
+    SightingRollup.objects.bulk_create(
+        aggregate_rollups(MediaFile.objects.all(), SightingRollup),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_mediafile_file_type_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SightingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.SmallIntegerField()),
+                ('has_weather', models.BooleanField(default=False)),
+                ('weather_condition', models.CharField(blank=True, max_length=100, null=True)),
+                ('temperature_bucket', models.IntegerField(blank=True, help_text='Temperature rounded up to a whole degree Celsius', null=True)),
+                ('count', models.IntegerField(default=0)),
+                ('camera', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='core.camera')),
+                ('tag', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='core.tag')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='core_sighti_date_728ab3_idx'), models.Index(fields=['camera', 'date', 'hour'], name='core_sighti_camera__a74d1f_idx')],
+            },
+        ),
+        # The dashboard reads only the rollups, so fill them for existing media
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.9 on 2026-10-18 12:02
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def set_camera_media_stats(apps, schema_editor):
+    Camera = apps.get_model('core', 'Camera')
+    MediaFile = apps.get_model('core', 'MediaFile')
+    media_files = (
+        MediaFile.objects
+        .filter(camera=OuterRef('pk'))
+        .order_by()
+        .values('camera')
+    )
+    Camera.objects.update(
+        media_count=Coalesce(
+            Subquery(media_files.annotate(count=Count('id')).values('count')),
+            0
+        ),
+        latest_media_date=Subquery(
+            media_files.annotate(latest=Max('upload_date')).values('latest')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_sightingrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='latest_media_date',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='media_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(set_camera_media_stats, migrations.RunPython.noop),
+    ]
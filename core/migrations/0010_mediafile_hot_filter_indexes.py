@@ -0,0 +1,33 @@
+# Generated by Django 4.2.9 on 2026-10-18 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_camera_media_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(fields=['file_hash', 'camera'], name='mediafile_hash_camera_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(fields=['camera', 'upload_date', 'id'], name='mediafile_camera_upload_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(fields=['camera', 'capture_date', 'id'], name='mediafile_camera_capture_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(condition=models.Q(('burst_group', ''), _negated=True), fields=['camera', 'burst_group'], name='mediafile_burst_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(condition=models.Q(('is_duplicate', True)), fields=['-upload_date'], name='mediafile_duplicate_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.9 on 2026-10-18 12:15
+
+from django.db import migrations, models
+from core.search_utils import (
+    build_search_document, install_search_index, uninstall_search_index
+)
+
+
+def set_search_documents(apps, schema_editor):
+    MediaFile = apps.get_model('core', 'MediaFile')
+    media_files = (
+        MediaFile.objects
+        .select_related('camera')
+        .prefetch_related('tags')
+        .only('id', 'description', 'camera__name')
+        .order_by()
+    )
+    batch = []
+    for media_file in media_files.iterator(chunk_size=1000):
+        media_file.search_document = build_search_document(
+            media_file.camera.name,
+            media_file.description,
+            [tag.name for tag in media_file.tags.all()]
+        )
+        batch.append(media_file)
+        if len(batch) >= 1000:
+            MediaFile.objects.bulk_update(batch, ['search_document'])
+            batch = []
+    MediaFile.objects.bulk_update(batch, ['search_document'])
+
+
+def create_search_index(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_mediafile_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediafile',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(set_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.9 on 2026-10-18 12:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_mediafile_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediafile',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, help_text='Size of the stored file in bytes', null=True),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
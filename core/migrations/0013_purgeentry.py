@@ -0,0 +1,27 @@
+# Generated by Django 4.2.9 on 2026-10-18 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_mediafile_file_size_dimensions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurgeEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Storage key of the file to delete', max_length=255)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Purge entries',
+                'ordering': ['id'],
+            },
+        ),
+    ]
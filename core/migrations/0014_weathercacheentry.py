@@ -0,0 +1,28 @@
+# Generated by Django 4.2.9 on 2026-10-18 12:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_purgeentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lat_cell', models.IntegerField(help_text='Latitude divided by the grid size, rounded')),
+                ('lon_cell', models.IntegerField(help_text='Longitude divided by the grid size, rounded')),
+                ('bucket', models.DateTimeField(help_text='Start of the time bucket')),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='weathercacheentry',
+            constraint=models.UniqueConstraint(fields=('lat_cell', 'lon_cell', 'bucket'), name='weather_cache_cell_bucket_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_weathercacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purgeentry',
+            name='is_rendition',
+            field=models.BooleanField(default=False, help_text='Key in the rendition storage rather than the media storage'),
+        ),
+    ]
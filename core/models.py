@@ -1,10 +1,13 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
+from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
-from PIL import Image
-from PIL.ExifTags import TAGS
+from imagekit.models import ImageSpecField
+from imagekit.processors import ResizeToFit
+from .exif_utils import EXIF_FIELDS, apply_exif, read_file_exif, read_media_exif
+from .search_utils import build_search_document
 import os
 import hashlib
 
@@ -66,12 +69,26 @@ class Camera(models.Model):
         ],
         help_text="Camera orientation in degrees (0-360°, where 0° is North)"
     )
+    # Denormalized from the media files (see rollup_utils.refresh_camera_stats)
+    media_count = models.PositiveIntegerField(default=0, editable=False)
+    latest_media_date = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Maintained with UPDATE queries, never written back from a stale instance
+    STATS_FIELDS = ('media_count', 'latest_media_date')
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.pk and not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.STATS_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['name']
 
@@ -85,7 +102,21 @@ class Tag(models.Model):
     class Meta:
         ordering = ['name']
 
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.wmv')
+
+# Read size when hashing files that were not hashed on upload
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def media_file_type(file_name):
+    """Return 'video' or 'image' based on the file extension."""
+    return 'video' if file_name.lower().endswith(VIDEO_EXTENSIONS) else 'image'
+
 class MediaFile(models.Model):
+    FILE_TYPE_CHOICES = [
+        ('image', 'Image'),
+        ('video', 'Video'),
+    ]
+
     file = models.ImageField(
         upload_to='media/%Y/%m/%d/',
         help_text="Supported formats: JPG, PNG, GIF"
@@ -102,6 +133,32 @@ class MediaFile(models.Model):
         related_name='media_files'
     )
     description = models.TextField(blank=True)
+    file_type = models.CharField(
+        max_length=10,
+        choices=FILE_TYPE_CHOICES,
+        default='image',
+        help_text="Set from the file extension at ingest"
+    )
+    
+    # Renditions, generated at ingest by the 'renditions' job or on first use
+    thumbnail = ImageSpecField(
+        source='file',
+        processors=[ResizeToFit(400, 400)],
+        format='JPEG',
+        options={'quality': 75}
+    )
+    medium = ImageSpecField(
+        source='file',
+        processors=[ResizeToFit(1280, 1280)],
+        format='JPEG',
+        options={'quality': 80}
+    )
+    full = ImageSpecField(
+        source='file',
+        processors=[ResizeToFit(2560, 2560)],
+        format='JPEG',
+        options={'quality': 85}
+    )
     
     # EXIF-related fields
     capture_date = models.DateTimeField(
@@ -117,12 +174,28 @@ class MediaFile(models.Model):
     focal_length = models.CharField(max_length=50, blank=True)
     has_exif = models.BooleanField(default=False)
     
+    # Stored at ingest so storage accounting never stats the files
+    file_size = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Size of the stored file in bytes"
+    )
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    
     # Duplicate and burst detection fields
     file_hash = models.CharField(
         max_length=64,
         blank=True,
         help_text="SHA-256 hash of the image file"
     )
+    perceptual_hash = models.BigIntegerField(
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="64-bit perceptual hash of the image, used for near-duplicate detection"
+    )
     is_duplicate = models.BooleanField(
         default=False,
         help_text="Whether this file is a duplicate of another"
@@ -146,104 +219,180 @@ class MediaFile(models.Model):
         help_text="Sequence number within a burst group"
     )
     
+    # Camera name, description and tag names, indexed for full-text search
+    # (see search_utils; kept up to date on save and by the tag signals)
+    search_document = models.TextField(blank=True, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.camera.name} - {self.upload_date.strftime('%Y-%m-%d %H:%M')}"
 
+    def rendition_url(self, rendition):
+        """URL of a rendition, falling back to the original if it cannot be generated."""
+        try:
+            return getattr(self, rendition).url
+        except Exception as e:
+            print(f"Error generating {rendition} rendition: {e}")
+            return self.file.url
+
+    @property
+    def thumbnail_url(self):
+        return self.rendition_url('thumbnail')
+
+    @property
+    def medium_url(self):
+        return self.rendition_url('medium')
+
+    @property
+    def full_url(self):
+        return self.rendition_url('full')
+
+    def read_exif(self):
+        """ExifRecord of the file, reading only its header, or None."""
+        if not self.file._committed:
+            # Uncommitted upload: read the local upload, not the storage
+            return read_file_exif(self.file.file)
+        return read_media_exif(self.file.name, self.file.storage)
+
+    def read_file_metadata(self):
+        """Set the file size and, for images, the dimensions without saving."""
+        from .utils import read_image_size  # Import here to avoid circular import
+        
+        try:
+            self.file_size = self.file.size
+            if self.file_type == 'image':
+                self.file.open('rb')
+                self.width, self.height = read_image_size(self.file)
+        except Exception as e:
+            print(f"Error reading file metadata: {e}")
+
     def extract_exif_data(self):
-        """Extract EXIF data from the image file if available."""
+        """Extract EXIF data from the file header and store only the EXIF fields."""
         if not self.file:
             return
 
-        try:
-            with Image.open(self.file.path) as img:
-                if not hasattr(img, '_getexif') or img._getexif() is None:
-                    return
-
-                exif = {
-                    TAGS[k]: v
-                    for k, v in img._getexif().items()
-                    if k in TAGS
-                }
-
-                # Extract DateTime
-                if 'DateTimeOriginal' in exif:
-                    try:
-                        # EXIF DateTime format: 'YYYY:MM:DD HH:MM:SS'
-                        date_str = exif['DateTimeOriginal']
-                        self.capture_date = timezone.datetime.strptime(
-                            date_str,
-                            '%Y:%m:%d %H:%M:%S'
-                        )
-                    except (ValueError, TypeError):
-                        pass
-
-                # Extract camera information
-                self.camera_make = exif.get('Make', '')[:100]
-                self.camera_model = exif.get('Model', '')[:100]
-                
-                # Extract exposure information
-                if 'ExposureTime' in exif:
-                    exposure = exif['ExposureTime']
-                    if isinstance(exposure, tuple):
-                        self.exposure_time = f"{exposure[0]}/{exposure[1]}"
-                
-                if 'FNumber' in exif:
-                    f_number = exif['FNumber']
-                    if isinstance(f_number, tuple):
-                        self.f_number = f"f/{f_number[0]/f_number[1]:.1f}"
-                
-                self.iso_speed = str(exif.get('ISOSpeedRatings', ''))
-                
-                if 'FocalLength' in exif:
-                    focal = exif['FocalLength']
-                    if isinstance(focal, tuple):
-                        self.focal_length = f"{focal[0]/focal[1]:.1f}mm"
-
-                self.has_exif = True
-                self.save()
-
-        except (IOError, AttributeError, KeyError, IndexError) as e:
-            print(f"Error extracting EXIF data: {e}")
+        record = self.read_exif()
+        if record is None:
+            return
+
+        apply_exif(self, record)
+        # Plain UPDATE, so the save pipeline (hashing, signals) does not run again
+        MediaFile.objects.filter(pk=self.pk).update(
+            **{field: getattr(self, field) for field in EXIF_FIELDS}
+        )
 
     def compute_file_hash(self):
         """Compute SHA-256 hash of the image file."""
         if not self.file:
             return None
         
+        # Uploads hashed while streaming in (see core/upload_handlers.py)
+        if not self.file._committed and getattr(self.file.file, 'sha256', None):
+            return self.file.file.sha256
+        
         try:
             sha256_hash = hashlib.sha256()
-            with open(self.file.path, "rb") as f:
-                # Read the file in chunks to handle large files
-                for byte_block in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(byte_block)
+            # Read through the field file so uncommitted uploads and remote
+            # storage work too
+            self.file.open('rb')
+            # Read the file in large chunks to handle large files
+            for byte_block in self.file.chunks(chunk_size=HASH_CHUNK_SIZE):
+                sha256_hash.update(byte_block)
+            self.file.seek(0)
             return sha256_hash.hexdigest()
         except Exception as e:
             print(f"Error computing file hash: {e}")
             return None
 
+    def compute_perceptual_hash(self):
+        """Compute the perceptual hash of the image file."""
+        if not self.file:
+            return None
+        
+        from .utils import compute_image_hash  # Import here to avoid circular import
+        try:
+            # Read through the field file so uncommitted uploads work too
+            self.file.open('rb')
+            perceptual_hash = compute_image_hash(self.file)
+            self.file.seek(0)
+            return perceptual_hash
+        except Exception as e:
+            print(f"Error computing perceptual hash: {e}")
+            return None
+
     def save(self, *args, **kwargs):
+        if self.file:
+            self.file_type = media_file_type(self.file.name)
+        
         # Compute file hash if not set
         if not self.file_hash and self.file:
             self.file_hash = self.compute_file_hash()
         
+        # Compute perceptual hash once at ingest so lookups never re-read the file
+        # (videos and undecodable images keep None and are not retried on re-saves)
+        if not self.pk and self.file and self.file_type == 'image' and self.perceptual_hash is None:
+            self.perceptual_hash = self.compute_perceptual_hash()
+        
+        # Size and dimensions come from the upload, before it is stored
+        if not self.pk and self.file and self.file_size is None:
+            self.read_file_metadata()
+        
+        # Read EXIF from the file header as part of the same save
+        if not self.pk and self.file and not self.has_exif:
+            record = self.read_exif()
+            if record:
+                # A manual capture date overrides the EXIF one
+                apply_exif(self, record, keep_capture_date=True)
+        
+        # Tags are linked after the first save and update the document themselves
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'camera', 'description'} & set(update_fields):
+            self.search_document = build_search_document(
+                self.camera.name,
+                self.description,
+                self.tags.values_list('name', flat=True) if self.pk else []
+            )
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'search_document'}
+        
         # Check for duplicates and bursts
-        if not self.pk:  # Only on creation
-            self.check_duplicates()
-            self.check_burst()
+        from .utils import check_duplicates, resolve_bursts  # Import here to avoid circular import
+        is_new = not self.pk
+        if is_new:
+            check_duplicates(self)
         
-        # Save the model
+        # Save the model (enrichment is queued by the post_save signal)
         super().save(*args, **kwargs)
         
-        # Fetch weather data after saving (needs the ID)
-        if not hasattr(self, 'weather_data'):
-            from .weather_utils import fetch_weather_for_media
-            fetch_weather_for_media(self)
+        # Bursts are regrouped around the stored row
+        if is_new:
+            resolve_bursts([self])
 
     class Meta:
-        ordering = ['-upload_date']
+        # id breaks ties so keyset pagination on (upload_date, id) is stable
+        ordering = ['-upload_date', '-id']
+        indexes = [
+            models.Index(fields=['-upload_date', '-id'], name='mediafile_upload_date_id_idx'),
+            # Exact duplicate lookups, per camera or across all cameras
+            models.Index(fields=['file_hash', 'camera'], name='mediafile_hash_camera_idx'),
+            # Per-camera timelines: media list, rollups and duplicate sweeps
+            models.Index(fields=['camera', 'upload_date', 'id'], name='mediafile_camera_upload_idx'),
+            # Burst windows and rebuilds
+            models.Index(fields=['camera', 'capture_date', 'id'], name='mediafile_camera_capture_idx'),
+            # Only the few photos in a burst or marked as duplicates are indexed
+            models.Index(
+                fields=['camera', 'burst_group'],
+                name='mediafile_burst_group_idx',
+                condition=~Q(burst_group='')
+            ),
+            models.Index(
+                fields=['-upload_date'],
+                name='mediafile_duplicate_idx',
+                condition=Q(is_duplicate=True)
+            ),
+        ]
 
 class WeatherData(models.Model):
     media_file = models.OneToOneField(
@@ -305,3 +454,168 @@ class WeatherData(models.Model):
         indexes = [
             models.Index(fields=['data_timestamp']),
         ]
+
+class WeatherCacheEntry(models.Model):
+    """
+    Persistent tier of the weather lookup cache (see weather_utils.WeatherCache).
+
+    One row per grid cell and time bucket: every camera inside the cell and
+    every photo inside the bucket share the reading.
+
+    Rows are kept forever: a reading for a past time never changes, and
+    nothing expires them. Deleting old rows is safe; lookups for them just
+    go back to the weather provider.
+    """
+    lat_cell = models.IntegerField(help_text='Latitude divided by the grid size, rounded')
+    lon_cell = models.IntegerField(help_text='Longitude divided by the grid size, rounded')
+    bucket = models.DateTimeField(help_text='Start of the time bucket')
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Weather cell ({self.lat_cell}, {self.lon_cell}) at {self.bucket}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['lat_cell', 'lon_cell', 'bucket'],
+                name='weather_cache_cell_bucket_unique'
+            ),
+        ]
+
+class Job(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(
+        max_length=50,
+        help_text='Name of the registered job handler'
+    )
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING
+    )
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_after = models.DateTimeField(
+        default=timezone.now,
+        help_text='Earliest time the job may run (pushed back on retry)'
+    )
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+class PurgeEntry(models.Model):
+    """
+    Journal of storage objects left behind by deleted media files.
+
+    Entries are written in the transaction that deletes the rows and removed
+    once the object is gone, so a purge interrupted at any point is simply
+    run again (deleting a missing object is a no-op).
+
+    Renditions are journaled with their original: they live in the
+    imagekit storage and their names are derived from the original's, so
+    a new upload reusing a purged name must not find them.
+    """
+    name = models.CharField(
+        max_length=255,
+        help_text='Storage key of the file to delete'
+    )
+    is_rendition = models.BooleanField(
+        default=False,
+        help_text='Key in the rendition storage rather than the media storage'
+    )
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['id']
+        verbose_name_plural = 'Purge entries'
+
+class Checkpoint(models.Model):
+    """Progress marker that lets long-running batch commands resume."""
+    name = models.CharField(max_length=100, unique=True)
+    last_id = models.BigIntegerField(
+        default=0,
+        help_text='Highest MediaFile id processed so far'
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} @ {self.last_id}'
+
+    @classmethod
+    def get_last_id(cls, name):
+        return cls.objects.filter(name=name).values_list('last_id', flat=True).first() or 0
+
+    @classmethod
+    def set_last_id(cls, name, last_id):
+        cls.objects.update_or_create(name=name, defaults={'last_id': last_id})
+
+    @classmethod
+    def reset(cls, name):
+        cls.objects.filter(name=name).delete()
+
+class SightingRollup(models.Model):
+    """
+    Pre-aggregated media counts for the dashboard.
+
+    One row per (upload date, hour, camera, tag, weather condition,
+    temperature bucket). Rows with ``tag`` NULL count every media file in
+    the cell; tagged rows count the files carrying that tag. Cells are kept
+    current by core.rollup_utils and can be rebuilt with rebuild_rollups.
+    """
+    date = models.DateField()
+    hour = models.SmallIntegerField()
+    camera = models.ForeignKey(
+        Camera,
+        on_delete=models.CASCADE,
+        related_name='rollups'
+    )
+    tag = models.ForeignKey(
+        Tag,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='rollups'
+    )
+    has_weather = models.BooleanField(default=False)
+    weather_condition = models.CharField(max_length=100, null=True, blank=True)
+    temperature_bucket = models.IntegerField(
+        null=True,
+        blank=True,
+        help_text='Temperature rounded up to a whole degree Celsius'
+    )
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.camera_id} {self.date} {self.hour:02d}h: {self.count}'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date']),
+            models.Index(fields=['camera', 'date', 'hour']),
+        ]
@@ -0,0 +1,50 @@
+import base64
+from datetime import datetime
+from django.db.models import Q
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+def encode_cursor(media_file):
+    """Encode the (upload_date, id) position of a media file as an opaque cursor."""
+    raw = f'{media_file.upload_date.isoformat()}|{media_file.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """Decode a cursor into an ``(upload_date, id)`` tuple."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        upload_date, media_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(upload_date), int(media_id)
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor(f'Invalid cursor: {cursor}') from e
+
+def keyset_page(queryset, cursor=None, page_size=48):
+    """
+    Return one page of media files newest first, using keyset pagination.
+
+    Rows are located with a seek on the ``(upload_date, id)`` index instead
+    of an OFFSET scan, so every page costs the same regardless of depth.
+
+    Args:
+        queryset (QuerySet): Filtered MediaFile queryset
+        cursor (str, optional): Cursor returned with the previous page
+        page_size (int): Number of media files per page
+
+    Returns:
+        tuple: (list of media files, cursor for the next page or None)
+    """
+    queryset = queryset.order_by('-upload_date', '-id')
+    if cursor:
+        upload_date, media_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(upload_date__lt=upload_date) |
+            Q(upload_date=upload_date, id__lt=media_id)
+        )
+
+    # Fetch one extra row to know whether there is a next page
+    items = list(queryset[:page_size + 1])
+    if len(items) > page_size:
+        items = items[:page_size]
+        return items, encode_cursor(items[-1])
+    return items, None
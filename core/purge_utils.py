@@ -0,0 +1,154 @@
+"""Bulk media deletion: rows go in one transaction, storage objects are purged in the background."""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, Sum
+from .jobs import enqueue
+from .models import MediaFile, PurgeEntry
+from .renditions import forget_renditions, rendition_names, rendition_storage
+from .storage_utils import is_s3_storage
+
+logger = logging.getLogger(__name__)
+
+# S3 DeleteObjects accepts at most 1,000 keys per request
+PURGE_BATCH_SIZE = 1000
+
+# Entries that keep failing are left in the journal for inspection
+PURGE_MAX_ATTEMPTS = 10
+
+def delete_media_files(queryset):
+    """
+    Delete media files without touching storage in the request.
+
+    The rows are removed with one queryset delete and their storage keys,
+    renditions included, written to the purge journal in the same
+    transaction, together with the job that purges them, so no key is lost
+    whatever happens afterwards.
+
+    Args:
+        queryset (QuerySet): MediaFile queryset to delete
+
+    Returns:
+        tuple: (number of media files deleted, bytes to be freed)
+    """
+    with transaction.atomic():
+        totals = queryset.aggregate(count=Count('id'), size=Sum('file_size', default=0))
+        entries = []
+        files = queryset.exclude(file='').only('id', 'file', 'file_type', 'file_hash')
+        for media_file in files.iterator(chunk_size=PURGE_BATCH_SIZE):
+            entries.append(PurgeEntry(name=media_file.file.name))
+            entries.extend(
+                PurgeEntry(name=name, is_rendition=True) for name in rendition_names(media_file)
+            )
+
+        PurgeEntry.objects.bulk_create(entries, batch_size=PURGE_BATCH_SIZE)
+        queryset.delete()
+        if entries:
+            enqueue('purge')
+
+    return totals['count'], totals['size']
+
+def delete_objects(names, storage=None):
+    """
+    Delete storage objects, returning ``{name: error}`` for the failures.
+
+    S3 objects are deleted with DeleteObjects, up to 1,000 per request;
+    other storages one per file on a thread pool. Missing objects count as
+    deleted.
+    """
+    storage = storage or default_storage
+    errors = {}
+    if not names:
+        return errors
+
+    if is_s3_storage(storage):
+        from storages.utils import clean_name
+        keys = {storage._normalize_name(clean_name(name)): name for name in names}
+        client = storage.bucket.meta.client
+        key_list = list(keys)
+        for start in range(0, len(key_list), PURGE_BATCH_SIZE):
+            batch = key_list[start:start + PURGE_BATCH_SIZE]
+            try:
+                response = client.delete_objects(
+                    Bucket=storage.bucket_name,
+                    Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+                )
+            except Exception as e:
+                errors.update({keys[key]: str(e) for key in batch})
+                continue
+            for error in response.get('Errors', []):
+                errors[keys[error['Key']]] = f"{error.get('Code')}: {error.get('Message')}"
+        return errors
+
+    def delete(name):
+        try:
+            storage.delete(name)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            return name, str(e)
+        return name, None
+
+    with ThreadPoolExecutor(max_workers=settings.MEDIA_PREFETCH_WORKERS) as executor:
+        for name, error in executor.map(delete, names):
+            if error:
+                errors[name] = error
+    return errors
+
+def purge_storage(batch_size=PURGE_BATCH_SIZE, storage=None, renditions_storage=None):
+    """
+    Delete the storage objects recorded in the purge journal.
+
+    Each batch is deleted from storage first and removed from the journal
+    after, so a crash in between only repeats harmless deletes. Keys that a
+    media file still references are dropped from the journal untouched.
+
+    Returns:
+        int: Number of journal entries purged
+
+    Raises:
+        RuntimeError: If some objects could not be deleted, so the purge
+                      job is retried with backoff
+    """
+    purged = 0
+    failed = 0
+    last_id = 0
+    while True:
+        entries = list(
+            PurgeEntry.objects
+            .filter(id__gt=last_id, attempts__lt=PURGE_MAX_ATTEMPTS)
+            .order_by('id')[:batch_size]
+        )
+        if not entries:
+            break
+        last_id = entries[-1].id
+
+        names = {entry.name for entry in entries if not entry.is_rendition}
+        rendition_keys = {entry.name for entry in entries if entry.is_rendition}
+        in_use = set(
+            MediaFile.objects.filter(file__in=names).values_list('file', flat=True)
+        )
+        file_errors = delete_objects(names - in_use, storage)
+        rendition_errors = delete_objects(rendition_keys, renditions_storage or rendition_storage())
+        forget_renditions([name for name in rendition_keys if name not in rendition_errors])
+
+        def error(entry):
+            return (rendition_errors if entry.is_rendition else file_errors).get(entry.name)
+
+        done = [entry.id for entry in entries if error(entry) is None]
+        PurgeEntry.objects.filter(id__in=done).delete()
+        purged += len(done)
+
+        failures = [entry for entry in entries if error(entry) is not None]
+        for entry in failures:
+            entry.attempts += 1
+            entry.last_error = error(entry)
+        PurgeEntry.objects.bulk_update(failures, ['attempts', 'last_error'])
+        failed += len(failures)
+
+    if failed:
+        logger.error(f'Could not purge {failed} storage objects')
+        raise RuntimeError(f'{failed} storage objects could not be purged')
+    return purged
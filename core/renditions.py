@@ -0,0 +1,63 @@
+"""Pre-generated image renditions (thumb, medium, full) served with immutable caching."""
+import os
+from types import SimpleNamespace
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from imagekit.cachefiles.namers import source_name_dot_hash
+from imagekit.utils import get_singleton
+from storages.backends.s3boto3 import S3Boto3Storage
+
+# Rendition names are content-addressed, so browsers and CDNs may cache them forever
+RENDITION_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+# ImageSpecFields of MediaFile
+RENDITION_FIELDS = ('thumbnail', 'medium', 'full')
+
+def content_hash_namer(generator):
+    """
+    Name a rendition after the SHA-256 of its source file.
+
+    The spec hash (processors, format, options) is appended so changing a
+    rendition definition produces new names instead of stale cache hits.
+    Falls back to imagekit's source-name based naming when the source has
+    no stored hash.
+    """
+    instance = getattr(generator.source, 'instance', None)
+    file_hash = getattr(instance, 'file_hash', '')
+    if not file_hash:
+        return source_name_dot_hash(generator)
+    return os.path.join(
+        file_hash[:2],
+        file_hash,
+        f'{generator.get_hash()[:12]}.{generator.format.lower()}'
+    )
+
+def rendition_names(media_file):
+    """Storage keys of a media file's renditions, whether generated or not."""
+    if media_file.file_type != 'image' or not media_file.file:
+        return []
+    return [getattr(media_file, field).name for field in RENDITION_FIELDS]
+
+def rendition_storage():
+    """The storage renditions are written to (IMAGEKIT_DEFAULT_FILE_STORAGE)."""
+    return get_singleton(settings.IMAGEKIT_DEFAULT_FILE_STORAGE, 'file storage backend')
+
+def forget_renditions(names):
+    """Drop imagekit's cached existence state for deleted renditions."""
+    backend = get_singleton(settings.IMAGEKIT_DEFAULT_CACHEFILE_BACKEND, 'cache file backend')
+    if names and hasattr(backend, 'get_key'):
+        backend.cache.delete_many([backend.get_key(SimpleNamespace(name=name)) for name in names])
+
+class LocalRenditionStorage(FileSystemStorage):
+    """Renditions stored under MEDIA_ROOT/renditions and served by core.views.rendition."""
+
+    def __init__(self):
+        super().__init__(
+            location=os.path.join(settings.MEDIA_ROOT, 'renditions'),
+            base_url='/renditions/'
+        )
+
+class S3RenditionStorage(S3Boto3Storage):
+    """Renditions stored under the renditions/ prefix of the media bucket."""
+    location = 'renditions'
+    object_parameters = {'CacheControl': RENDITION_CACHE_CONTROL}
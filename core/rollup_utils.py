@@ -0,0 +1,208 @@
+import threading
+from datetime import timedelta, timezone as dt_timezone
+from django.db import transaction
+from django.db.models import (
+    BooleanField, Count, DateTimeField, ExpressionWrapper, F, Max, OuterRef, Q,
+    Subquery, Value
+)
+from django.db.models.functions import Ceil, Coalesce, ExtractHour, Greatest, TruncDate
+from .models import Camera, MediaFile, SightingRollup
+from .cache_utils import DASHBOARD, schedule_invalidation
+
+# Cells and cameras waiting to be refreshed when the current transaction commits
+_pending = threading.local()
+
+def rollup_cell(camera_id, upload_date):
+    """The (camera id, UTC hour) rollup cell a media file belongs to."""
+    hour_start = upload_date.astimezone(dt_timezone.utc).replace(
+        minute=0, second=0, microsecond=0
+    )
+    return camera_id, hour_start
+
+def cells_for(media_files):
+    return {
+        rollup_cell(media_file.camera_id, media_file.upload_date)
+        for media_file in media_files
+    }
+
+def aggregate_rollups(media_files, rollup_model=SightingRollup):
+    """
+    Build unsaved SightingRollup rows for a MediaFile queryset.
+
+    Two grouped queries: one for the all-files rows (tag NULL) and one over
+    the tags through table for the per-tag rows. Migrations pass their
+    historical SightingRollup as ``rollup_model``.
+    """
+    dimensions = (
+        media_files
+        .order_by()
+        .annotate(
+            rollup_date=TruncDate('upload_date', tzinfo=dt_timezone.utc),
+            rollup_hour=ExtractHour('upload_date', tzinfo=dt_timezone.utc),
+            rollup_has_weather=ExpressionWrapper(
+                Q(weather_data__isnull=False),
+                output_field=BooleanField()
+            ),
+            rollup_condition=F('weather_data__weather_condition'),
+            rollup_temperature=Ceil('weather_data__temperature'),
+        )
+    )
+    fields = [
+        'rollup_date', 'rollup_hour', 'camera_id', 'rollup_has_weather',
+        'rollup_condition', 'rollup_temperature'
+    ]
+
+    groups = [
+        (row, None)
+        for row in dimensions.values(*fields).annotate(rollup_count=Count('id'))
+    ]
+    groups += [
+        (row, row['tags'])
+        for row in (
+            dimensions
+            .filter(tags__isnull=False)
+            .values(*fields, 'tags')
+            .annotate(rollup_count=Count('id'))
+        )
+    ]
+
+    return [
+        rollup_model(
+            date=row['rollup_date'],
+            hour=row['rollup_hour'],
+            camera_id=row['camera_id'],
+            tag_id=tag_id,
+            has_weather=row['rollup_has_weather'],
+            weather_condition=row['rollup_condition'],
+            temperature_bucket=(
+                int(row['rollup_temperature'])
+                if row['rollup_temperature'] is not None else None
+            ),
+            count=row['rollup_count']
+        )
+        for row, tag_id in groups
+    ]
+
+def refresh_rollups(cells):
+    """
+    Recompute the rollup rows for a set of (camera id, UTC hour) cells.
+
+    Each cell is rebuilt from the source tables, so the result is correct
+    whatever changed (new files, tags, weather, deletions).
+    """
+    cells = set(cells)
+    if not cells:
+        return
+
+    media_filter = Q()
+    rollup_filter = Q()
+    for camera_id, hour_start in cells:
+        media_filter |= Q(
+            camera_id=camera_id,
+            upload_date__gte=hour_start,
+            upload_date__lt=hour_start + timedelta(hours=1)
+        )
+        rollup_filter |= Q(
+            camera_id=camera_id,
+            date=hour_start.date(),
+            hour=hour_start.hour
+        )
+
+    with transaction.atomic():
+        # Serialise refreshes per camera so concurrent writers cannot double count
+        list(
+            Camera.objects
+            .select_for_update()
+            .filter(id__in={camera_id for camera_id, _ in cells})
+            .values_list('id', flat=True)
+        )
+        SightingRollup.objects.filter(rollup_filter).delete()
+        SightingRollup.objects.bulk_create(
+            aggregate_rollups(MediaFile.objects.filter(media_filter)),
+            batch_size=500
+        )
+        # Also covers writers that bypass signals (bulk_create, update)
+        schedule_invalidation(DASHBOARD)
+
+def schedule_rollup_refresh(cells):
+    """
+    Refresh rollup cells once the current transaction commits.
+
+    Cells scheduled during one transaction are merged and refreshed
+    together; outside a transaction the refresh happens immediately.
+    """
+    pending = _pending.__dict__.setdefault('cells', set())
+    pending.update(cells)
+    transaction.on_commit(flush_rollup_refresh)
+
+def flush_rollup_refresh():
+    cells = getattr(_pending, 'cells', None)
+    if cells:
+        _pending.cells = set()
+        refresh_rollups(cells)
+
+def rebuild_rollups(camera_id=None):
+    """Rebuild all rollup rows (optionally for one camera) from scratch."""
+    media_files = MediaFile.objects.all()
+    rollups = SightingRollup.objects.all()
+    if camera_id is not None:
+        media_files = media_files.filter(camera_id=camera_id)
+        rollups = rollups.filter(camera_id=camera_id)
+
+    with transaction.atomic():
+        rollups.delete()
+        created = SightingRollup.objects.bulk_create(
+            aggregate_rollups(media_files),
+            batch_size=1000
+        )
+        schedule_invalidation(DASHBOARD)
+    return len(created)
+
+def record_camera_uploads(camera_id, media_files):
+    """Add newly created media files to their camera's media count and latest date."""
+    if not media_files:
+        return
+    latest = Value(
+        max(media_file.upload_date for media_file in media_files),
+        output_field=DateTimeField()
+    )
+    Camera.objects.filter(pk=camera_id).update(
+        media_count=F('media_count') + len(media_files),
+        latest_media_date=Greatest(Coalesce('latest_media_date', latest), latest)
+    )
+
+def refresh_camera_stats(camera_ids=None):
+    """
+    Recompute the media count and latest media date of cameras (or all cameras)
+    with one UPDATE over correlated subqueries.
+    """
+    media_files = (
+        MediaFile.objects
+        .filter(camera=OuterRef('pk'))
+        .order_by()
+        .values('camera')
+    )
+    cameras = Camera.objects.all()
+    if camera_ids is not None:
+        cameras = cameras.filter(id__in=camera_ids)
+    return cameras.update(
+        media_count=Coalesce(
+            Subquery(media_files.annotate(count=Count('id')).values('count')),
+            0
+        ),
+        latest_media_date=Subquery(
+            media_files.annotate(latest=Max('upload_date')).values('latest')
+        )
+    )
+
+def schedule_camera_stats_refresh(camera_ids):
+    """Recompute camera stats once the current transaction commits."""
+    pending = _pending.__dict__.setdefault('camera_ids', set())
+    pending.update(camera_ids)
+    transaction.on_commit(flush_camera_stats_refresh)
+
+def flush_camera_stats_refresh():
+    camera_ids = getattr(_pending, 'camera_ids', None)
+    if camera_ids:
+        _pending.camera_ids = set()
+        refresh_camera_stats(camera_ids)
@@ -0,0 +1,225 @@
+"""Full-text search over a denormalized search document per media file.
+
+PostgreSQL keeps a generated ``tsvector`` column with a GIN index next to
+``MediaFile.search_document``; SQLite keeps an external-content FTS5 table
+in sync with it through triggers. Other databases fall back to matching the
+document with LIKE, which still avoids the joins across tags and cameras.
+"""
+import re
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'core_mediafile_fts'
+SEARCH_CONFIG = 'english'
+
+# Rows per UPDATE when rewriting search documents
+SEARCH_BATCH_SIZE = 1000
+
+POSTGRES_INSTALL_SQL = [
+    f"""
+    ALTER TABLE core_mediafile ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('{SEARCH_CONFIG}', search_document)) STORED
+    """,
+    'CREATE INDEX IF NOT EXISTS mediafile_search_vector_idx ON core_mediafile USING gin (search_vector)',
+]
+POSTGRES_UNINSTALL_SQL = [
+    'DROP INDEX IF EXISTS mediafile_search_vector_idx',
+    'ALTER TABLE core_mediafile DROP COLUMN IF EXISTS search_vector',
+]
+
+# Prefix queries are not stemmed in FTS5, so the tokenizer does not stem either
+SQLITE_TABLE_SQL = f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        search_document,
+        content='core_mediafile',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+"""
+SQLITE_TRIGGER_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON core_mediafile BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, search_document) VALUES (new.id, new.search_document);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON core_mediafile BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_document)
+        VALUES ('delete', old.id, old.search_document);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF search_document ON core_mediafile BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_document)
+        VALUES ('delete', old.id, old.search_document);
+        INSERT INTO {FTS_TABLE}(rowid, search_document) VALUES (new.id, new.search_document);
+    END
+    """,
+]
+SQLITE_UNINSTALL_SQL = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+def build_search_document(camera_name, description, tag_names):
+    """The text indexed for a media file: camera name, description and tags."""
+    parts = [camera_name or '', description or '', ' '.join(sorted(tag_names))]
+    return '\n'.join(part.strip() for part in parts if part and part.strip())
+
+def install_search_index(connection=connection):
+    """
+    Create the database-side search index for the current backend.
+
+    Idempotent. On SQLite the triggers are dropped whenever a migration
+    rebuilds the media file table, so this also runs after every migrate
+    and rebuilds the FTS table when it had to be recreated.
+    """
+    with connection.cursor() as cursor:
+        # Nothing to index before the search document migration (or after reversing it)
+        table_names = connection.introspection.table_names(cursor)
+        if 'core_mediafile' not in table_names or 'search_document' not in [
+            column.name
+            for column in connection.introspection.get_table_description(cursor, 'core_mediafile')
+        ]:
+            return
+
+        if connection.vendor == 'postgresql':
+            for sql in POSTGRES_INSTALL_SQL:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                [f'{FTS_TABLE}_%']
+            )
+            if FTS_TABLE in table_names and cursor.fetchone()[0] == len(SQLITE_TRIGGER_SQL):
+                return
+            if FTS_TABLE not in table_names:
+                cursor.execute(SQLITE_TABLE_SQL)
+            for sql in SQLITE_TRIGGER_SQL:
+                cursor.execute(sql)
+            # Rows changed while the triggers were missing are picked up too
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+def uninstall_search_index(connection=connection):
+    """Drop the database-side search index (reverse migration)."""
+    statements = {
+        'postgresql': POSTGRES_UNINSTALL_SQL,
+        'sqlite': SQLITE_UNINSTALL_SQL,
+    }.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+def has_fts_table():
+    with connection.cursor() as cursor:
+        return FTS_TABLE in connection.introspection.table_names(cursor)
+
+def search_terms(query):
+    """Words of a free-text query, with any query syntax stripped."""
+    return re.findall(r'\w+', query.lower())
+
+def search_media(queryset, query, ranked=False):
+    """
+    Filter media files by a free-text query over their search documents.
+
+    Every word must match, as a prefix, the camera name, description or a
+    tag. Ranking is only computed when asked for, so plain searches keep the
+    cost of an index lookup however many rows match.
+
+    Args:
+        queryset (QuerySet): MediaFile queryset to filter
+        query (str): Free-text query typed by the user
+        ranked (bool): Annotate ``search_rank`` (higher is better) and order
+               by it, best matches first
+
+    Returns:
+        QuerySet: The matching media files
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+
+    rank = None
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        queryset = queryset.annotate(
+            search_match=RawSQL(
+                f'"core_mediafile"."search_vector" @@ to_tsquery(\'{SEARCH_CONFIG}\', %s)',
+                [tsquery],
+                output_field=BooleanField()
+            )
+        ).filter(search_match=True)
+        rank = RawSQL(
+            f'ts_rank("core_mediafile"."search_vector", to_tsquery(\'{SEARCH_CONFIG}\', %s))',
+            [tsquery],
+            output_field=FloatField()
+        )
+    elif connection.vendor == 'sqlite' and has_fts_table():
+        match = ' '.join(f'"{term}"*' for term in terms)
+        queryset = queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        )
+        # bm25() is lower for better matches. The ranks are computed in one
+        # pass over the matches; a plain correlated subquery would rerun the
+        # full-text query for every row.
+        rank = RawSQL(
+            f'WITH ranks AS MATERIALIZED ('
+            f'SELECT rowid AS id, -bm25({FTS_TABLE}) AS value FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s'
+            f') SELECT value FROM ranks WHERE ranks.id = "core_mediafile"."id"',
+            [match],
+            output_field=FloatField()
+        )
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= Q(search_document__icontains=term)
+        queryset = queryset.filter(condition)
+        rank = Value(0.0, output_field=FloatField())
+
+    if ranked:
+        queryset = queryset.annotate(search_rank=rank).order_by('-search_rank', '-upload_date', '-id')
+    return queryset
+
+def refresh_search_documents(media_files):
+    """
+    Rebuild the search documents of media files, writing only changed ones.
+
+    Args:
+        media_files (QuerySet): MediaFile queryset to refresh
+
+    Returns:
+        int: Number of documents that changed
+    """
+    from .models import MediaFile  # Import here to avoid circular import
+
+    media_files = (
+        media_files
+        .select_related('camera')
+        .prefetch_related('tags')
+        .only('id', 'description', 'search_document', 'camera__name')
+        .order_by()
+    )
+    changed = []
+    updated = 0
+    for media_file in media_files.iterator(chunk_size=SEARCH_BATCH_SIZE):
+        document = build_search_document(
+            media_file.camera.name,
+            media_file.description,
+            [tag.name for tag in media_file.tags.all()]
+        )
+        if document != media_file.search_document:
+            media_file.search_document = document
+            changed.append(media_file)
+        if len(changed) >= SEARCH_BATCH_SIZE:
+            MediaFile.objects.bulk_update(changed, ['search_document'])
+            updated += len(changed)
+            changed = []
+
+    if changed:
+        MediaFile.objects.bulk_update(changed, ['search_document'])
+        updated += len(changed)
+    return updated
@@ -1,31 +1,140 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
 from django.dispatch import receiver
-from .models import MediaFile, Tag
-# Temporarily comment out AI classifier for weather testing
-# from .ai_classifier import classifier
+from .models import MediaFile, WeatherData, Tag, Camera
+from .jobs import enqueue_enrichment
+from .rollup_utils import (
+    rollup_cell, cells_for, schedule_rollup_refresh, record_camera_uploads,
+    schedule_camera_stats_refresh
+)
+from .cache_utils import DASHBOARD, CAMERA_MAP, schedule_invalidation
+from .search_utils import refresh_search_documents
 
 @receiver(post_save, sender=MediaFile)
-def classify_media_file(sender, instance, created, **kwargs):
-    """Classify the media file after it's saved."""
-    # Temporarily disable AI classification for weather testing
-    pass
-    # Original code commented out:
-    # # Only process image files
-    # if not instance.file.name.lower().endswith(('.jpg', '.jpeg', '.png')):
-    #     return
-    # 
-    # # Skip if already has buck/doe tag
-    # existing_tags = set(instance.tags.values_list('name', flat=True))
-    # if 'buck' in existing_tags or 'doe' in existing_tags:
-    #     return
-    # 
-    # # Run classification
-    # predictions = classifier.predict(instance.file.path)
-    # if predictions:
-    #     best_label, confidence = classifier.get_best_prediction(predictions)
-    #     if best_label:
-    #         # Create or get the tag
-    #         tag, _ = Tag.objects.get_or_create(name=best_label)
-    #         # Add the tag to the media file
-    #         instance.tags.add(tag)
-    #         print(f"Added {best_label} tag with confidence {confidence:.2f} to {instance.file.name}") 
\ No newline at end of file
+def enrich_media_file(sender, instance, created, **kwargs):
+    """Queue background enrichment (weather, EXIF, classification) for new files."""
+    if not created:
+        return
+    
+    # Enqueue after commit so workers never see a file that was rolled back
+    transaction.on_commit(lambda: enqueue_enrichment([instance]))
+
+@receiver(pre_save, sender=MediaFile)
+def track_previous_rollup_cell(sender, instance, update_fields=None, **kwargs):
+    """Remember the rollup cell a file is moving out of when camera or date change."""
+    if not instance.pk:
+        return
+    if update_fields is not None and not {'camera', 'upload_date'} & set(update_fields):
+        return
+    previous = (
+        MediaFile.objects
+        .filter(pk=instance.pk)
+        .values_list('camera_id', 'upload_date')
+        .first()
+    )
+    if previous and previous != (instance.camera_id, instance.upload_date):
+        # Refreshed after the save, once the file has actually left the cell
+        instance._previous_rollup_cell = rollup_cell(*previous)
+
+@receiver(post_save, sender=MediaFile)
+@receiver(post_delete, sender=MediaFile)
+def update_media_rollups(sender, instance, created=False, **kwargs):
+    cells = cells_for([instance])
+    previous_cell = instance.__dict__.pop('_previous_rollup_cell', None)
+    if previous_cell:
+        cells.add(previous_cell)
+    schedule_rollup_refresh(cells)
+    
+    # Camera stats grow incrementally; deletions and moves are recounted exactly
+    if created:
+        record_camera_uploads(instance.camera_id, [instance])
+    elif previous_cell or kwargs['signal'] is post_delete:
+        schedule_camera_stats_refresh({camera_id for camera_id, _ in cells})
+
+@receiver(post_save, sender=WeatherData)
+@receiver(post_delete, sender=WeatherData)
+def update_weather_rollups(sender, instance, **kwargs):
+    media_file = MediaFile.objects.filter(pk=instance.media_file_id).only(
+        'camera_id', 'upload_date'
+    ).first()
+    if media_file:
+        schedule_rollup_refresh(cells_for([media_file]))
+
+@receiver(m2m_changed, sender=MediaFile.tags.through)
+def update_tag_rollups(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    
+    if not reverse:
+        schedule_rollup_refresh(cells_for([instance]))
+    elif action == 'pre_clear':
+        # The files losing this tag are only known before the clear
+        schedule_rollup_refresh(cells_for(
+            instance.media_files.only('camera_id', 'upload_date')
+        ))
+    elif pk_set:
+        schedule_rollup_refresh(cells_for(
+            MediaFile.objects.filter(pk__in=pk_set).only('camera_id', 'upload_date')
+        ))
+
+# Cache invalidation. These receivers are connected after the rollup ones,
+# so the cached views are only dropped once the rollups are up to date.
+
+@receiver(post_save, sender=MediaFile)
+@receiver(post_delete, sender=MediaFile)
+def invalidate_media_caches(sender, instance, **kwargs):
+    schedule_invalidation(DASHBOARD, CAMERA_MAP)
+
+@receiver(post_save, sender=WeatherData)
+@receiver(post_delete, sender=WeatherData)
+def invalidate_weather_caches(sender, instance, **kwargs):
+    schedule_invalidation(DASHBOARD)
+
+@receiver(m2m_changed, sender=MediaFile.tags.through)
+def invalidate_tag_link_caches(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        schedule_invalidation(DASHBOARD)
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_caches(sender, instance, **kwargs):
+    # Rollups reference tags by id, so a rename changes the dashboard by itself
+    schedule_invalidation(DASHBOARD)
+
+@receiver(post_save, sender=Camera)
+@receiver(post_delete, sender=Camera)
+def invalidate_camera_caches(sender, instance, **kwargs):
+    schedule_invalidation(CAMERA_MAP)
+
+# Search documents. MediaFile.save() writes the document itself; tag links
+# and renames of tags and cameras change the documents of many files.
+
+@receiver(m2m_changed, sender=MediaFile.tags.through)
+def update_tag_link_search(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_search_documents(MediaFile.objects.filter(pk=instance.pk))
+    elif action == 'pre_clear':
+        # The files losing this tag are only known before the clear
+        instance._search_media_ids = list(instance.media_files.values_list('id', flat=True))
+    elif action == 'post_clear':
+        refresh_search_documents(
+            MediaFile.objects.filter(pk__in=instance.__dict__.pop('_search_media_ids', []))
+        )
+    elif action in ('post_add', 'post_remove') and pk_set:
+        refresh_search_documents(MediaFile.objects.filter(pk__in=pk_set))
+
+@receiver(pre_save, sender=Tag)
+@receiver(pre_save, sender=Camera)
+def track_previous_name(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_name = (
+            sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+        )
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Camera)
+def update_renamed_search(sender, instance, created, **kwargs):
+    previous_name = instance.__dict__.pop('_previous_name', None)
+    if not created and previous_name is not None and previous_name != instance.name:
+        refresh_search_documents(instance.media_files.all())
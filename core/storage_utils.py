@@ -0,0 +1,196 @@
+"""Storage-agnostic media access: ranged header reads, a local LRU disk cache and prefetching."""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+# Bytes fetched for EXIF and other header parsing (APP1 segments are < 64 KB)
+HEADER_SIZE = 128 * 1024
+
+# Bytes written to the cache between two checks of its total size
+CACHE_CHECK_FRACTION = 0.1
+
+def local_path(name, storage=None):
+    """Path of a file on the local file system, or None for remote storage."""
+    storage = storage or default_storage
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        return None
+    return path if os.path.exists(path) else None
+
+def is_s3_storage(storage):
+    return hasattr(storage, 'bucket') and hasattr(storage, '_normalize_name')
+
+def read_range(name, start, length, storage=None):
+    """
+    Read ``length`` bytes of a file starting at ``start``.
+
+    Local files are read with a seek, S3 objects with a ranged GET, so
+    only the requested bytes cross the network.
+    """
+    storage = storage or default_storage
+
+    path = local_path(name, storage)
+    if path:
+        with open(path, 'rb') as f:
+            f.seek(start)
+            return f.read(length)
+
+    if is_s3_storage(storage):
+        from storages.utils import clean_name
+        response = storage.bucket.meta.client.get_object(
+            Bucket=storage.bucket_name,
+            Key=storage._normalize_name(clean_name(name)),
+            Range=f'bytes={start}-{start + length - 1}'
+        )
+        return response['Body'].read()
+
+    # Other storages: fall back to the cached full object
+    with open_media(name, storage) as f:
+        f.seek(start)
+        return f.read(length)
+
+def read_header(name, size=HEADER_SIZE, storage=None):
+    """The first ``size`` bytes of a file."""
+    return read_range(name, 0, size, storage)
+
+class MediaCache:
+    """
+    Bounded LRU cache of remote media files on local disk.
+
+    File modification times record recency, so the cache directory can be
+    shared by several processes: each hit touches the file and eviction
+    removes the least recently used files across all of them.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.bytes_since_check = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, name):
+        digest = hashlib.sha256(name.encode()).hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(self.directory, digest[:2], digest + extension)
+
+    def open(self, name, storage):
+        """Open a cached copy of a remote file, downloading it on a miss."""
+        path = self.path_for(name)
+        try:
+            f = open(path, 'rb')
+            os.utime(path)
+            return f
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as tmp, storage.open(name, 'rb') as source:
+                for chunk in source.chunks(chunk_size=1024 * 1024):
+                    tmp.write(chunk)
+            # Atomic, so readers never see a partial download
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+        # Open before evicting, so our own file survives even if it is evicted
+        f = open(path, 'rb')
+        self.added(os.path.getsize(path))
+        return f
+
+    def added(self, size):
+        with self.lock:
+            self.bytes_since_check += size
+            if self.bytes_since_check < self.max_bytes * CACHE_CHECK_FRACTION:
+                return
+            self.bytes_since_check = 0
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used files until the cache fits in ``max_bytes``."""
+        entries = []
+        for root, dirs, files in os.walk(self.directory):
+            for file_name in files:
+                if file_name.endswith('.part'):
+                    continue
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                # Open readers keep their file until they close it
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_media_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MediaCache(settings.MEDIA_CACHE_DIR, settings.MEDIA_CACHE_MAX_BYTES)
+        return _cache
+
+def open_media(name, storage=None):
+    """
+    Open a media file for reading as a local binary file object.
+
+    Local files are opened in place; remote files go through the disk cache.
+    """
+    storage = storage or default_storage
+    path = local_path(name, storage)
+    if path:
+        return open(path, 'rb')
+    return get_media_cache().open(name, storage)
+
+def prefetch(names, workers=None, storage=None):
+    """
+    Open media files ahead of use on a thread pool.
+
+    Yields ``(name, file)`` in the order of ``names``, with ``file`` None
+    where the file could not be opened. At most ``2 * workers`` downloads
+    are in flight, so long iterables do not flood the disk cache. Callers
+    close the files.
+    """
+    workers = workers or settings.MEDIA_PREFETCH_WORKERS
+    storage = storage or default_storage
+
+    def fetch(name):
+        try:
+            return open_media(name, storage)
+        except Exception as e:
+            logger.error(f'Error fetching media file {name}: {str(e)}')
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media-prefetch') as executor:
+        in_flight = deque()
+        for name in names:
+            in_flight.append((name, executor.submit(fetch, name)))
+            if len(in_flight) >= workers * 2:
+                queued_name, future = in_flight.popleft()
+                yield queued_name, future.result()
+        while in_flight:
+            queued_name, future = in_flight.popleft()
+            yield queued_name, future.result()
@@ -0,0 +1,91 @@
+"""Background enrichment jobs run by the ``run_jobs`` worker."""
+from .jobs import job
+from .rollup_utils import cells_for, schedule_rollup_refresh
+from .models import MediaFile, Tag
+from .utils import check_duplicates, resolve_bursts
+from .weather_utils import fetch_weather_for_batch
+from .storage_utils import prefetch
+from .exif_utils import EXIF_FIELDS, apply_exif
+from .purge_utils import PURGE_MAX_ATTEMPTS, purge_storage
+
+@job('weather', concurrency=2)
+def fetch_weather(media_file_ids):
+    """Fetch weather for media files that do not have it yet."""
+    media_files = list(
+        MediaFile.objects
+        .filter(id__in=media_file_ids, weather_data__isnull=True)
+        .select_related('camera')
+    )
+    fetch_weather_for_batch(media_files)
+    # Weather is bulk created without signals
+    schedule_rollup_refresh(cells_for(media_files))
+
+@job('exif')
+def extract_exif(media_file_ids):
+    """Extract EXIF data and regroup bursts with the new capture dates."""
+    media_files = []
+    for media_file in MediaFile.objects.filter(id__in=media_file_ids, has_exif=False):
+        record = media_file.read_exif()
+        if record:
+            # Without EXIF applied yet, a capture date was set manually at upload
+            apply_exif(media_file, record, keep_capture_date=True)
+            media_files.append(media_file)
+    MediaFile.objects.bulk_update(media_files, EXIF_FIELDS)
+    resolve_bursts(media_files)
+
+@job('renditions', concurrency=2)
+def generate_renditions(media_file_ids):
+    """Pre-generate the thumbnail, medium and full renditions."""
+    for media_file in MediaFile.objects.filter(id__in=media_file_ids):
+        if not media_file.file.name.lower().endswith(('.jpg', '.jpeg', '.png', '.gif')):
+            continue
+        for rendition in (media_file.thumbnail, media_file.medium, media_file.full):
+            rendition.generate()
+
+@job('dedup')
+def detect_duplicates(media_file_ids):
+    """Re-run duplicate detection for media files not yet marked."""
+    for media_file in MediaFile.objects.filter(id__in=media_file_ids, is_duplicate=False):
+        check_duplicates(media_file)
+        if media_file.is_duplicate:
+            MediaFile.objects.filter(pk=media_file.pk).update(
+                is_duplicate=True,
+                duplicate_of=media_file.duplicate_of
+            )
+
+@job('classify', concurrency=1)
+def classify(media_file_ids):
+    """Tag images as buck or doe with the deer classifier."""
+    from .ai_classifier import classifier  # Loads the model, so import lazily
+
+    media_files = (
+        MediaFile.objects
+        .filter(id__in=media_file_ids)
+        .exclude(tags__name__in=['buck', 'doe'])
+    )
+    # Only process image files
+    media_files = [
+        media_file for media_file in media_files
+        if media_file.file.name.lower().endswith(('.jpg', '.jpeg', '.png'))
+    ]
+    # Download (or open) every image ahead of inference
+    images = [
+        image for _, image in prefetch(media_file.file.name for media_file in media_files)
+    ]
+    try:
+        all_predictions = classifier.predict_batch(images)
+    finally:
+        for image in images:
+            if image is not None:
+                image.close()
+    for media_file, predictions in zip(media_files, all_predictions):
+        if predictions:
+            best_label, confidence = classifier.get_best_prediction(predictions)
+            if best_label:
+                tag, _ = Tag.objects.get_or_create(name=best_label)
+                media_file.tags.add(tag)
+
+@job('purge', concurrency=1, max_attempts=PURGE_MAX_ATTEMPTS)
+def purge():
+    """Delete the storage objects of deleted media files (see purge_utils)."""
+    purge_storage()
@@ -1,3 +1,1595 @@
-from django.test import TestCase
+import csv
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+import requests
+from asgiref.sync import sync_to_async
+from PIL import ExifTags, Image
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import InMemoryUploadedFile, SimpleUploadedFile, TemporaryUploadedFile
+from django.conf import settings
+from django.db import IntegrityError, connection
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from . import cache_utils, exif_utils, jobs
+from .cache_utils import DASHBOARD
+from .models import Camera, Job, MediaFile, PurgeEntry, SightingRollup, Tag, WeatherCacheEntry, WeatherData
+from .purge_utils import delete_media_files, delete_objects, purge_storage
+from .renditions import rendition_names
+from .rollup_utils import rebuild_rollups, refresh_camera_stats
+from .dashboard_utils import get_sighting_summary, get_weather_impact
+from .ingest_utils import hash_upload, ingest_media_files
+from .search_utils import FTS_TABLE, search_media
+from .upload_handlers import HashingUploadMixin
+from .views import build_camera_map
+from .utils import (
+    NEAR_DUPLICATE_DISTANCE,
+    BKTree,
+    PerceptualHashIndex,
+    assign_bursts,
+    get_hash_index,
+    hamming_distance,
+    hash_to_int,
+    invalidate_hash_index,
+    rebuild_bursts,
+    resolve_bursts,
+    split_sessions
+)
+from . import weather_stations
+from .weather_stations import StationWeatherProvider, build_station_archive
+from .weather_utils import OpenWeatherProvider, TokenBucket, WeatherAPI, WeatherCache, weather_slot
+
+def jpeg_bytes(color='red', size=(32, 24), exif=None):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG', **({'exif': exif} if exif is not None else {}))
+    return buffer.getvalue()
+
+class TemporaryMediaMixin:
+    """Store the files a test writes in a temporary MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+    def image(self, name, color='red', size=(32, 24)):
+        return SimpleUploadedFile(name, jpeg_bytes(color, size), content_type='image/jpeg')
+
+class MediaFileSaveTests(TemporaryMediaMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.camera = Camera.objects.create(name='Save camera', latitude=0, longitude=0)
+
+    def test_perceptual_hash_computed_for_new_images(self):
+        media_file = MediaFile(camera=self.camera, file=self.image('photo.jpg'))
+        media_file.save()
+        self.assertIsNotNone(media_file.perceptual_hash)
+
+    def test_perceptual_hash_not_recomputed_on_resave(self):
+        with mock.patch('core.utils.compute_image_hash', return_value=None) as compute_image_hash:
+            video = MediaFile(camera=self.camera, file=SimpleUploadedFile('clip.mp4', b'\x00' * 64))
+            video.save()
+            self.assertIsNone(video.perceptual_hash)
+            compute_image_hash.assert_not_called()
+
+            image = MediaFile(camera=self.camera, file=SimpleUploadedFile('broken.jpg', b'not an image'))
+            image.save()
+            self.assertIsNone(image.perceptual_hash)
+            self.assertEqual(compute_image_hash.call_count, 1)
+
+        with mock.patch('core.utils.compute_image_hash', return_value=None) as compute_image_hash:
+            for media_file in (video, image):
+                media_file.description = 'Edited'
+                media_file.save()
+                media_file.save(update_fields=['description'])
+        compute_image_hash.assert_not_called()
+
+class IngestTests(TemporaryMediaMixin, TestCase):
+    """Batch ingest leaves no stored files behind when it fails."""
+
+    def setUp(self):
+        super().setUp()
+        self.camera = Camera.objects.create(name='Ingest camera', latitude=0, longitude=0)
+
+    def stored_files(self):
+        return [os.path.join(root, name) for root, _, names in os.walk(settings.MEDIA_ROOT) for name in names]
+
+    def test_ingest(self):
+        media_files = ingest_media_files([self.image('a.jpg', 'red'), self.image('b.jpg', 'blue')], self.camera)
+        self.assertEqual(MediaFile.objects.count(), 2)
+        self.assertEqual(len(self.stored_files()), 2)
+        self.assertTrue(all(default_storage.exists(m.file.name) for m in media_files))
+
+    def test_failed_insert_removes_stored_files(self):
+        uploads = [self.image('a.jpg', 'red'), self.image('b.jpg', 'blue')]
+        with mock.patch('core.ingest_utils.resolve_duplicates', side_effect=IntegrityError('race')):
+            with self.assertRaises(IntegrityError):
+                ingest_media_files(uploads, self.camera)
+        self.assertFalse(MediaFile.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_failed_upload_removes_earlier_files(self):
+        def uploads():
+            yield self.image('a.jpg', 'red')
+            raise OSError('connection reset')
+
+        with self.assertRaises(OSError):
+            ingest_media_files(uploads(), self.camera)
+        self.assertEqual(self.stored_files(), [])
+
+class BackfillHashesTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.camera = Camera.objects.create(name='Backfill camera', latitude=0, longitude=0)
+        self.video = MediaFile.objects.create(
+            camera=self.camera, file=SimpleUploadedFile('clip.mp4', b'\x00' * 64)
+        )
+        self.image = MediaFile.objects.create(camera=self.camera, file=self.image('photo.jpg'))
+        self.expected_hashes = (self.image.file_hash, self.image.perceptual_hash)
+        MediaFile.objects.filter(id=self.image.id).update(file_hash='', perceptual_hash=None)
+
+    def test_skips_hashed_videos(self):
+        from .management.commands.process_duplicates import backfill_hashes
+
+        self.assertIsNone(self.video.perceptual_hash)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(backfill_hashes(MediaFile.objects.all(), dry_run=True), 1)
+        self.assertEqual(len(queries), 1)
+
+        self.assertEqual(backfill_hashes(MediaFile.objects.all()), 1)
+        self.image.refresh_from_db()
+        self.assertEqual((self.image.file_hash, self.image.perceptual_hash), self.expected_hashes)
+        self.assertEqual(backfill_hashes(MediaFile.objects.all()), 0)
+
+class BKTreeTests(SimpleTestCase):
+    """BK-tree search against a brute-force Hamming distance scan."""
+
+    def test_search_matches_brute_force(self):
+        rng = random.Random(1)
+        base = rng.getrandbits(64)
+        # Hashes clustered around one value so every distance band is populated
+        hashes = [base ^ sum(1 << rng.randrange(64) for _ in range(rng.randrange(8))) for _ in range(300)]
+        hashes = [hash_to_int(f'{value:016x}') for value in hashes]
+        tree = BKTree()
+        for i, value in enumerate(hashes):
+            tree.add(value, i)
+        self.assertEqual(tree.size, len(hashes))
+
+        for query in hashes[:20] + [hash_to_int(f'{base:016x}')]:
+            for max_distance in (0, 2, NEAR_DUPLICATE_DISTANCE, 10):
+                expected = sorted(
+                    (hamming_distance(query, value), i) for i, value in enumerate(hashes)
+                    if hamming_distance(query, value) <= max_distance
+                )
+                self.assertEqual(sorted(tree.search(query, max_distance)), expected)
+
+    def test_empty_tree(self):
+        self.assertEqual(BKTree().search(0, NEAR_DUPLICATE_DISTANCE), [])
+
+class PerceptualHashIndexTests(TemporaryMediaMixin, TestCase):
+    """Keeping the per-process perceptual hash index in step with the table."""
+
+    def setUp(self):
+        super().setUp()
+        invalidate_hash_index()
+        self.addCleanup(invalidate_hash_index)
+        self.camera = Camera.objects.create(name='Index camera', latitude=0, longitude=0)
+
+    def create(self, perceptual_hash, camera=None):
+        return MediaFile.objects.bulk_create([MediaFile(
+            camera=camera or self.camera, file='media/indexed.jpg', file_type='image',
+            file_hash=f'{perceptual_hash:064x}', perceptual_hash=perceptual_hash
+        )])[0]
+
+    def found(self, index, perceptual_hash):
+        return sorted(media_id for _, (media_id, _) in index.search(perceptual_hash))
+
+    def test_picks_up_new_rows(self):
+        first = self.create(0b1111)
+        index = get_hash_index(self.camera.id)
+        self.assertIs(get_hash_index(self.camera.id), index)
+        self.assertEqual(self.found(index, 0b1110), [first.id])
+
+        second = self.create(0b0111)
+        self.create(0b1111, camera=Camera.objects.create(name='Other camera', latitude=0, longitude=0))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.found(index, 0b1110), [first.id, second.id])
+
+    def test_rebuilds_after_hash_updates(self):
+        media_file = self.create(0)
+        index = PerceptualHashIndex(self.camera.id)
+        self.assertEqual(self.found(index, 0), [media_file.id])
+
+        # Another process writes a hash to a row this index has already passed
+        MediaFile.objects.filter(id=media_file.id).update(perceptual_hash=-1)
+        self.assertEqual(self.found(index, -1), [])
+        invalidate_hash_index()
+        self.assertEqual(self.found(index, -1), [media_file.id])
+        self.assertEqual(self.found(index, 0), [])
+
+    def test_backfill_invalidates_index(self):
+        from .management.commands.process_duplicates import backfill_hashes
+
+        media_file = MediaFile.objects.create(camera=self.camera, file=self.image('photo.jpg'))
+        perceptual_hash = media_file.perceptual_hash
+        MediaFile.objects.filter(id=media_file.id).update(perceptual_hash=None)
+        # A later row moves the index past the one without a hash
+        later = self.create(~perceptual_hash)
+        index = get_hash_index(self.camera.id)
+        self.assertEqual(self.found(index, perceptual_hash), [])
+        self.assertEqual(index.last_id, later.id)
+
+        # The index held by a long-lived process sees the backfilled hash
+        self.assertEqual(backfill_hashes(MediaFile.objects.all()), 1)
+        self.assertEqual(self.found(index, perceptual_hash), [media_file.id])
+
+class BurstTests(TestCase):
+    """Session splitting, burst numbering, and incremental regrouping against a rebuild."""
+
+    start = datetime(2024, 5, 6, 7, 0, tzinfo=dt_timezone.utc)
+
+    def photo(self, seconds, burst_group='', burst_sequence=None, id=None):
+        return SimpleNamespace(
+            id=id, capture_date=self.start + timedelta(seconds=seconds),
+            burst_group=burst_group, burst_sequence=burst_sequence
+        )
+
+    def seconds(self, sessions):
+        return [[(p.capture_date - self.start).total_seconds() for p in session] for session in sessions]
+
+    def test_split_sessions_window_edges(self):
+        photos = [self.photo(s) for s in (0, 2, 4.001, 5, 7, 20)]
+        self.assertEqual(self.seconds(split_sessions(photos)), [[0, 2], [4.001, 5, 7], [20]])
+        self.assertEqual(split_sessions([]), [])
+
+    def test_assign_bursts_numbers_sessions(self):
+        pair = [self.photo(0), self.photo(1)]
+        single = [self.photo(10, 'burst_old', 2)]
+        changed = assign_bursts([pair, single])
+
+        self.assertEqual(len(changed), 3)
+        self.assertTrue(pair[0].burst_group.startswith('burst_'))
+        self.assertEqual([(p.burst_group, p.burst_sequence) for p in pair],
+                         [(pair[0].burst_group, 1), (pair[0].burst_group, 2)])
+        self.assertEqual((single[0].burst_group, single[0].burst_sequence), ('', None))
+        # Already numbered: nothing changes
+        self.assertEqual(assign_bursts([pair, single]), [])
+
+    def test_assign_bursts_keeps_group_ids(self):
+        # A stored burst split in two: the first part keeps its id, so the
+        # second falls back to the next most common one
+        first = [self.photo(0, 'burst_a', 1), self.photo(1)]
+        second = [self.photo(5, 'burst_a', 2), self.photo(6, 'burst_a', 3), self.photo(7, 'burst_b', 1)]
+        third = [self.photo(20, 'burst_b', 2), self.photo(21, 'burst_b', 3)]
+        assign_bursts([first, second, third])
+
+        self.assertEqual([(p.burst_group, p.burst_sequence) for p in first], [('burst_a', 1), ('burst_a', 2)])
+        self.assertEqual([(p.burst_group, p.burst_sequence) for p in second],
+                         [('burst_b', 1), ('burst_b', 2), ('burst_b', 3)])
+        # Each id goes to one session only
+        self.assertEqual(len({p.burst_group for p in third}), 1)
+        self.assertNotIn(third[0].burst_group, ('burst_a', 'burst_b', ''))
+
+    def create_photos(self, camera, offsets):
+        photos = MediaFile.objects.bulk_create([
+            MediaFile(
+                camera=camera, file=f'media/burst_{i}.jpg', file_type='image',
+                capture_date=self.start + timedelta(seconds=offset) if offset is not None else None
+            )
+            for i, offset in enumerate(offsets)
+        ])
+        return list(MediaFile.objects.filter(id__in=[p.id for p in photos]))
+
+    def bursts(self, camera):
+        """{frozenset of ids: [ids in sequence order]} for each burst of a camera."""
+        groups = {}
+        for m in MediaFile.objects.filter(camera=camera).exclude(burst_group='').order_by('burst_sequence'):
+            groups.setdefault(m.burst_group, []).append(m.id)
+        return {frozenset(ids): ids for ids in groups.values()}
+
+    def test_incremental_matches_rebuild(self):
+        camera = Camera.objects.create(name='Burst camera', latitude=0, longitude=0)
+        # Batches arrive out of order: later ones extend, merge and bridge earlier bursts
+        batches = [
+            [0, 1, 2, 10, 30, 33],
+            [3.5, 20, 21.5, None],
+            [31.5, 11, -1],
+            [12.5, 2.5],
+        ]
+        for offsets in batches:
+            resolve_bursts(self.create_photos(camera, offsets))
+
+        # Re-date a photo out of the middle of a burst
+        moved = MediaFile.objects.get(camera=camera, capture_date=self.start + timedelta(seconds=11))
+        moved.capture_date = self.start + timedelta(minutes=5)
+        MediaFile.objects.filter(id=moved.id).update(capture_date=moved.capture_date)
+        resolve_bursts([moved])
+
+        incremental = self.bursts(camera)
+        # A rebuild finds nothing to change, and one from scratch finds the same bursts
+        self.assertEqual(rebuild_bursts(camera.id), [])
+        MediaFile.objects.filter(camera=camera).update(burst_group='', burst_sequence=None)
+        rebuild_bursts(camera.id)
+        self.assertEqual(self.bursts(camera), incremental)
+
+        def offsets(ids):
+            dates = dict(MediaFile.objects.filter(id__in=ids).values_list('id', 'capture_date'))
+            return [(dates[i] - self.start).total_seconds() for i in ids]
+        self.assertEqual(
+            sorted(offsets(ids) for ids in incremental.values()),
+            [[-1, 0, 1, 2, 2.5, 3.5], [20, 21.5], [30, 31.5, 33]]
+        )
+        self.assertFalse(MediaFile.objects.filter(camera=camera, capture_date__isnull=True).exclude(burst_group='').exists())
+
+class RollupMaintenanceTests(TemporaryMediaMixin, TestCase):
+    """Signal-maintained rollups match a rebuild after every kind of change."""
+
+    start = datetime(2024, 3, 4, 5, 10, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        self.camera = Camera.objects.create(name='Rollup camera', latitude=0, longitude=0)
+        self.other_camera = Camera.objects.create(name='Other rollup camera', latitude=0, longitude=0)
+        self.deer = Tag.objects.create(name='deer')
+        self.fox = Tag.objects.create(name='fox')
+
+    def rollups(self):
+        return sorted(
+            SightingRollup.objects.values_list(
+                'date', 'hour', 'camera_id', 'tag_id', 'has_weather',
+                'weather_condition', 'temperature_bucket', 'count'
+            ),
+            key=repr
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(incremental, self.rollups())
+
+    def create(self, name, minutes=0, camera=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return MediaFile.objects.create(
+                camera=camera or self.camera, file=self.image(name),
+                upload_date=self.start + timedelta(minutes=minutes)
+            )
+
+    def test_ingest(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_media_files(
+                [self.image('a.jpg', 'red'), self.image('b.jpg', 'blue')],
+                self.camera, tags=[self.deer]
+            )
+        self.assertMatchesRebuild()
+        self.assertEqual(SightingRollup.objects.get(tag__isnull=True).count, 2)
+        self.assertEqual(SightingRollup.objects.get(tag=self.deer).count, 2)
+
+    def test_tag_add_remove_and_clear(self):
+        first = self.create('a.jpg')
+        second = self.create('b.jpg', minutes=20)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.tags.add(self.deer, self.fox)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deer.media_files.add(second)
+        self.assertEqual(SightingRollup.objects.get(tag=self.deer).count, 2)
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.tags.remove(self.fox)
+        self.assertFalse(SightingRollup.objects.filter(tag=self.fox).exists())
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deer.media_files.clear()
+        self.assertFalse(SightingRollup.objects.filter(tag__isnull=False).exists())
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.tags.add(self.fox)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.tags.clear()
+        self.assertFalse(SightingRollup.objects.filter(tag__isnull=False).exists())
+        self.assertMatchesRebuild()
+
+    def test_weather_create_and_delete(self):
+        media_file = self.create('a.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            media_file.tags.add(self.deer)
+        with self.captureOnCommitCallbacks(execute=True):
+            weather = WeatherData.objects.create(
+                media_file=media_file, temperature=4.2, weather_condition='Rain',
+                data_timestamp=self.start
+            )
+        self.assertEqual(
+            set(SightingRollup.objects.values_list('has_weather', 'weather_condition', 'temperature_bucket')),
+            {(True, 'Rain', 5)}
+        )
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            weather.delete()
+        self.assertEqual(
+            set(SightingRollup.objects.values_list('has_weather', 'weather_condition', 'temperature_bucket')),
+            {(False, None, None)}
+        )
+        self.assertMatchesRebuild()
+
+    def test_move_and_delete(self):
+        kept = self.create('a.jpg')
+        moved = self.create('b.jpg', minutes=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.tags.add(self.fox)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.upload_date = self.start + timedelta(hours=2)
+            moved.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            kept.camera = self.other_camera
+            kept.save(update_fields=['camera'])
+        self.assertEqual(
+            sorted(SightingRollup.objects.filter(tag__isnull=True).values_list('camera_id', 'hour', 'count')),
+            sorted([(self.camera.id, 7, 1), (self.other_camera.id, 5, 1)])
+        )
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.delete()
+        self.assertFalse(SightingRollup.objects.filter(camera=self.camera).exists())
+        self.assertMatchesRebuild()
+
+class DashboardStatsTests(TestCase):
+    """Dashboard statistics read from the rollups agree with direct counts."""
+
+    # Temperatures on, just above and just below the range edges
+    temperatures = [None, -3.5, -0.5, 0, 0.2, 9.5, 10, 10.2, 19.9, 20, 29.5, 30, 30.1, 41]
+
+    @classmethod
+    def setUpTestData(cls):
+        cameras = [
+            Camera.objects.create(name=f'Dashboard camera {i}', latitude=0, longitude=0)
+            for i in range(2)
+        ]
+        tags = {name: Tag.objects.create(name=name) for name in ('buck', 'doe', 'fox')}
+        start = datetime(2024, 6, 1, tzinfo=dt_timezone.utc)
+        media_files = MediaFile.objects.bulk_create([
+            MediaFile(camera=cameras[i % 2], file=f'media/dashboard_{i}.jpg', file_type='image',
+                      upload_date=start + timedelta(minutes=37 * i))
+            for i, _ in enumerate(cls.temperatures)
+        ])
+        WeatherData.objects.bulk_create([
+            WeatherData(media_file=media_file, temperature=temperature, data_timestamp=start,
+                        weather_condition=('Clear', 'Rain', 'Snow')[i % 3])
+            for i, (media_file, temperature) in enumerate(zip(media_files, cls.temperatures))
+            if temperature is not None
+        ])
+        TagLink = MediaFile.tags.through
+        TagLink.objects.bulk_create([
+            TagLink(mediafile_id=media_file.id, tag_id=tags[name].id)
+            for i, media_file in enumerate(media_files)
+            for name in (('buck',), ('doe',), ('buck', 'fox'), ())[i % 4]
+        ])
+        rebuild_rollups()
+
+    def direct_range_counts(self, edges, tags):
+        bounds = [(None, edges[0])] + list(zip(edges, edges[1:])) + [(edges[-1], None)]
+        ranges = []
+        for low, high in bounds:
+            media_files = MediaFile.objects.filter(weather_data__temperature__isnull=False)
+            if low is not None:
+                media_files = media_files.filter(weather_data__temperature__gt=low)
+            if high is not None:
+                media_files = media_files.filter(weather_data__temperature__lte=high)
+            ranges.append({
+                'total': media_files.count(),
+                **{f'{tag}_count': media_files.filter(tags__name=tag).count() for tag in tags}
+            })
+        return ranges
+
+    def assertSummaryMatches(self, summary, edges, tags):
+        self.assertEqual(summary['basic_stats'], {
+            'total_files': MediaFile.objects.count(),
+            **{f'{tag}_count': MediaFile.objects.filter(tags__name=tag).count() for tag in tags}
+        })
+        self.assertEqual(
+            [{key: value for key, value in row.items() if key != 'range'} for row in summary['temp_stats']],
+            self.direct_range_counts(edges, tags)
+        )
+
+    def test_sighting_summary(self):
+        summary = get_sighting_summary()
+        self.assertSummaryMatches(summary, [0, 10, 20, 30], ['buck', 'doe'])
+        self.assertEqual(
+            [(row['range'], row['total']) for row in summary['temp_stats']],
+            [('Below 0°C', 3), ('0-10°C', 3), ('10-20°C', 3), ('20-30°C', 2), ('Above 30°C', 2)]
+        )
+
+    @override_settings(DASHBOARD_TEMPERATURE_EDGES=[-1, 10, 30], DASHBOARD_SIGHTING_TAGS=['fox', 'doe'])
+    def test_sighting_summary_configured(self):
+        summary = get_sighting_summary()
+        self.assertSummaryMatches(summary, [-1, 10, 30], ['fox', 'doe'])
+        self.assertEqual([row['range'] for row in summary['temp_stats']],
+                         ['Below -1°C', '-1-10°C', '10-30°C', 'Above 30°C'])
+        self.assertSummaryMatches(get_sighting_summary([5, 25], ['buck']), [5, 25], ['buck'])
+
+    def direct_weather_impact(self, tags):
+        impact = []
+        for condition in WeatherData.objects.values_list('weather_condition', flat=True).distinct():
+            counts = {
+                f'{tag}_count': MediaFile.objects.filter(
+                    weather_data__weather_condition=condition, tags__name=tag
+                ).count()
+                for tag in tags
+            }
+            if any(counts.values()):
+                impact.append({'condition': condition, **counts, 'total': sum(counts.values())})
+        return sorted(impact, key=lambda row: row['condition'])
+
+    def test_weather_impact(self):
+        for tags in (None, ['fox'], ['doe', 'fox']):
+            impact = get_weather_impact(tags)
+            self.assertEqual(sorted(impact, key=lambda row: row['condition']),
+                             self.direct_weather_impact(tags or ['buck', 'doe']))
+            totals = [row['total'] for row in impact]
+            self.assertEqual(totals, sorted(totals, reverse=True))
+
+        with override_settings(DASHBOARD_SIGHTING_TAGS=['fox']):
+            self.assertEqual(sorted(get_weather_impact(), key=lambda row: row['condition']),
+                             self.direct_weather_impact(['fox']))
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CachedViewTests(TemporaryMediaMixin, TestCase):
+    """Cached payloads survive a broken cache and are dropped by the change signals."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('cache@example.com', password='secret')
+        cls.camera = Camera.objects.create(name='Cache camera', latitude=0, longitude=0)
+        cls.tag = Tag.objects.create(name='buck')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_cache_errors_fall_back_to_compute(self):
+        cache = cache_utils.get_cache()
+        with mock.patch.object(cache, 'set', side_effect=ConnectionError('down')), \
+                self.assertLogs('core.cache_utils', 'ERROR'):
+            self.assertEqual(cache_utils.cached(DASHBOARD, {}, lambda: 'fresh'), 'fresh')
+        self.assertEqual(cache_utils.cached(DASHBOARD, {}, lambda: 'second'), 'second')
+        self.assertEqual(cache_utils.cached(DASHBOARD, {}, lambda: 'third'), 'second')
+        with mock.patch.object(cache, 'get', side_effect=ConnectionError('down')), \
+                self.assertLogs('core.cache_utils', 'ERROR'):
+            self.assertEqual(cache_utils.cached(DASHBOARD, {}, lambda: 'fourth'), 'fourth')
+
+    def dashboard_stats(self):
+        return self.client.get(reverse('dashboard'), secure=True).context['basic_stats']
+
+    def assertBusts(self, change, **expected):
+        generation = cache_utils.get_generation(DASHBOARD)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertNotEqual(cache_utils.get_generation(DASHBOARD), generation)
+        stats = self.dashboard_stats()
+        self.assertEqual({key: stats[key] for key in expected}, expected)
+
+    def test_changes_bust_dashboard(self):
+        self.assertEqual(self.dashboard_stats()['total_files'], 0)
+        media_file = MediaFile(camera=self.camera, file=self.image('a.jpg'))
+        self.assertBusts(media_file.save, total_files=1, buck_count=0)
+        self.assertBusts(lambda: media_file.tags.add(self.tag), total_files=1, buck_count=1)
+        self.assertBusts(
+            lambda: WeatherData.objects.create(media_file=media_file, temperature=12, data_timestamp=timezone.now())
+        )
+        self.assertEqual(self.client.get(reverse('dashboard'), secure=True).context['temp_stats'][2]['total'], 1)
+        self.assertBusts(lambda: media_file.tags.remove(self.tag), total_files=1, buck_count=0)
+        self.assertBusts(media_file.delete, total_files=0)
+
+class MediaListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('viewer@example.com', password='secret')
+        camera = Camera.objects.create(name='List camera', latitude=0, longitude=0)
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        MediaFile.objects.bulk_create([
+            MediaFile(camera=camera, file=f'media/clip{i}.mp4', file_type='video',
+                      upload_date=start + timedelta(minutes=i))
+            for i in range(5)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.enterContext(mock.patch('core.views.MEDIA_PAGE_SIZE', 2))
+        self.enterContext(mock.patch('core.views.MEDIA_COUNT_LIMIT', 3))
+
+    def test_total_counted_on_first_page_only(self):
+        response = self.client.get(reverse('media_list'), secure=True)
+        self.assertEqual(response.context['total_count'], 3)
+        self.assertTrue(response.context['total_count_capped'])
+        self.assertContains(response, '3+ files')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('media_list'), {'cursor': response.context['next_cursor']}, secure=True
+            )
+        self.assertEqual(len(response.context['media_files']), 2)
+        self.assertIsNone(response.context['total_count'])
+        self.assertFalse(any('COUNT(' in query['sql'].upper() for query in queries))
+
+class CameraMapTests(TestCase):
+    """build_camera_map runs a fixed number of queries and finds each camera's latest images."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cameras = [
+            Camera.objects.create(name=f'Map camera {i}', latitude=40 + i, longitude=-100 - 2 * i)
+            for i in range(5)
+        ]
+        start = datetime(2024, 2, 1, tzinfo=dt_timezone.utc)
+        media_files = []
+        for i, camera in enumerate(cls.cameras[:4]):
+            for n in range(3 * i + 1):
+                # Videos are skipped, and every third pair shares an upload date
+                media_files.append(MediaFile(
+                    camera=camera, file=f'media/map_{i}_{n}.{"mp4" if n % 4 == 3 else "jpg"}',
+                    file_type='video' if n % 4 == 3 else 'image',
+                    upload_date=start + timedelta(days=i, hours=n - n % 3 // 2)
+                ))
+        MediaFile.objects.bulk_create(media_files)
+        refresh_camera_stats()
+
+    def setUp(self):
+        # The fixture rows have no stored files to render thumbnails from
+        self.enterContext(mock.patch.object(MediaFile, 'rendition_url', lambda media, name: f'/{name}/{media.id}'))
+
+    def test_query_count(self):
+        with self.assertNumQueries(2):
+            camera_map = build_camera_map()
+        self.assertEqual(len(camera_map['cameras']), 5)
+
+    def test_matches_per_camera_queries(self):
+        camera_map = build_camera_map()
+        for camera in camera_map['cameras']:
+            recent = MediaFile.objects.filter(camera=camera, file_type='image').order_by('-upload_date', '-id')[:5]
+            self.assertEqual([media['id'] for media in camera.recent_media], [media.id for media in recent])
+            self.assertEqual(
+                (camera.media_count, camera.latest_media_date),
+                (camera.media_files.count(), camera.media_files.aggregate(latest=Max('upload_date'))['latest'])
+            )
+        self.assertEqual([len(camera.recent_media) for camera in camera_map['cameras']], [1, 3, 5, 5, 0])
+        self.assertAlmostEqual(camera_map['map_center']['lat'], 42)
+        self.assertAlmostEqual(camera_map['map_center']['lon'], -104)
+
+    def test_date_filter(self):
+        camera_map = build_camera_map(start_date=datetime(2024, 2, 2).date(), end_date=datetime(2024, 2, 3).date())
+        self.assertEqual([camera.id for camera in camera_map['cameras']], [c.id for c in self.cameras[1:3]])
+        # Counts stay those of the whole camera, not of the filtered rows
+        self.assertEqual([camera.media_count for camera in camera_map['cameras']], [4, 7])
+
+class FakeS3Storage:
+    """Just enough of S3Boto3Storage for the DeleteObjects path."""
+    bucket_name = 'media-bucket'
+
+    def __init__(self, responses):
+        self.client = mock.Mock()
+        self.client.delete_objects.side_effect = responses
+        self.bucket = SimpleNamespace(meta=SimpleNamespace(client=self.client))
+
+    def _normalize_name(self, name):
+        return f'media/{name}'
+
+class PurgeTests(TemporaryMediaMixin, TestCase):
+    """Journaling deleted media files and renditions, and purging them from storage."""
+
+    def setUp(self):
+        super().setUp()
+        self.camera = Camera.objects.create(name='Purge camera', latitude=0, longitude=0)
+        self.original = self.create('original.jpg', 'red')
+        self.duplicate = self.create('duplicate.jpg', 'red')
+        self.other = self.create('other.jpg', 'blue')
+        self.video = self.create('clip.mp4')
+
+        renditions_root = tempfile.TemporaryDirectory()
+        self.addCleanup(renditions_root.cleanup)
+        self.renditions = FileSystemStorage(location=renditions_root.name)
+
+    def create(self, name, color=None):
+        upload = self.image(name, color) if color else SimpleUploadedFile(name, b'\x00' * 64)
+        media_file = MediaFile(camera=self.camera, file=upload)
+        media_file.save()
+        return media_file
+
+    def test_journal_includes_renditions(self):
+        renditions = rendition_names(self.original) + rendition_names(self.other)
+        self.assertEqual(len(renditions), 6)
+        self.assertEqual(rendition_names(self.video), [])
+
+        deleted = MediaFile.objects.filter(id__in=[self.original.id, self.other.id, self.video.id])
+        count, size = delete_media_files(deleted)
+        self.assertEqual(count, 3)
+        self.assertEqual(size, self.original.file_size + self.other.file_size + self.video.file_size)
+        self.assertFalse(deleted.exists())
+
+        self.assertEqual(
+            set(PurgeEntry.objects.filter(is_rendition=False).values_list('name', flat=True)),
+            {self.original.file.name, self.other.file.name, self.video.file.name}
+        )
+        self.assertEqual(
+            set(PurgeEntry.objects.filter(is_rendition=True).values_list('name', flat=True)),
+            set(renditions)
+        )
+        self.assertTrue(Job.objects.filter(name='purge').exists())
+
+    def test_purge_deletes_files_and_renditions(self):
+        for media_file in (self.original, self.duplicate, self.other):
+            for name in rendition_names(media_file):
+                self.renditions.save(name, ContentFile(b'rendition'))
+        delete_media_files(MediaFile.objects.filter(id__in=[self.original.id, self.other.id, self.video.id]))
+        # A stale entry for a file that is still referenced
+        PurgeEntry.objects.create(name=self.duplicate.file.name)
+
+        self.assertEqual(purge_storage(renditions_storage=self.renditions), 10)
+        self.assertFalse(PurgeEntry.objects.exists())
+
+        for media_file in (self.original, self.other, self.video):
+            self.assertFalse(default_storage.exists(media_file.file.name))
+        self.assertFalse(any(
+            self.renditions.exists(name)
+            for name in rendition_names(self.original) + rendition_names(self.other)
+        ))
+        # The duplicate keeps its file and renditions (named after its own file)
+        self.assertTrue(default_storage.exists(self.duplicate.file.name))
+        self.assertTrue(all(self.renditions.exists(name) for name in rendition_names(self.duplicate)))
+
+    def test_s3_delete_errors(self):
+        storage = FakeS3Storage([
+            {'Errors': [{'Key': 'media/b.jpg', 'Code': 'AccessDenied', 'Message': 'Access Denied'}]},
+            ConnectionError('timed out'),
+        ])
+        with mock.patch('core.purge_utils.PURGE_BATCH_SIZE', 2):
+            errors = delete_objects(['a.jpg', 'b.jpg', 'c.jpg'], storage)
+
+        self.assertEqual(errors, {'b.jpg': 'AccessDenied: Access Denied', 'c.jpg': 'timed out'})
+        first, second = storage.client.delete_objects.call_args_list
+        self.assertEqual(first.kwargs['Bucket'], 'media-bucket')
+        self.assertEqual(first.kwargs['Delete']['Objects'], [{'Key': 'media/a.jpg'}, {'Key': 'media/b.jpg'}])
+        self.assertEqual(second.kwargs['Delete']['Objects'], [{'Key': 'media/c.jpg'}])
+
+    def test_failed_deletes_stay_in_journal(self):
+        delete_media_files(MediaFile.objects.filter(id=self.video.id))
+        name = self.video.file.name
+        storage = FakeS3Storage([
+            {'Errors': [{'Key': f'media/{name}', 'Code': 'AccessDenied', 'Message': 'Access Denied'}]},
+        ])
+        with self.assertRaises(RuntimeError):
+            purge_storage(storage=storage, renditions_storage=self.renditions)
+
+        entry = PurgeEntry.objects.get()
+        self.assertEqual((entry.name, entry.attempts), (name, 1))
+        self.assertEqual(entry.last_error, 'AccessDenied: Access Denied')
+
+class JobQueueTests(TestCase):
+    """Claiming, concurrency limits, retries and stale lock release in core.jobs."""
+
+    def setUp(self):
+        self.calls = []
+        self.enterContext(mock.patch.dict(jobs._handlers, clear=True))
+        jobs.job('ok')(lambda **payload: self.calls.append(payload))
+        jobs.job('single', concurrency=1)(lambda **payload: None)
+        jobs.job('flaky', max_attempts=2)(self.fail_job)
+
+    def fail_job(self, **payload):
+        raise ValueError('boom')
+
+    def test_claim_marks_jobs_running(self):
+        queued = jobs.enqueue_many('ok', [{'n': 1}, {'n': 2}, {'n': 3}])
+        claimed = jobs.claim_jobs('worker-a', 2)
+        self.assertEqual([job.id for job in claimed], [job.id for job in queued[:2]])
+        for job in claimed:
+            self.assertEqual((job.status, job.locked_by, job.attempts), (Job.STATUS_RUNNING, 'worker-a', 1))
+
+        # Another worker only gets what is left
+        self.assertEqual([job.id for job in jobs.claim_jobs('worker-b', 5)], [queued[2].id])
+        self.assertEqual(jobs.claim_jobs('worker-c', 5), [])
+
+    def test_claim_skips_future_and_other_jobs(self):
+        jobs.enqueue('ok', delay=timedelta(minutes=5))
+        other = jobs.enqueue('single')
+        self.assertEqual(jobs.claim_jobs('worker-a', 5, names=['ok']), [])
+        self.assertEqual([job.id for job in jobs.claim_jobs('worker-a', 5)], [other.id])
+        self.assertEqual(jobs.claim_jobs('worker-a', 0), [])
+
+    def test_concurrency_limit_across_workers(self):
+        jobs.enqueue_many('single', [{}, {}])
+        plain = jobs.enqueue('ok')
+        first = jobs.claim_jobs('worker-a', 5)
+        self.assertEqual(sorted(job.name for job in first), ['ok', 'single'])
+        # The other 'single' job waits while one is running anywhere
+        self.assertEqual(jobs.claim_jobs('worker-b', 5), [])
+
+        jobs.run_job(next(job for job in first if job.name == 'single'))
+        self.assertEqual([job.name for job in jobs.claim_jobs('worker-b', 5)], ['single'])
+        self.assertTrue(Job.objects.filter(id=plain.id, status=Job.STATUS_RUNNING).exists())
+
+    def test_success_deletes_job(self):
+        jobs.enqueue('ok', media_file_ids=[1, 2])
+        job, = jobs.claim_jobs('worker-a', 1)
+        self.assertTrue(jobs.run_job(job))
+        self.assertEqual(self.calls, [{'media_file_ids': [1, 2]}])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failure_retries_with_backoff_then_fails(self):
+        queued = jobs.enqueue('flaky')
+        self.assertEqual(queued.max_attempts, 2)
+
+        job, = jobs.claim_jobs('worker-a', 1)
+        before = timezone.now()
+        self.assertFalse(jobs.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.locked_at), (Job.STATUS_PENDING, '', None))
+        self.assertGreaterEqual(job.run_after, before + jobs.RETRY_BASE_DELAY)
+        self.assertIn('ValueError: boom', job.last_error)
+        # Not due again until the backoff has passed
+        self.assertEqual(jobs.claim_jobs('worker-a', 1), [])
+
+        Job.objects.filter(id=job.id).update(run_after=timezone.now())
+        job, = jobs.claim_jobs('worker-a', 1)
+        self.assertEqual(job.attempts, 2)
+        self.assertFalse(jobs.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+
+    def test_unknown_handler_fails_immediately(self):
+        jobs.enqueue('missing')
+        job, = jobs.claim_jobs('worker-a', 1)
+        self.assertFalse(jobs.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+
+    def test_retry_delay(self):
+        self.assertEqual(
+            [jobs.retry_delay(attempts) for attempts in (1, 2, 3)],
+            [timedelta(seconds=30), timedelta(minutes=1), timedelta(minutes=2)]
+        )
+        self.assertEqual(jobs.retry_delay(20), jobs.RETRY_MAX_DELAY)
+
+    def test_release_stale_jobs(self):
+        jobs.enqueue_many('ok', [{}, {}])
+        stale, fresh = jobs.claim_jobs('worker-a', 2)
+        Job.objects.filter(id=stale.id).update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(jobs.release_stale_jobs(timedelta(minutes=10)), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, stale.locked_by), (Job.STATUS_PENDING, ''))
+        self.assertEqual(fresh.status, Job.STATUS_RUNNING)
+        self.assertEqual([job.id for job in jobs.claim_jobs('worker-b', 5)], [stale.id])
+
+    def test_heartbeat_keeps_long_jobs(self):
+        jobs.enqueue_many('ok', [{}, {}])
+        alive, = jobs.claim_jobs('worker-a', 1)
+        dead, = jobs.claim_jobs('worker-b', 1)
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+
+        worker = jobs.Worker()
+        worker.worker_id = 'worker-a'
+        self.assertEqual(worker.heartbeat(), 1)
+        self.assertEqual(jobs.release_stale_jobs(timedelta(minutes=10)), 1)
+
+        alive.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual((alive.status, alive.locked_by), (Job.STATUS_RUNNING, 'worker-a'))
+        self.assertEqual((dead.status, dead.locked_by), (Job.STATUS_PENDING, ''))
+        # Finished or requeued jobs are not touched
+        self.assertEqual(jobs.heartbeat('worker-b'), 0)
+
+    def test_heartbeat_interval_within_lock_timeout(self):
+        with override_settings(JOB_LOCK_TIMEOUT=600):
+            self.assertEqual(jobs.heartbeat_interval(), 150)
+
+class FindExifBlockTests(SimpleTestCase):
+    """Walking JPEG segment headers to the EXIF APP1 payload."""
+
+    def setUp(self):
+        exif = Image.Exif()
+        exif[ExifTags.Base.Make] = 'Trailcam'
+        exif[ExifTags.Base.Model] = 'TC-1'
+        exif.get_ifd(ExifTags.IFD.Exif)[ExifTags.Base.DateTimeOriginal] = '2024:05:06 07:08:09'
+        self.exif_block = exif.tobytes()
+        # PIL writes a JFIF APP0 segment before the EXIF APP1 segment
+        self.jpeg = jpeg_bytes(exif=self.exif_block)
+        self.reads = []
+
+    def read_more(self, start, length):
+        self.reads.append((start, length))
+        return self.jpeg[start:start + length]
+
+    def test_jpeg_with_exif(self):
+        block = exif_utils.find_exif_block(self.jpeg, self.read_more)
+        self.assertEqual(block, self.exif_block[len(exif_utils.EXIF_HEADER):])
+        self.assertEqual(self.reads, [])
+
+        record = exif_utils.parse_exif(block)
+        self.assertEqual((record.camera_make, record.camera_model), ('Trailcam', 'TC-1'))
+        self.assertEqual(record.capture_date.replace(tzinfo=None), datetime(2024, 5, 6, 7, 8, 9))
+
+    def test_short_header_reads_more(self):
+        block = exif_utils.find_exif_block(self.jpeg[:8], self.read_more)
+        self.assertEqual(block, self.exif_block[len(exif_utils.EXIF_HEADER):])
+        # One read ahead covers the remaining segment headers
+        self.assertEqual(self.reads, [(8, exif_utils.EXIF_READ_SIZE)])
+
+    def test_jpeg_without_exif(self):
+        self.jpeg = jpeg_bytes()
+        self.assertIsNone(exif_utils.find_exif_block(self.jpeg[:16], self.read_more))
+        self.assertIsNone(exif_utils.read_file_exif(io.BytesIO(self.jpeg)))
+
+    def test_truncated_file(self):
+        app1 = self.jpeg.index(b'\xff\xe1')
+        for size in (1, 3, app1 + 2, app1 + 8, app1 + 20):
+            self.jpeg = self.jpeg[:size]
+            self.assertIsNone(exif_utils.find_exif_block(self.jpeg, self.read_more), size)
+
+    def test_not_a_jpeg(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'PNG')
+        self.assertIsNone(exif_utils.find_exif_block(buffer.getvalue(), self.read_more))
+        self.assertIsNone(exif_utils.find_exif_block(b'\xff\xd8garbage', self.read_more))
+        self.assertIsNone(exif_utils.find_exif_block(b'', self.read_more))
+        self.assertEqual(self.reads, [])
+
+    def test_read_file_exif_rewinds(self):
+        f = io.BytesIO(self.jpeg)
+        record = exif_utils.read_file_exif(f)
+        self.assertEqual(record.camera_make, 'Trailcam')
+        self.assertEqual(f.tell(), 0)
+
+class HotQueryPlanTests(TestCase):
+    """
+    The filters on MediaFile that run on every upload, sweep and listing
+    must be served by an index. Each test builds the query the way the
+    code does and checks its EXPLAIN output, so a schema change that drops
+    or breaks an index fails here instead of in production.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.camera = Camera.objects.create(name='Plan camera', latitude=0, longitude=0)
+        cls.date = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables are always cheaper to scan; only fall back to
+            # a sequential scan when no index can serve the query at all
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, *index_names, by_rowid=False):
+        """
+        Assert that the plan reads core_mediafile through an index.
+
+        Args:
+            queryset (QuerySet): The query to explain
+            *index_names (str): Indexes allowed to serve it (any if empty)
+            by_rowid (bool): Also accept SQLite rowid lookups, for queries
+                     that look rows up by id from another index (full-text)
+        """
+        plan = self.explain(queryset)
+        table = MediaFile._meta.db_table
+
+        if connection.vendor == 'sqlite':
+            lines = [line for line in plan.splitlines() if re.search(rf'\b{table}\b', line)]
+            self.assertTrue(lines, plan)
+            access = r'USING ((COVERING )?INDEX|INTEGER PRIMARY KEY)' if by_rowid else r'USING (COVERING )?INDEX'
+            for line in lines:
+                self.assertRegex(line, access, plan)
+        elif connection.vendor == 'postgresql':
+            self.assertNotIn(f'Seq Scan on {table}', plan)
+            self.assertIn('Index', plan)
+        else:
+            self.skipTest(f'No plan checks for {connection.vendor}')
+
+        if index_names:
+            self.assertTrue(
+                any(name in plan for name in index_names),
+                f'Expected one of {index_names} in:\n{plan}'
+            )
+
+    def test_exact_duplicate_lookup(self):
+        # check_duplicates
+        queryset = (
+            MediaFile.objects
+            .filter(file_hash='0' * 64, camera=self.camera)
+            .exclude(id=1)
+            .order_by('upload_date')
+        )
+        self.assertUsesIndex(queryset, 'mediafile_hash_camera_idx', 'mediafile_camera_upload_idx')
+
+    def test_exact_duplicate_batch_lookup(self):
+        # resolve_duplicates
+        queryset = (
+            MediaFile.objects
+            .filter(camera_id=self.camera.id, file_hash__in=['0' * 64, '1' * 64])
+            .order_by('upload_date', 'id')
+            .values_list('id', 'file_hash')
+        )
+        self.assertUsesIndex(queryset, 'mediafile_hash_camera_idx', 'mediafile_camera_upload_idx')
+
+    def test_camera_upload_sweep(self):
+        # resolve_camera_duplicates
+        queryset = MediaFile.objects.filter(camera_id=self.camera.id).order_by('upload_date', 'id')
+        self.assertUsesIndex(queryset, 'mediafile_camera_upload_idx')
+
+    def test_camera_hour_range(self):
+        # refresh_rollups
+        queryset = MediaFile.objects.filter(
+            camera_id=self.camera.id,
+            upload_date__gte=self.date,
+            upload_date__lt=self.date + timedelta(hours=1)
+        )
+        self.assertUsesIndex(queryset, 'mediafile_camera_upload_idx')
+
+    def test_media_list_by_camera(self):
+        # media_list, newest first with keyset pagination
+        queryset = MediaFile.objects.filter(camera=self.camera).order_by('-upload_date', '-id')
+        self.assertUsesIndex(queryset, 'mediafile_camera_upload_idx')
+
+    def test_burst_window(self):
+        # resolve_bursts
+        queryset = MediaFile.objects.filter(
+            camera_id=self.camera.id,
+            capture_date__range=(self.date, self.date + timedelta(minutes=1))
+        ).order_by()
+        self.assertUsesIndex(queryset, 'mediafile_camera_capture_idx')
+
+    def test_burst_rebuild(self):
+        # rebuild_bursts
+        queryset = MediaFile.objects.filter(camera_id=self.camera.id).order_by('capture_date', 'id')
+        self.assertUsesIndex(queryset, 'mediafile_camera_capture_idx')
+
+    def test_burst_group_members(self):
+        # resolve_bursts
+        queryset = (
+            MediaFile.objects
+            .filter(camera_id=self.camera.id, burst_group__in=['burst_0001'])
+            .exclude(burst_group='')
+            .order_by()
+        )
+        self.assertUsesIndex(queryset, 'mediafile_burst_group_idx')
+
+    def test_duplicate_listing(self):
+        # manage_duplicates
+        queryset = MediaFile.objects.filter(
+            is_duplicate=True,
+            duplicate_of__isnull=False
+        ).order_by('-upload_date')
+        self.assertUsesIndex(queryset, 'mediafile_duplicate_idx')
+
+    def test_duplicate_listing_by_camera(self):
+        # manage_duplicates, filtered by camera
+        queryset = MediaFile.objects.filter(
+            is_duplicate=True,
+            duplicate_of__isnull=False,
+            camera_id=self.camera.id
+        ).order_by('-upload_date')
+        self.assertUsesIndex(queryset)
+
+    def test_full_text_search(self):
+        # media_list search
+        queryset = search_media(MediaFile.objects.all(), 'buck feeder')
+        self.assertUsesIndex(queryset, FTS_TABLE, 'mediafile_search_vector_idx', by_rowid=True)
+
+class FakeClassifier:
+    """Stands in for the TFLite deer classifier in classify_media's worker processes."""
+    label = None
+
+    @classmethod
+    def init_worker(cls, batch_size):
+        from .management.commands import classify_media
+        classify_media._classifier = cls()
+
+    def predict_batch(self, images):
+        return [{self.label: 0.9} if self.label else {} for _ in images]
+
+    def get_best_prediction(self, predictions):
+        return max(predictions.items(), key=lambda item: item[1]) if predictions else (None, 0)
+
+class SearchTests(TemporaryMediaMixin, TestCase):
+    """Full-text search over the search documents, and keeping them current."""
+
+    def setUp(self):
+        super().setUp()
+        self.camera = Camera.objects.create(name='North Feeder', latitude=0, longitude=0)
+        other_camera = Camera.objects.create(name='Creek Crossing', latitude=0, longitude=0)
+        self.buck = Tag.objects.create(name='buck')
+        self.doe = Tag.objects.create(name='doe')
+
+        self.antlers = self.create('antlers.mp4', self.camera, 'Eight-point rack at dusk', [self.buck])
+        self.pair = self.create('pair.mp4', self.camera, 'Two deer feeding', [self.buck, self.doe])
+        self.creek = self.create('creek.mp4', other_camera, 'Doe crossing the creek', [self.doe])
+
+    def create(self, name, camera, description, tags):
+        media_file = MediaFile.objects.create(
+            camera=camera, description=description,
+            file=SimpleUploadedFile(name, name.encode())
+        )
+        media_file.tags.add(*tags)
+        return media_file
+
+    def search(self, query, queryset=None):
+        return set(search_media(queryset or MediaFile.objects.all(), query).values_list('id', flat=True))
+
+    def test_prefix_matching(self):
+        self.assertEqual(self.search('feed'), {self.antlers.id, self.pair.id})
+        self.assertEqual(self.search('bu'), {self.antlers.id, self.pair.id})
+        self.assertEqual(self.search('rack'), {self.antlers.id})
+        self.assertEqual(self.search('racks'), set())
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.search('doe north'), {self.pair.id})
+        self.assertEqual(self.search('North   DOE!'), {self.pair.id})
+        self.assertEqual(self.search('doe'), {self.pair.id, self.creek.id})
+        self.assertEqual(self.search('doe moose'), set())
+        # Query syntax is stripped rather than passed to the search engine
+        self.assertEqual(self.search('"doe" OR* (moose'), set())
+        self.assertEqual(self.search('  -*  '), set())
+
+    def test_filters_and_ranking_combine(self):
+        self.assertEqual(self.search('doe', MediaFile.objects.filter(camera=self.camera)), {self.pair.id})
+        ranked = list(search_media(MediaFile.objects.all(), 'doe', ranked=True))
+        self.assertEqual({m.id for m in ranked}, {self.pair.id, self.creek.id})
+        self.assertTrue(all(isinstance(m.search_rank, float) for m in ranked))
+
+    def test_description_edit(self):
+        self.antlers.description = 'Bedded down'
+        self.antlers.save(update_fields=['description'])
+        self.assertEqual(self.search('rack'), set())
+        self.assertEqual(self.search('bedded'), {self.antlers.id})
+
+    def test_camera_rename(self):
+        self.camera.name = 'South Ridge'
+        self.camera.save()
+        self.assertEqual(self.search('ridge'), {self.antlers.id, self.pair.id})
+        self.assertEqual(self.search('feeder'), set())
+
+    def test_tag_rename(self):
+        self.buck.name = 'stag'
+        self.buck.save()
+        self.assertEqual(self.search('stag'), {self.antlers.id, self.pair.id})
+        self.assertEqual(self.search('buck'), set())
+
+    def test_tag_links(self):
+        self.antlers.tags.remove(self.buck)
+        self.creek.tags.add(self.buck)
+        self.assertEqual(self.search('buck'), {self.pair.id, self.creek.id})
+
+        self.pair.tags.clear()
+        self.assertEqual(self.search('buck'), {self.creek.id})
+        self.assertEqual(self.search('doe'), {self.creek.id})
+
+    def test_reverse_tag_clear(self):
+        # The files losing the tag are only known before the clear (pre_clear)
+        self.doe.media_files.clear()
+        self.assertEqual(self.search('doe'), {self.creek.id})
+        self.assertEqual(self.search('buck'), {self.antlers.id, self.pair.id})
+
+    def test_classification_updates_documents(self):
+        from .management.commands import classify_media
+
+        photo = MediaFile.objects.create(camera=self.camera, file=self.image('photo.jpg'))
+        self.assertEqual(self.search('buck'), {self.antlers.id, self.pair.id})
+
+        def classify(label, reset=False):
+            FakeClassifier.label = label
+            with mock.patch.object(classify_media, 'init_worker', FakeClassifier.init_worker):
+                call_command('classify_media', workers=1, reset=reset, stdout=io.StringIO())
+
+        classify('buck')
+        self.assertEqual(self.search('buck'), {self.antlers.id, self.pair.id, photo.id})
+        # A reset removes the buck/doe tags, and nothing clears the threshold this time
+        classify(None, reset=True)
+        self.assertEqual(self.search('buck'), set())
+        self.assertEqual(self.search('doe'), {self.creek.id})
+
+    def test_deleted_files_leave_the_index(self):
+        self.pair.delete()
+        self.assertEqual(self.search('feed'), {self.antlers.id})
+
+WEATHER_RESPONSE = {
+    'dt': 1704110400,
+    'main': {'temp': -3.5, 'feels_like': -8.0, 'humidity': 80},
+    'wind': {'speed': 4.1, 'deg': 270},
+    'weather': [{'description': 'light snow', 'icon': '13d'}],
+}
+
+HISTORY_RESPONSE = {
+    'lat': 45.0,
+    'lon': -93.0,
+    'data': [{
+        'dt': 1704106800,
+        'temp': 2.0,
+        'feels_like': -1.0,
+        'humidity': 65,
+        'wind_speed': 3.0,
+        'wind_deg': 180,
+        'weather': [{'description': 'overcast clouds', 'icon': '04n'}],
+    }],
+}
+
+class StubWeatherHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.paths.append(self.path)
+        server.clients.add(self.client_address)
+        status = server.statuses.pop(0) if server.statuses else 200
+        payload = HISTORY_RESPONSE if 'timemachine' in self.path else WEATHER_RESPONSE
+        body = json.dumps(payload if status == 200 else {'message': 'error'}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@override_settings(OPENWEATHER_API_KEY='test-key', WEATHER_BACKOFF_SECONDS=0.01, WEATHER_MAX_RETRIES=3)
+class WeatherClientTests(SimpleTestCase):
+    """The weather client against a local stub of the OpenWeather API."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubWeatherHandler)
+        self.server.paths = []
+        self.server.clients = set()
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.session = requests.Session()
+        self.addCleanup(self.session.close)
+        self.api = WeatherAPI(
+            base_url=f'http://127.0.0.1:{self.server.server_port}',
+            session=self.session,
+            limiter=TokenBucket(6000)
+        )
+
+    def test_parses_response(self):
+        data = self.api.get_weather_data(45.0, -93.0)
+        self.assertEqual(data['temperature'], -3.5)
+        self.assertEqual(data['weather_condition'], 'light snow')
+        self.assertIn('lat=45.0', self.server.paths[0])
+
+    def test_retries_rate_limit_and_server_errors(self):
+        self.server.statuses = [429, 503]
+        data = self.api.get_weather_data(45.0, -93.0)
+        self.assertEqual(data['humidity'], 80)
+        self.assertEqual(len(self.server.paths), 3)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.statuses = [500] * 10
+        self.assertIsNone(self.api.get_weather_data(45.0, -93.0))
+        self.assertEqual(len(self.server.paths), 4)
+
+    def test_does_not_retry_client_errors(self):
+        self.server.statuses = [401]
+        self.assertIsNone(self.api.get_weather_data(45.0, -93.0))
+        self.assertEqual(len(self.server.paths), 1)
+
+    def test_reuses_connection(self):
+        for _ in range(3):
+            self.api.get_weather_data(45.0, -93.0)
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_historical_reading(self):
+        provider = OpenWeatherProvider(self.api)
+        when = datetime(2024, 1, 1, 11, 20, tzinfo=dt_timezone.utc)
+        data = provider.get_weather(45.0, -93.0, weather_slot(when, provider.resolution))
+        self.assertEqual(data['weather_condition'], 'overcast clouds')
+        self.assertEqual(data['data_timestamp'], datetime(2024, 1, 1, 11, tzinfo=dt_timezone.utc))
+        self.assertIn('/data/3.0/onecall/timemachine', self.server.paths[0])
+        self.assertIn('dt=1704106800', self.server.paths[0])
+
+    def test_weather_slot_is_nearest_hour(self):
+        when = datetime(2024, 1, 1, 11, 40, tzinfo=dt_timezone.utc)
+        self.assertEqual(weather_slot(when, 3600), datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc))
+        self.assertEqual(
+            weather_slot(when - timedelta(minutes=20), 3600),
+            datetime(2024, 1, 1, 11, tzinfo=dt_timezone.utc)
+        )
+
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(600, capacity=1)
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        # One token up front, then one every 0.1 seconds
+        self.assertGreaterEqual(time.monotonic() - start, 0.25)
+
+class WeatherCacheTests(TestCase):
+    """The in-memory LRU, database tier and request coalescing of WeatherCache."""
+
+    def setUp(self):
+        self.cache = WeatherCache(grid_degrees=0.01, bucket_seconds=600, max_entries=2)
+        self.when = datetime(2024, 1, 15, 12, 3, tzinfo=dt_timezone.utc)
+        self.fetched = []
+
+    def fetch(self, temperature=-3.5):
+        def fetch():
+            self.fetched.append(temperature)
+            return {
+                'temperature': temperature,
+                'humidity': 80,
+                'data_timestamp': datetime(2024, 1, 15, 12, 0, tzinfo=dt_timezone.utc),
+            }
+        return fetch
+
+    def test_lru_eviction(self):
+        first = self.cache.get(45.0, -93.0, self.when, self.fetch(1))
+        self.cache.get(46.0, -93.0, self.when, self.fetch(2))
+        # Same cell and bucket: served from memory and marked recently used
+        self.assertIs(self.cache.get(45.001, -93.001, self.when + timedelta(minutes=5), self.fetch(9)), first)
+        self.cache.get(47.0, -93.0, self.when, self.fetch(3))
+
+        self.assertEqual(self.fetched, [1, 2, 3])
+        self.assertEqual(list(self.cache.entries), [
+            self.cache.make_key(45.0, -93.0, self.when),
+            self.cache.make_key(47.0, -93.0, self.when),
+        ])
+        # The evicted reading comes back from the database, not the API
+        self.assertEqual(self.cache.get(46.0, -93.0, self.when, self.fetch(9))['temperature'], 2)
+        self.assertEqual(self.cache.stats, {'memory': 1, 'database': 1, 'fetched': 3, 'coalesced': 0})
+
+    def test_database_round_trip(self):
+        stored = self.cache.get(45.0, -93.0, self.when, self.fetch())
+        entry = WeatherCacheEntry.objects.get()
+        self.assertEqual(entry.bucket, datetime(2024, 1, 15, 12, 0, tzinfo=dt_timezone.utc))
+        self.assertEqual(entry.data['data_timestamp'], '2024-01-15T12:00:00+00:00')
+
+        # A fresh process (empty memory tier) reads the same reading back
+        other = WeatherCache(grid_degrees=0.01, bucket_seconds=600, max_entries=2)
+        loaded = other.get(45.0, -93.0, self.when, self.fetch(9))
+        self.assertEqual(loaded, stored)
+        self.assertIsInstance(loaded['data_timestamp'], datetime)
+        self.assertEqual(self.fetched, [-3.5])
+        self.assertEqual(other.stats['database'], 1)
+
+    def test_failed_fetch_is_not_cached(self):
+        self.assertIsNone(self.cache.get(45.0, -93.0, self.when, lambda: None))
+        self.assertFalse(WeatherCacheEntry.objects.exists())
+        self.assertEqual(self.cache.get(45.0, -93.0, self.when, self.fetch())['temperature'], -3.5)
+
+    def test_concurrent_lookups_share_one_fetch(self):
+        # Threads use their own connections, so keep this test off the database tier
+        self.enterContext(mock.patch.object(self.cache, 'load', return_value=None))
+        self.enterContext(mock.patch.object(self.cache, 'store'))
+        release = threading.Event()
+        fetch = self.fetch()
+
+        def slow_fetch():
+            release.wait(5)
+            return fetch()
+
+        results = []
+        def lookup():
+            results.append(self.cache.get(45.0, -93.0, self.when, slow_fetch))
+
+        threads = [threading.Thread(target=lookup) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while self.cache.stats['coalesced'] < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(self.fetched, [-3.5])
+        self.assertEqual(self.cache.stats['coalesced'], 3)
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(self.cache.in_flight, {})
+
+    def test_concurrent_lookups_share_errors(self):
+        self.enterContext(mock.patch.object(self.cache, 'load', return_value=None))
+        release = threading.Event()
+
+        def failing_fetch():
+            release.wait(5)
+            raise requests.ConnectionError('down')
+
+        errors = []
+        def lookup():
+            try:
+                self.cache.get(45.0, -93.0, self.when, failing_fetch)
+            except requests.ConnectionError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=lookup) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while self.cache.stats['coalesced'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(self.cache.in_flight, {})
+
+class StationWeatherProviderTests(SimpleTestCase):
+    """Nearest-station, nearest-hour lookups in an offline station archive."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory()
+        source = os.path.join(cls.tmp.name, 'stations.csv')
+        start = datetime(2024, 5, 1, tzinfo=dt_timezone.utc)
+        with open(source, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['station', 'latitude', 'longitude', 'timestamp', 'temperature', 'humidity', 'weather_condition'])
+            # Written out of order: the archive sorts by station and time
+            for hour in reversed(range(0, 24, 2)):
+                writer.writerow(['north', 45.0, -93.0, (start + timedelta(hours=hour)).isoformat(), hour, 50, 'clear sky'])
+            writer.writerow(['south', 44.5, -93.0, int((start + timedelta(hours=1)).timestamp()), 99.5, '', 'rain'])
+        cls.archive = os.path.join(cls.tmp.name, 'archive')
+        build_station_archive(source, cls.archive)
+        cls.start = start
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def assertReadings(self, provider):
+        reading = provider.get_weather(45.01, -93.0, self.start + timedelta(hours=5, minutes=10))
+        self.assertEqual(reading['temperature'], 6.0)
+        self.assertEqual(reading['humidity'], 50)
+        self.assertEqual(reading['data_timestamp'], self.start + timedelta(hours=6))
+
+        reading = provider.get_weather(44.6, -93.0, self.start + timedelta(hours=1))
+        self.assertEqual(reading['weather_condition'], 'rain')
+        self.assertIsNone(reading['humidity'])
+
+        # The south station has nothing near this time, so the next nearest answers
+        reading = provider.get_weather(44.6, -93.0, self.start + timedelta(hours=20))
+        self.assertEqual(reading['temperature'], 20.0)
+
+        self.assertIsNone(provider.get_weather(45.0, -93.0, self.start + timedelta(days=2)))
+        self.assertIsNone(provider.get_weather(10.0, 10.0, self.start))
+
+    def test_lookup_with_kd_tree(self):
+        if weather_stations.cKDTree is None:
+            self.skipTest('scipy is not installed')
+        provider = StationWeatherProvider(self.archive)
+        self.assertIsNotNone(provider.tree)
+        self.assertReadings(provider)
+
+    def test_lookup_without_scipy(self):
+        with mock.patch.object(weather_stations, 'cKDTree', None):
+            provider = StationWeatherProvider(self.archive)
+        self.assertIsNone(provider.tree)
+        self.assertReadings(provider)
+
+class UploadMediaApiTests(TemporaryMediaMixin, TestCase):
+    """The async upload endpoint served under ASGI."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.camera = Camera.objects.create(name='Upload camera', latitude=0, longitude=0)
+        cls.user = get_user_model().objects.create_user('uploader@example.com', password='secret')
+
+    def setUp(self):
+        super().setUp()
+        self.client = AsyncClient()
+
+    async def test_requires_login(self):
+        response = await self.client.post(reverse('upload_media_api'), secure=True)
+        self.assertEqual(response.status_code, 401)
+
+    async def test_rejects_get(self):
+        response = await self.client.get(reverse('upload_media_api'), secure=True)
+        self.assertEqual(response.status_code, 405)
+
+    async def test_upload(self):
+        await sync_to_async(self.client.force_login)(self.user)
+        response = await self.client.post(reverse('upload_media_api'), {
+            'camera': self.camera.id,
+            'tags': 'deer, Doe',
+            'description': 'Field upload',
+            'files': [self.image('a.jpg', 'red'), self.image('b.jpg', 'blue')],
+        }, secure=True)
+        self.assertEqual(response.status_code, 201, response.content)
+        data = response.json()
+        self.assertEqual(data['uploaded'], 2)
+
+        media_files = [media async for media in MediaFile.objects.filter(id__in=data['ids']).prefetch_related('tags')]
+        self.assertEqual({(media.width, media.height) for media in media_files}, {(32, 24)})
+        self.assertEqual({tag.name for tag in media_files[0].tags.all()}, {'deer', 'doe'})
+
+    async def test_requires_csrf_token(self):
+        client = AsyncClient(enforce_csrf_checks=True)
+        # The login page sets the CSRF cookie a script sends back as a header
+        response = await client.get(reverse('login'), secure=True)
+        token = response.cookies['csrftoken'].value
+        await sync_to_async(client.force_login)(self.user)
+        data = {'camera': self.camera.id, 'files': [self.image('a.jpg')]}
+
+        response = await client.post(reverse('upload_media_api'), data, secure=True)
+        self.assertEqual(response.status_code, 403)
+
+        data['files'] = [self.image('a.jpg')]
+        response = await client.post(
+            reverse('upload_media_api'), data, secure=True,
+            headers={'X-CSRFToken': token, 'Referer': 'https://testserver/login/'}
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+
+    async def test_invalid_form(self):
+        await sync_to_async(self.client.force_login)(self.user)
+        response = await self.client.post(reverse('upload_media_api'), {'camera': self.camera.id}, secure=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('files', response.json()['errors'])
+
+class HashingUploadHandlerTests(SimpleTestCase):
+    """The SHA-256 computed while an upload streams in matches hashing the whole file."""
+
+    def upload(self, *contents):
+        request = RequestFactory().post('/upload/', {
+            f'file{i}': SimpleUploadedFile(f'photo{i}.jpg', content, content_type='image/jpeg')
+            for i, content in enumerate(contents)
+        })
+        # Small chunks, so every file is hashed across several of them
+        with mock.patch.object(HashingUploadMixin, 'chunk_size', 1024):
+            files = [request.FILES[f'file{i}'] for i in range(len(contents))]
+        for f in files:
+            self.addCleanup(f.close)
+        return files
+
+    def test_memory_handler(self):
+        contents = [os.urandom(10_000), jpeg_bytes(), b'']
+        files = self.upload(*contents)
+        for f, content in zip(files, contents):
+            self.assertIsInstance(f, InMemoryUploadedFile)
+            self.assertEqual(f.sha256, hashlib.sha256(content).hexdigest())
+            self.assertEqual(f.read(), content)
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=5_000)
+    def test_temporary_file_handler(self):
+        # The memory handler gives up part way through the first file
+        contents = [os.urandom(50_000), os.urandom(20_000)]
+        files = self.upload(*contents)
+        for f, content in zip(files, contents):
+            self.assertIsInstance(f, TemporaryUploadedFile)
+            self.assertEqual(f.sha256, hashlib.sha256(content).hexdigest())
+            self.assertEqual(f.read(), content)
+
+    def test_ingest_uses_streamed_hash(self):
+        upload, = self.upload(jpeg_bytes())
+        with mock.patch.object(upload, 'chunks', side_effect=AssertionError('upload read again')):
+            self.assertEqual(hash_upload(upload), upload.sha256)
 
-# Create your tests here.
@@ -0,0 +1,40 @@
+import hashlib
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler,
+    TemporaryFileUploadHandler
+)
+
+# Bytes handed to the handlers per read of the request body
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+class HashingUploadMixin:
+    """
+    Compute the SHA-256 of each uploaded file while Django streams it in.
+
+    The digest is set as ``sha256`` on the resulting UploadedFile, so the
+    upload never has to be read again (from disk or remote storage) to
+    hash it.
+    """
+    chunk_size = UPLOAD_CHUNK_SIZE
+
+    def new_file(self, *args, **kwargs):
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # The memory handler passes large uploads on to the next handler
+        if getattr(self, 'activated', True):
+            self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        if uploaded_file is not None:
+            uploaded_file.sha256 = self.sha256.hexdigest()
+        return uploaded_file
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    """Keeps small uploads in memory and hashes them on the way in."""
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    """Streams large uploads to a temporary file and hashes them on the way in."""
@@ -13,12 +13,16 @@ urlpatterns = [
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('profile/', views.profile, name='profile'),
     path('media/upload/', views.upload_media, name='upload_media'),
+    path('media/upload/api/', views.upload_media_api, name='upload_media_api'),
     path('media/', views.media_list, name='media_list'),
+    path('media/api/', views.media_list_api, name='media_list_api'),
     path('cameras/map/', views.camera_map, name='camera_map'),
     path('media/duplicates/', views.manage_duplicates, name='manage_duplicates'),
     path('media/duplicates/<int:media_id>/delete/', views.delete_duplicate, name='delete_duplicate'),
     path('media/duplicates/<int:media_id>/mark-not-duplicate/', views.mark_not_duplicate, name='mark_not_duplicate'),
     path('media/duplicates/batch-delete/', views.batch_delete_duplicates, name='batch_delete_duplicates'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('renditions/<path:path>', views.rendition, name='rendition'),
     path('health/', views.health_check, name='health_check'),
+    path('cache/stats/', views.cache_stats, name='cache_stats'),
 ] 
\ No newline at end of file
@@ -1,22 +1,184 @@
+from collections import Counter
 from datetime import timedelta
+import threading
 from django.utils import timezone
-from django.db.models import Max
 import imagehash
 from PIL import Image
+from .cache_utils import HASH_INDEX, get_generation, invalidate
 
-def compute_image_hash(image_path):
-    """Compute perceptual hash of an image using ImageHash."""
+# Maximum Hamming distance (in bits) for two images to count as near-duplicates
+NEAR_DUPLICATE_DISTANCE = 4
+
+# Photos from one camera taken within this gap of each other form a burst
+BURST_WINDOW = timedelta(seconds=2)
+BURST_FIELDS = ['burst_group', 'burst_sequence']
+
+# Perceptual hashes are unsigned 64-bit values; the database column is signed
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+def compute_image_hash(image):
+    """Compute the 64-bit perceptual hash of an image as a signed integer.
+
+    Accepts a path or an open file object.
+    """
     try:
-        with Image.open(image_path) as img:
+        with Image.open(image) as img:
             # Convert to grayscale to focus on structure
             if img.mode != 'L':
                 img = img.convert('L')
             # Compute average hash (can also use other algorithms like phash or dhash)
-            return str(imagehash.average_hash(img))
+            return hash_to_int(str(imagehash.average_hash(img)))
     except Exception as e:
         print(f"Error computing image hash: {e}")
         return None
 
+def read_image_size(image):
+    """(width, height) of an image, or (None, None) if it cannot be read.
+
+    Only the image header is parsed. Accepts a path or an open file object,
+    which is rewound.
+    """
+    try:
+        with Image.open(image) as img:
+            return img.size
+    except Exception as e:
+        print(f"Error reading image size: {e}")
+        return None, None
+    finally:
+        if hasattr(image, 'seek'):
+            image.seek(0)
+
+def hash_to_int(hex_hash):
+    """Convert a hex perceptual hash into a signed 64-bit integer for storage."""
+    value = int(hex_hash, 16) & HASH_MASK
+    if value >= 1 << (HASH_BITS - 1):
+        value -= 1 << HASH_BITS
+    return value
+
+class BKTree:
+    """BK-tree over 64-bit hashes using Hamming distance as the metric.
+
+    Each node is ``[hash, items, children]`` where ``children`` maps the
+    distance to the parent hash onto the child node.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, hash_value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [hash_value, [item], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, [item], {}]
+                return
+            node = child
+
+    def search(self, hash_value, max_distance):
+        """Return ``(distance, item)`` pairs within ``max_distance`` of ``hash_value``."""
+        if self.root is None:
+            return []
+
+        results = []
+        stack = [self.root]
+        while stack:
+            node_hash, items, children = stack.pop()
+            distance = hamming_distance(hash_value, node_hash)
+            if distance <= max_distance:
+                results.extend((distance, item) for item in items)
+            # Triangle inequality: only subtrees in this band can hold matches
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(
+                child for d, child in children.items() if low <= d <= high
+            )
+        return results
+
+class PerceptualHashIndex:
+    """In-memory BK-tree of the perceptual hashes stored for one camera.
+
+    The index is loaded lazily and topped up with rows whose id is greater than
+    the last one seen, so rows created by other processes are picked up with a
+    single indexed query per lookup. Hashes written later to existing rows
+    are not seen that way, so their writers call ``invalidate_hash_index``
+    and every process rebuilds its indexes on the next lookup.
+    """
+
+    def __init__(self, camera_id):
+        self.camera_id = camera_id
+        self.tree = BKTree()
+        self.last_id = 0
+        self.generation = None
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        from .models import MediaFile  # Import here to avoid circular import
+
+        # Read before the rows, so a concurrent invalidation is never missed
+        generation = hash_index_generation(self.generation)
+        if generation != self.generation:
+            self.tree = BKTree()
+            self.last_id = 0
+            self.generation = generation
+
+        rows = (
+            MediaFile.objects
+            .filter(
+                camera_id=self.camera_id,
+                id__gt=self.last_id,
+                perceptual_hash__isnull=False
+            )
+            .order_by('id')
+            .values_list('id', 'perceptual_hash', 'upload_date')
+        )
+        for media_id, perceptual_hash, upload_date in rows.iterator():
+            self.tree.add(perceptual_hash, (media_id, upload_date))
+            self.last_id = media_id
+
+    def search(self, perceptual_hash, max_distance=NEAR_DUPLICATE_DISTANCE):
+        with self.lock:
+            self.refresh()
+            return self.tree.search(perceptual_hash, max_distance)
+
+_hash_indexes = {}
+_hash_indexes_lock = threading.Lock()
+
+def get_hash_index(camera_id):
+    """Return the shared perceptual hash index for a camera."""
+    with _hash_indexes_lock:
+        index = _hash_indexes.get(camera_id)
+        if index is None:
+            index = _hash_indexes[camera_id] = PerceptualHashIndex(camera_id)
+        return index
+
+def hash_index_generation(default=None):
+    """Generation token of the perceptual hash indexes, shared by all processes."""
+    try:
+        return get_generation(HASH_INDEX)
+    except Exception as e:
+        # Without the cache, keep serving the index as it is
+        print(f"Error reading hash index generation: {e}")
+        return default
+
+def invalidate_hash_index():
+    """Make every process rebuild its perceptual hash indexes on the next lookup.
+
+    Call after writing perceptual hashes to existing rows.
+    """
+    invalidate(HASH_INDEX)
+    with _hash_indexes_lock:
+        _hash_indexes.clear()
+
 def check_duplicates(media_file):
     """Check if the media file is a duplicate of existing files."""
     from .models import MediaFile  # Import here to avoid circular import
@@ -39,72 +201,274 @@ def check_duplicates(media_file):
         return
     
     # If no exact duplicates, check for near-duplicates using perceptual hash
-    perceptual_hash = compute_image_hash(media_file.file.path)
-    if not perceptual_hash:
+    # (save() already tried for new rows; videos never have one)
+    if media_file.perceptual_hash is None and media_file.pk and media_file.file_type == 'image':
+        media_file.perceptual_hash = media_file.compute_perceptual_hash()
+    if media_file.perceptual_hash is None:
         return
     
-    # Get all media files from the same camera within a reasonable time window
+    # Only consider files from the same camera within a reasonable time window
     time_window = timedelta(minutes=5)
-    potential_matches = MediaFile.objects.filter(
-        camera=media_file.camera,
-        upload_date__range=(
-            media_file.upload_date - time_window,
-            media_file.upload_date + time_window
-        )
-    ).exclude(id=media_file.id)
+    window_start = media_file.upload_date - time_window
+    window_end = media_file.upload_date + time_window
+    candidates = sorted(
+        (distance, upload_date, media_id)
+        for distance, (media_id, upload_date) in
+        get_hash_index(media_file.camera_id).search(media_file.perceptual_hash)
+        if media_id != media_file.id and window_start <= upload_date <= window_end
+    )
+    if not candidates:
+        return
     
-    for potential_match in potential_matches:
-        match_hash = compute_image_hash(potential_match.file.path)
-        if match_hash and hamming_distance(perceptual_hash, match_hash) < 5:  # Adjust threshold as needed
+    # The index may still hold rows deleted by another process
+    existing = MediaFile.objects.in_bulk([media_id for _, _, media_id in candidates])
+    for _, _, media_id in candidates:
+        if media_id in existing:
             media_file.is_duplicate = True
-            media_file.duplicate_of = potential_match
+            media_file.duplicate_of = existing[media_id]
             return
 
-def check_burst(media_file):
-    """Check if the media file is part of a burst sequence."""
+def resolve_duplicates(media_files):
+    """Mark exact and near-duplicates across a batch of freshly created files.
+
+    Each file is only ever matched against files created before it, so two
+    files in the same batch cannot end up as duplicates of each other.
+    Returns the files that were marked as duplicates.
+    """
     from .models import MediaFile  # Import here to avoid circular import
-    
-    # Only process files with capture_date
-    if not media_file.capture_date:
-        return
-    
-    # Define burst parameters
-    burst_window = timedelta(seconds=2)  # Photos taken within 2 seconds
-    
-    # Look for nearby photos from the same camera
-    nearby_photos = MediaFile.objects.filter(
-        camera=media_file.camera,
-        capture_date__range=(
-            media_file.capture_date - burst_window,
-            media_file.capture_date + burst_window
-        )
-    ).exclude(id=media_file.id)
-    
-    if nearby_photos.exists():
-        # Check if there's an existing burst group to join
-        existing_group = nearby_photos.filter(burst_group__isnull=False).first()
-        
-        if existing_group:
-            # Join existing burst group
-            media_file.burst_group = existing_group.burst_group
-            # Get next sequence number
-            max_sequence = MediaFile.objects.filter(
-                burst_group=existing_group.burst_group
-            ).aggregate(Max('burst_sequence'))['burst_sequence__max'] or 0
-            media_file.burst_sequence = max_sequence + 1
+
+    by_camera = {}
+    for media_file in media_files:
+        by_camera.setdefault(media_file.camera_id, []).append(media_file)
+
+    marked = []
+    for camera_id, camera_files in by_camera.items():
+        camera_files.sort(key=lambda m: m.id)
+
+        # One query resolves every exact (same SHA-256) duplicate in the batch
+        originals = {}
+        hashes = {m.file_hash for m in camera_files if m.file_hash}
+        for media_id, file_hash in (
+            MediaFile.objects
+            .filter(camera_id=camera_id, file_hash__in=hashes)
+            .order_by('upload_date', 'id')
+            .values_list('id', 'file_hash')
+        ):
+            originals.setdefault(file_hash, media_id)
+
+        index = get_hash_index(camera_id)
+        time_window = timedelta(minutes=5)
+        for media_file in camera_files:
+            original_id = originals.get(media_file.file_hash)
+            if original_id is None or original_id >= media_file.id:
+                original_id = None
+                if media_file.perceptual_hash is not None:
+                    window_start = media_file.upload_date - time_window
+                    window_end = media_file.upload_date + time_window
+                    candidates = sorted(
+                        (distance, media_id)
+                        for distance, (media_id, upload_date) in
+                        index.search(media_file.perceptual_hash)
+                        if media_id < media_file.id
+                        and window_start <= upload_date <= window_end
+                    )
+                    if candidates:
+                        original_id = candidates[0][1]
+
+            if original_id is not None:
+                media_file.is_duplicate = True
+                media_file.duplicate_of_id = original_id
+                marked.append(media_file)
+
+    if marked:
+        MediaFile.objects.bulk_update(marked, ['is_duplicate', 'duplicate_of'])
+    return marked
+
+def split_sessions(photos):
+    """Split photos sorted by capture date into sessions with a linear sweep.
+
+    A gap larger than ``BURST_WINDOW`` between consecutive photos starts a
+    new session.
+    """
+    sessions = []
+    for photo in photos:
+        if sessions and photo.capture_date - sessions[-1][-1].capture_date <= BURST_WINDOW:
+            sessions[-1].append(photo)
         else:
-            # Create new burst group
-            from uuid import uuid4
-            burst_group = f"burst_{uuid4().hex[:8]}"
-            media_file.burst_group = burst_group
-            media_file.burst_sequence = 1
-            
-            # Update nearby photos to be part of this burst
-            for i, photo in enumerate(nearby_photos.order_by('capture_date')):
-                photo.burst_group = burst_group
-                photo.burst_sequence = i + 2  # Start from 2 since current photo is 1
-                photo.save()
+            sessions.append([photo])
+    return sessions
+
+def assign_bursts(sessions):
+    """Set burst groups and sequence numbers from sessions, without saving.
+
+    Sessions of two or more photos become bursts; single photos are cleared.
+    A session keeps the group id most of its photos already have (each id
+    is given to one session only), so stored bursts keep their ids when
+    they grow or split. Returns the photos whose burst information changed.
+    """
+    from uuid import uuid4
+
+    used = set()
+    changed = []
+    for session in sessions:
+        burst_group = ''
+        if len(session) > 1:
+            existing = Counter(
+                photo.burst_group for photo in session
+                if photo.burst_group and photo.burst_group not in used
+            )
+            burst_group = (
+                existing.most_common(1)[0][0] if existing
+                else f"burst_{uuid4().hex[:8]}"
+            )
+            used.add(burst_group)
+
+        for sequence, photo in enumerate(session, 1):
+            burst = (burst_group, sequence) if burst_group else ('', None)
+            if (photo.burst_group, photo.burst_sequence) != burst:
+                photo.burst_group, photo.burst_sequence = burst
+                changed.append(photo)
+    return changed
+
+def clear_bursts(photos):
+    """Remove photos without a capture date from their bursts; returns the changed ones."""
+    changed = []
+    for photo in photos:
+        if photo.burst_group or photo.burst_sequence is not None:
+            photo.burst_group, photo.burst_sequence = '', None
+            changed.append(photo)
+    return changed
+
+def resolve_camera_duplicates(camera_id, since=None, reset=False, save=True):
+    """Mark exact and near-duplicates among all of one camera's files in bulk.
+
+    The camera's hashes are loaded with one query and swept in upload
+    order: exact duplicates are matched by SHA-256 and near-duplicates with
+    a BK-tree holding only the earlier files, so a file is only ever marked
+    as a duplicate of an earlier one (near-duplicates at most five minutes
+    before it).
+
+    Args:
+        camera_id (int): Camera to process
+        since (datetime, optional): Only mark files uploaded from this date;
+              older files still serve as originals
+        reset (bool): Recompute files already marked as duplicates
+        save (bool): Write the changes with one ``bulk_update``
+
+    Returns:
+        list[MediaFile]: The files whose duplicate information changed
+    """
+    from .models import MediaFile  # Import here to avoid circular import
+
+    media_files = (
+        MediaFile.objects
+        .filter(camera_id=camera_id)
+        .only('id', 'file_hash', 'perceptual_hash', 'upload_date', 'is_duplicate', 'duplicate_of')
+        .order_by('upload_date', 'id')
+    )
+
+    originals = {}
+    tree = BKTree()
+    time_window = timedelta(minutes=5)
+    changed = []
+    for media_file in media_files.iterator(chunk_size=2000):
+        in_scope = since is None or media_file.upload_date >= since
+        if in_scope and (reset or not media_file.is_duplicate):
+            original_id = originals.get(media_file.file_hash) if media_file.file_hash else None
+            if original_id is None and media_file.perceptual_hash is not None:
+                window_start = media_file.upload_date - time_window
+                candidates = [
+                    (distance, media_id)
+                    for distance, (media_id, upload_date) in
+                    tree.search(media_file.perceptual_hash, NEAR_DUPLICATE_DISTANCE)
+                    if upload_date >= window_start
+                ]
+                if candidates:
+                    original_id = min(candidates)[1]
+
+            duplicate = (original_id is not None, original_id)
+            if (media_file.is_duplicate, media_file.duplicate_of_id) != duplicate:
+                media_file.is_duplicate, media_file.duplicate_of_id = duplicate
+                changed.append(media_file)
+
+        if media_file.file_hash:
+            originals.setdefault(media_file.file_hash, media_file.id)
+        if media_file.perceptual_hash is not None:
+            tree.add(media_file.perceptual_hash, (media_file.id, media_file.upload_date))
+
+    if save and changed:
+        MediaFile.objects.bulk_update(changed, ['is_duplicate', 'duplicate_of'], batch_size=1000)
+    return changed
+
+def resolve_bursts(media_files):
+    """Incrementally regroup bursts around a batch of new or re-dated files.
+
+    Per camera, the batch is swept together with the stored photos within
+    ``BURST_WINDOW`` of it and every member of the bursts they belong to,
+    so bursts are merged, extended or split exactly as a full rebuild would.
+    Returns the files (batch or stored) whose burst information changed.
+    """
+    from .models import MediaFile  # Import here to avoid circular import
+
+    by_camera = {}
+    for media_file in media_files:
+        by_camera.setdefault(media_file.camera_id, []).append(media_file)
+
+    changed = []
+    for camera_id, camera_files in by_camera.items():
+        photos = {m.id: m for m in camera_files}
+        dated = [m for m in camera_files if m.capture_date]
+        # Unordered, so the planner is free to use the capture date and burst indexes
+        stored = MediaFile.objects.filter(camera_id=camera_id).only(
+            'id', 'capture_date', 'burst_group', 'burst_sequence'
+        ).order_by()
+
+        if dated:
+            start = min(m.capture_date for m in dated) - BURST_WINDOW
+            end = max(m.capture_date for m in dated) + BURST_WINDOW
+            for neighbour in stored.filter(capture_date__range=(start, end)):
+                photos.setdefault(neighbour.id, neighbour)
+
+        # Whole bursts, so that members outside the window are renumbered too
+        groups = {m.burst_group for m in photos.values() if m.burst_group}
+        if groups:
+            # The exclude matches the partial index on burst_group
+            for member in stored.filter(burst_group__in=groups).exclude(burst_group=''):
+                photos.setdefault(member.id, member)
+
+        changed += assign_bursts(split_sessions(sorted(
+            (m for m in photos.values() if m.capture_date),
+            key=lambda m: (m.capture_date, m.id)
+        )))
+        changed += clear_bursts(m for m in photos.values() if not m.capture_date)
+
+    if changed:
+        MediaFile.objects.bulk_update(changed, BURST_FIELDS, batch_size=1000)
+    return changed
+
+def rebuild_bursts(camera_id, save=True):
+    """Segment all of a camera's photos into bursts from scratch.
+
+    The capture dates are sorted once by the database and split with one
+    linear sweep; changes are written with one ``bulk_update``. With
+    ``save=False`` nothing is written (dry runs).
+    Returns the files whose burst information changed.
+    """
+    from .models import MediaFile  # Import here to avoid circular import
+
+    photos = list(
+        MediaFile.objects
+        .filter(camera_id=camera_id)
+        .only('id', 'capture_date', 'burst_group', 'burst_sequence')
+        .order_by('capture_date', 'id')
+    )
+    changed = assign_bursts(split_sessions([m for m in photos if m.capture_date]))
+    changed += clear_bursts(m for m in photos if not m.capture_date)
+
+    if save and changed:
+        MediaFile.objects.bulk_update(changed, BURST_FIELDS, batch_size=1000)
+    return changed
 
 def hamming_distance(hash1, hash2):
-    """Calculate the Hamming distance between two hash strings."""
-    return sum(c1 != c2 for c1, c2 in zip(hash1, hash2)) 
\ No newline at end of file
+    """Calculate the Hamming distance between two 64-bit integer hashes."""
+    return ((hash1 ^ hash2) & HASH_MASK).bit_count()
@@ -1,22 +1,30 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views.generic import CreateView, ListView
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.db import transaction
-from django.db.models import Q, Count, Sum, F
+from django.db.models import Count, Sum, F, Avg, Exists, OuterRef, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
-from django.http import HttpResponseRedirect, JsonResponse
+from django.http import HttpResponseRedirect, HttpResponseNotAllowed, JsonResponse, FileResponse, Http404
 from datetime import datetime, timedelta
 from django.template.defaultfilters import filesizeformat
 from .forms import CustomUserCreationForm, MediaFileUploadForm, MediaSearchForm
-from .models import MediaFile, Tag, Camera
+from .models import MediaFile, Camera
+from .ingest_utils import ingest_media_files, get_or_create_tags
+from .renditions import LocalRenditionStorage, RENDITION_CACHE_CONTROL
+from .pagination import keyset_page, InvalidCursor
+from .search_utils import search_media
+from .purge_utils import delete_media_files
+from .cache_utils import DASHBOARD, CAMERA_MAP, cached, get_cache_stats
 from .dashboard_utils import (
-    get_basic_stats,
+    get_sighting_summary,
     get_upload_timeline,
-    get_weather_impact,
-    get_temperature_ranges
+    get_weather_impact
 )
 
 def home(request):
@@ -57,54 +65,44 @@ class SignUpView(CreateView):
 def profile(request):
     return render(request, 'core/profile.html')
 
+def ingest_upload_form(form):
+    """
+    Store and create the files of a valid MediaFileUploadForm in one batch.
+    
+    Returns:
+        list[MediaFile]: The created media files
+    """
+    # Process tags
+    tags = get_or_create_tags(form.cleaned_data['tags'])
+    
+    # Store and create all uploaded files in one batch
+    # (manual capture date overrides EXIF data)
+    return ingest_media_files(
+        form.files.getlist('files'),
+        camera=form.cleaned_data['camera'],
+        description=form.cleaned_data['description'],
+        tags=tags,
+        capture_date=form.cleaned_data.get('manual_capture_date')
+    )
+
 @login_required
 def upload_media(request):
     if request.method == 'POST':
         form = MediaFileUploadForm(request.POST, request.FILES)
         if form.is_valid():
             try:
-                with transaction.atomic():
-                    camera = form.cleaned_data['camera']
-                    description = form.cleaned_data['description']
-                    tag_names = form.cleaned_data['tags']
-                    manual_capture_date = form.cleaned_data.get('manual_capture_date')
-                    
-                    # Process tags
-                    tags = []
-                    for tag_name in tag_names:
-                        tag, created = Tag.objects.get_or_create(name=tag_name.lower())
-                        tags.append(tag)
-                    
-                    # Process each uploaded file
-                    files = request.FILES.getlist('files')
-                    uploaded_count = 0
-                    for file in files:
-                        media = MediaFile.objects.create(
-                            file=file,
-                            camera=camera,
-                            description=description
-                        )
-                        
-                        # Set manual capture date if provided (this will override EXIF data)
-                        if manual_capture_date:
-                            media.capture_date = manual_capture_date
-                            media.save()
-                        
-                        media.tags.set(tags)
-                        uploaded_count += 1
-                    
-                    # Prepare success message with EXIF information
-                    exif_count = MediaFile.objects.filter(
-                        id__in=[m.id for m in MediaFile.objects.order_by('-id')[:uploaded_count]],
-                        has_exif=True
-                    ).count()
-                    
-                    message = f'Successfully uploaded {uploaded_count} files. '
-                    if exif_count > 0:
-                        message += f'EXIF data extracted from {exif_count} files.'
-                    
-                    messages.success(request, message)
-                    return redirect('media_list')
+                media_files = ingest_upload_form(form)
+                uploaded_count = len(media_files)
+                
+                # Prepare success message with EXIF information
+                exif_count = sum(1 for media in media_files if media.has_exif)
+                
+                message = f'Successfully uploaded {uploaded_count} files. '
+                if exif_count > 0:
+                    message += f'EXIF data extracted from {exif_count} files.'
+                
+                messages.success(request, message)
+                return redirect('media_list')
             except Exception as e:
                 messages.error(request, f'Error uploading files: {str(e)}')
     else:
@@ -112,9 +110,57 @@ def upload_media(request):
     
     return render(request, 'core/upload_media.html', {'form': form})
 
-@login_required
-def media_list(request):
-    form = MediaSearchForm(request.GET)
+def ingest_upload_request(request):
+    """Validate and ingest an upload request for upload_media_api, as JSON."""
+    form = MediaFileUploadForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    try:
+        media_files = ingest_upload_form(form)
+    except Exception as e:
+        return JsonResponse({'error': f'Error uploading files: {str(e)}'}, status=500)
+    return JsonResponse({
+        'uploaded': len(media_files),
+        'exif': sum(1 for media in media_files if media.has_exif),
+        'duplicates': sum(1 for media in media_files if media.is_duplicate),
+        'ids': [media.id for media in media_files],
+    }, status=201)
+
+async def upload_media_api(request):
+    """
+    Upload media files as a multipart POST with the upload form's fields.
+    
+    Meant for uploads from field laptops on slow links. Like the rest of
+    the site it uses the session login and CSRF protection, so a script
+    first GETs the login page (which sets the ``csrftoken`` cookie) and
+    posts the login form, then sends each upload with the session cookie,
+    the token in an ``X-CSRFToken`` header and, over HTTPS, a same-origin
+    ``Referer``.
+    
+    Under the ASGI server the request body is spooled to a temporary file
+    as it arrives, before any thread is used, so slow uploads do not tie
+    up workers. Parsing, storing and the database writes then run in a
+    thread; enrichment is queued as jobs.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    # request.user is loaded lazily from the database
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    return await sync_to_async(ingest_upload_request)(request)
+
+# Media files per page (and the maximum a JSON client may request)
+MEDIA_PAGE_SIZE = 48
+MAX_MEDIA_PAGE_SIZE = 200
+# Matches counted for the media list's result total
+MEDIA_COUNT_LIMIT = 10000
+
+def filter_media_files(form, ranked=False):
+    """
+    Apply the media search form filters to the MediaFile queryset.
+
+    With ``ranked``, search results come best match first.
+    """
     media_files = MediaFile.objects.select_related('camera').prefetch_related('tags').all()
 
     if form.is_valid():
@@ -136,79 +182,188 @@ def media_list(request):
                 upload_date__date__lte=form.cleaned_data['end_date']
             )
         
-        # Search in descriptions
+        # Full-text search over descriptions, tags and camera names
         if form.cleaned_data.get('search_query'):
-            query = form.cleaned_data['search_query']
-            media_files = media_files.filter(
-                Q(description__icontains=query) |
-                Q(tags__name__icontains=query) |
-                Q(camera__name__icontains=query)
-            ).distinct()
+            media_files = search_media(media_files, form.cleaned_data['search_query'], ranked)
+
+    return media_files
+
+@login_required
+def media_list(request):
+    form = MediaSearchForm(request.GET)
+    media_files = filter_media_files(form)
+
+    first_page = not request.GET.get('cursor')
+    try:
+        page, next_cursor = keyset_page(
+            media_files,
+            cursor=request.GET.get('cursor'),
+            page_size=MEDIA_PAGE_SIZE
+        )
+    except InvalidCursor:
+        page, next_cursor = keyset_page(media_files, page_size=MEDIA_PAGE_SIZE)
+        first_page = True
+
+    # Counting is a scan of every match, so it is done once, on the first
+    # page, and stops at MEDIA_COUNT_LIMIT
+    total_count = None
+    if first_page:
+        total_count = media_files.order_by()[:MEDIA_COUNT_LIMIT + 1].count()
 
-    # Add file type information for template rendering
-    for media_file in media_files:
-        media_file.file_type = 'video' if media_file.file.name.lower().endswith(
-            ('.mp4', '.avi', '.mov', '.wmv')
-        ) else 'image'
+    next_query = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_query = params.urlencode()
+
+    api_params = request.GET.copy()
+    api_params.pop('cursor', None)
 
     context = {
         'form': form,
-        'media_files': media_files,
-        'total_count': media_files.count(),
+        'media_files': page,
+        'total_count': min(total_count, MEDIA_COUNT_LIMIT) if total_count is not None else None,
+        'total_count_capped': total_count is not None and total_count > MEDIA_COUNT_LIMIT,
+        'next_cursor': next_cursor,
+        'next_query': next_query,
+        'api_query': api_params.urlencode(),
     }
     return render(request, 'core/media_list.html', context)
 
+def serialize_media_file(media_file):
+    """JSON representation of a media file for the media API."""
+    return {
+        'id': media_file.id,
+        'file_type': media_file.file_type,
+        'url': media_file.file.url,
+        'thumbnail_url': (
+            media_file.thumbnail_url if media_file.file_type == 'image' else None
+        ),
+        'camera': {'id': media_file.camera_id, 'name': media_file.camera.name},
+        'upload_date': media_file.upload_date.isoformat(),
+        'capture_date': media_file.capture_date.isoformat() if media_file.capture_date else None,
+        'description': media_file.description,
+        'tags': [{'id': tag.id, 'name': tag.name} for tag in media_file.tags.all()],
+    }
+
 @login_required
-def camera_map(request):
-    # Get date range filters
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    
-    # Base query for cameras with media count
+def media_list_api(request):
+    """Cursor-paginated JSON version of media_list for infinite scrolling."""
+    form = MediaSearchForm(request.GET)
+    ranked = (
+        request.GET.get('sort') == 'relevance'
+        and form.is_valid()
+        and bool(form.cleaned_data.get('search_query'))
+    )
+    media_files = filter_media_files(form, ranked)
+
+    try:
+        page_size = min(int(request.GET.get('page_size', MEDIA_PAGE_SIZE)), MAX_MEDIA_PAGE_SIZE)
+    except ValueError:
+        page_size = MEDIA_PAGE_SIZE
+
+    # Best matches of a search first; relevance results are a single page
+    if ranked:
+        page = list(media_files[:max(page_size, 1)])
+        next_cursor = None
+    else:
+        try:
+            page, next_cursor = keyset_page(
+                media_files,
+                cursor=request.GET.get('cursor'),
+                page_size=max(page_size, 1)
+            )
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'results': [serialize_media_file(media_file) for media_file in page],
+        'next_cursor': next_cursor,
+    })
+
+# Recent thumbnails shown in each camera's map popup
+CAMERA_MAP_RECENT_MEDIA = 5
+
+def build_camera_map(start_date=None, end_date=None):
+    """
+    Cameras with their recent media and the map center, for camera_map.
+
+    Two queries whatever the number of cameras: the cameras with the map
+    center as window averages over the same rows, and the most recent
+    images of every camera ranked with ROW_NUMBER().
+    """
+    # Media count and latest date are denormalized on Camera
     cameras = Camera.objects.annotate(
-        media_count=Count('media_files'),
-        latest_media_date=models.Max('media_files__upload_date')
+        center_lat=Window(Avg('latitude')),
+        center_lon=Window(Avg('longitude'))
     )
     
     # Apply date filters if provided
-    if start_date:
-        cameras = cameras.filter(media_files__upload_date__date__gte=start_date)
-    if end_date:
-        cameras = cameras.filter(media_files__upload_date__date__lte=end_date)
+    if start_date or end_date:
+        media_in_range = MediaFile.objects.filter(camera=OuterRef('pk'))
+        if start_date:
+            media_in_range = media_in_range.filter(upload_date__date__gte=start_date)
+        if end_date:
+            media_in_range = media_in_range.filter(upload_date__date__lte=end_date)
+        cameras = cameras.filter(Exists(media_in_range))
+    cameras = list(cameras)
+    
+    # Get recent media for all cameras in one query
+    recent_media = (
+        MediaFile.objects
+        .filter(camera__in=[camera.id for camera in cameras], file_type='image')
+        .annotate(recent_rank=Window(
+            RowNumber(),
+            partition_by=F('camera_id'),
+            order_by=[F('upload_date').desc(), F('id').desc()]
+        ))
+        .filter(recent_rank__lte=CAMERA_MAP_RECENT_MEDIA)
+        .only('id', 'camera_id', 'file', 'file_hash', 'upload_date')
+        .order_by('camera_id', 'recent_rank')
+    )
+    media_by_camera = {}
+    for media in recent_media:
+        media_by_camera.setdefault(media.camera_id, []).append({
+            'id': media.id,
+            'thumbnail_url': media.thumbnail_url
+        })
     
-    # Get recent media for each camera
     for camera in cameras:
-        recent_media = MediaFile.objects.filter(camera=camera).order_by('-upload_date')[:5]
-        camera.recent_media = []
-        camera.recent_media_json = []
-        
-        for media in recent_media:
-            if media.file.name.lower().endswith(('.jpg', '.jpeg', '.png', '.gif')):
-                thumbnail_url = media.file.url
-                camera.recent_media.append({
-                    'id': media.id,
-                    'thumbnail_url': thumbnail_url
-                })
-                camera.recent_media_json.append({
-                    'id': media.id,
-                    'thumbnail_url': thumbnail_url
-                })
+        camera.recent_media = media_by_camera.get(camera.id, [])
+        camera.recent_media_json = camera.recent_media
     
     # Calculate map center
     if cameras:
-        avg_lat = sum(c.latitude for c in cameras) / len(cameras)
-        avg_lon = sum(c.longitude for c in cameras) / len(cameras)
+        avg_lat = cameras[0].center_lat
+        avg_lon = cameras[0].center_lon
     else:
         # Default to a central US location if no cameras
         avg_lat = 39.8283
         avg_lon = -98.5795
     
-    context = {
+    return {
         'cameras': cameras,
         'map_center': {
             'lat': avg_lat,
             'lon': avg_lon
-        },
+        }
+    }
+
+@login_required
+def camera_map(request):
+    # Get date range filters
+    start_date = request.GET.get('start_date')
+    end_date = request.GET.get('end_date')
+    
+    # Cached per filter set until media files or cameras change
+    camera_map_data = cached(
+        CAMERA_MAP,
+        {'start_date': start_date, 'end_date': end_date},
+        lambda: build_camera_map(start_date, end_date)
+    )
+    
+    context = {
+        **camera_map_data,
         'map_zoom': 4,  # Adjust based on your needs
         'start_date': start_date,
         'end_date': end_date
@@ -237,14 +392,23 @@ def manage_duplicates(request):
     elif sort_by == 'similarity':
         duplicates = duplicates.order_by('camera', 'duplicate_of', '-upload_date')
     elif sort_by == 'size':
-        duplicates = duplicates.order_by('-file')  # This will sort by file size
+        duplicates = duplicates.order_by(F('file_size').desc(nulls_last=True), '-upload_date')
     
-    # Get statistics
-    total_duplicates = duplicates.count()
-    duplicate_storage = duplicates.aggregate(
-        total_size=Sum('file')
-    )['total_size'] or 0
-    affected_cameras = duplicates.values('camera').distinct().count()
+    # Get statistics from the stored file sizes (one query)
+    stats = duplicates.aggregate(
+        total_duplicates=Count('id'),
+        duplicate_storage=Sum('file_size', default=0),
+        affected_cameras=Count('camera', distinct=True)
+    )
+    
+    # Storage that deleting the duplicates would free, per camera
+    camera_waste = (
+        duplicates
+        .order_by()
+        .values('camera_id', 'camera__name')
+        .annotate(files=Count('id'), reclaimable=Sum('file_size', default=0))
+        .order_by('-reclaimable', 'camera__name')
+    )
     
     # Create pairs of original and duplicate files
     duplicate_pairs = []
@@ -253,9 +417,8 @@ def manage_duplicates(request):
     
     context = {
         'duplicate_pairs': duplicate_pairs,
-        'total_duplicates': total_duplicates,
-        'duplicate_storage': duplicate_storage,
-        'affected_cameras': affected_cameras,
+        **stats,
+        'camera_waste': camera_waste,
         'cameras': Camera.objects.all(),
         'selected_camera': int(camera_id) if camera_id else None,
         'sort_by': sort_by
@@ -272,9 +435,8 @@ def delete_duplicate(request, media_id):
             camera_name = media_file.camera.name
             file_name = media_file.file.name
             
-            # Delete the file and database record
-            media_file.file.delete(save=False)  # Delete actual file
-            media_file.delete()  # Delete database record
+            # Delete the database record; the file is purged in the background
+            delete_media_files(MediaFile.objects.filter(pk=media_file.pk))
             
             messages.success(
                 request,
@@ -315,54 +477,55 @@ def batch_delete_duplicates(request):
             return HttpResponseRedirect(request.META.get('HTTP_REFERER', reverse_lazy('manage_duplicates')))
         
         try:
-            with transaction.atomic():
-                # Get all selected duplicates
-                duplicates = MediaFile.objects.filter(
-                    id__in=duplicate_ids,
-                    is_duplicate=True
-                ).select_related('camera')
-                
-                # Store counts for success message
-                total_count = duplicates.count()
-                total_size = sum(d.file.size for d in duplicates)
-                
-                # Delete files and records
-                for duplicate in duplicates:
-                    duplicate.file.delete(save=False)  # Delete actual file
-                    duplicate.delete()  # Delete database record
-                
-                messages.success(
-                    request,
-                    f'Successfully deleted {total_count} duplicate files, freeing up {filesizeformat(total_size)}'
-                )
+            # One transaction for the rows; the files are purged in the background
+            total_count, total_size = delete_media_files(
+                MediaFile.objects.filter(id__in=duplicate_ids, is_duplicate=True)
+            )
+            
+            messages.success(
+                request,
+                f'Successfully deleted {total_count} duplicate files, freeing up {filesizeformat(total_size)}'
+            )
         except Exception as e:
             messages.error(request, f'Error deleting duplicates: {str(e)}')
     
     return HttpResponseRedirect(request.META.get('HTTP_REFERER', reverse_lazy('manage_duplicates')))
 
+def build_dashboard():
+    """Compute the dashboard statistics."""
+    # Get basic statistics and temperature ranges (one query)
+    summary = get_sighting_summary()
+    
+    return {
+        'basic_stats': summary['basic_stats'],
+        'timeline_data': get_upload_timeline(),
+        'weather_impact': get_weather_impact(),
+        'temp_stats': summary['temp_stats']
+    }
+
 @login_required
 def dashboard(request):
     """Display dashboard with various statistics and charts."""
-    # Get basic statistics
-    basic_stats = get_basic_stats()
-    
-    # Get upload timeline data
-    timeline_data = get_upload_timeline()
-    
-    # Get weather impact data
-    weather_impact = get_weather_impact()
-    
-    # Get temperature range statistics
-    temp_stats = get_temperature_ranges()
-    
-    context = {
-        'basic_stats': basic_stats,
-        'timeline_data': timeline_data,
-        'weather_impact': weather_impact,
-        'temp_stats': temp_stats
-    }
+    # Cached until the rollups, tags or weather change
+    context = cached(DASHBOARD, {'date': timezone.localdate()}, build_dashboard)
     
     return render(request, 'core/dashboard.html', context)
 
+@login_required
+def rendition(request, path):
+    """Serve a locally stored rendition with immutable caching headers."""
+    storage = LocalRenditionStorage()
+    if not storage.exists(path):
+        raise Http404('Rendition not found')
+    
+    response = FileResponse(storage.open(path, 'rb'), content_type='image/jpeg')
+    response['Cache-Control'] = RENDITION_CACHE_CONTROL
+    return response
+
 def health_check(request):
     return JsonResponse({"status": "healthy"})
+
+@staff_member_required
+def cache_stats(request):
+    """Hit/miss counters of the view caches, for monitoring."""
+    return JsonResponse(get_cache_stats())
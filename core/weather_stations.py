@@ -0,0 +1,248 @@
+"""
+Offline weather from a local archive of station observations.
+
+``build_station_archive`` turns a CSV or Parquet export into a directory of
+numpy arrays with the observations sorted by station and time, and
+``StationWeatherProvider`` memory-maps them to answer nearest-station,
+nearest-hour lookups without any network calls.
+
+Source columns: ``station``, ``latitude``, ``longitude``, ``timestamp``
+(ISO 8601, UTC when no offset is given, or epoch seconds) and any of
+``temperature``, ``feels_like``, ``humidity``, ``wind_speed``,
+``wind_direction``, ``weather_condition`` and ``weather_icon``.
+"""
+import csv
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+import numpy as np
+from django.conf import settings
+from .weather_utils import WeatherProvider
+
+logger = logging.getLogger(__name__)
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+# Numeric reading columns, in the column order of values.npy
+VALUE_FIELDS = ['temperature', 'feels_like', 'humidity', 'wind_speed', 'wind_direction']
+INTEGER_FIELDS = {'humidity', 'wind_direction'}
+
+EARTH_RADIUS_KM = 6371.0
+
+# Readings further away than this are not used for a photo
+MAX_STATION_DISTANCE_KM = 50
+MAX_OBSERVATION_GAP_SECONDS = 3 * 3600
+
+# Stations tried, nearest first, when the closest has no reading near the time
+NEAREST_STATIONS = 8
+
+def unit_vectors(latitudes, longitudes):
+    """Points on the unit sphere, so straight-line distance orders like great-circle distance."""
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.asarray(chord) / 2, 1.0))
+
+def parse_timestamp(value):
+    """Epoch seconds of an ISO 8601 string or a number."""
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        try:
+            return int(float(value))
+        except ValueError:
+            moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return int(moment.timestamp())
+
+def parse_number(value):
+    if value is None or value == '':
+        return math.nan
+    return float(value)
+
+def read_station_rows(source):
+    """
+    Rows of a CSV or Parquet station export as dicts.
+
+    Parquet files need the pyarrow package.
+    """
+    if source.lower().endswith(('.parquet', '.pq')):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches():
+            yield from batch.to_pylist()
+    else:
+        with open(source, newline='') as f:
+            yield from csv.DictReader(f)
+
+def build_station_archive(source, directory):
+    """
+    Build the memory-mappable archive read by StationWeatherProvider.
+
+    The arrays are written to a temporary directory next to ``directory``
+    and swapped in at the end, so providers never see a partial archive.
+
+    Args:
+        source (str): CSV or Parquet file of station observations
+        directory (str): Archive directory to create or replace
+
+    Returns:
+        tuple: (number of stations, number of observations)
+    """
+    station_index = {}
+    stations = []
+    condition_index = {}
+    conditions = []
+    station_column = []
+    times = []
+    values = []
+    condition_column = []
+
+    for row in read_station_rows(source):
+        station = str(row['station'])
+        if station not in station_index:
+            station_index[station] = len(stations)
+            stations.append((station, float(row['latitude']), float(row['longitude'])))
+        condition = (row.get('weather_condition') or None, row.get('weather_icon') or None)
+        if condition not in condition_index:
+            condition_index[condition] = len(conditions)
+            conditions.append(condition)
+
+        station_column.append(station_index[station])
+        times.append(parse_timestamp(row['timestamp']))
+        values.append([parse_number(row.get(field)) for field in VALUE_FIELDS])
+        condition_column.append(condition_index[condition])
+
+    station_column = np.asarray(station_column, dtype=np.int32)
+    times = np.asarray(times, dtype=np.int64)
+    # Observations sorted by station, then time: each station is one slice
+    order = np.lexsort((times, station_column))
+    counts = np.bincount(station_column, minlength=len(stations))
+
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix='.weather-stations-')
+    try:
+        # mkdtemp is private to its creator; the web and job processes read the archive too
+        os.chmod(staging, 0o755)
+        np.save(os.path.join(staging, 'locations.npy'),
+                np.asarray([(lat, lon) for _, lat, lon in stations], dtype=np.float64).reshape(-1, 2))
+        np.save(os.path.join(staging, 'offsets.npy'), np.concatenate(([0], np.cumsum(counts))).astype(np.int64))
+        np.save(os.path.join(staging, 'times.npy'), times[order])
+        np.save(os.path.join(staging, 'values.npy'),
+                np.asarray(values, dtype=np.float64).reshape(-1, len(VALUE_FIELDS))[order])
+        np.save(os.path.join(staging, 'conditions.npy'), np.asarray(condition_column, dtype=np.int32)[order])
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump({
+                'stations': [station for station, _, _ in stations],
+                'conditions': conditions,
+                'fields': VALUE_FIELDS,
+            }, f)
+
+        if os.path.exists(directory):
+            retired = tempfile.mkdtemp(dir=parent, prefix='.weather-stations-old-')
+            os.rename(directory, os.path.join(retired, 'archive'))
+            os.rename(staging, directory)
+            shutil.rmtree(retired)
+        else:
+            os.rename(staging, directory)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    return len(stations), len(times)
+
+class StationWeatherProvider(WeatherProvider):
+    """
+    Readings from the nearest station and observation in a local archive.
+
+    The observation arrays are memory-mapped, so only the pages a lookup
+    touches are read and every process shares them through the page cache.
+    Stations are found with a KD-tree (scipy) or a vectorised scan when
+    scipy is not installed, and the observation with a binary search over
+    the station's time-sorted slice.
+    """
+    cached = False
+
+    def __init__(self, directory=None, max_distance_km=MAX_STATION_DISTANCE_KM,
+                 max_gap_seconds=MAX_OBSERVATION_GAP_SECONDS):
+        self.directory = directory or settings.WEATHER_STATION_DIR
+        self.max_distance_km = max_distance_km
+        self.max_gap_seconds = max_gap_seconds
+
+        def load(name):
+            return np.load(os.path.join(self.directory, name), mmap_mode='r')
+
+        self.offsets = np.asarray(load('offsets.npy'))
+        self.times = load('times.npy')
+        self.values = load('values.npy')
+        self.conditions = load('conditions.npy')
+        with open(os.path.join(self.directory, 'meta.json')) as f:
+            meta = json.load(f)
+        self.condition_names = [tuple(condition) for condition in meta['conditions']]
+
+        locations = np.asarray(load('locations.npy'))
+        self.points = unit_vectors(locations[:, 0], locations[:, 1])
+        self.tree = cKDTree(self.points) if cKDTree is not None and len(self.points) else None
+        logger.info(f"Loaded {len(self.points)} weather stations with {len(self.times)} observations")
+
+    def nearest_stations(self, lat, lon):
+        """(distance in km, station index) of the closest stations, nearest first."""
+        point = unit_vectors([lat], [lon])[0]
+        k = min(NEAREST_STATIONS, len(self.points))
+        if k == 0:
+            return []
+        if self.tree is not None:
+            chords, indexes = self.tree.query(point, k=k)
+            chords, indexes = np.atleast_1d(chords), np.atleast_1d(indexes)
+        else:
+            distances = np.linalg.norm(self.points - point, axis=1)
+            indexes = np.argpartition(distances, k - 1)[:k]
+            indexes = indexes[np.argsort(distances[indexes])]
+            chords = distances[indexes]
+        return list(zip(chord_to_km(chords).tolist(), indexes.tolist()))
+
+    def nearest_observation(self, station, epoch):
+        """Index of the station's observation closest to ``epoch``, or None."""
+        start, end = int(self.offsets[station]), int(self.offsets[station + 1])
+        if start == end:
+            return None
+        position = start + int(np.searchsorted(self.times[start:end], epoch))
+        candidates = [i for i in (position - 1, position) if start <= i < end]
+        best = min(candidates, key=lambda i: abs(int(self.times[i]) - epoch))
+        if abs(int(self.times[best]) - epoch) > self.max_gap_seconds:
+            return None
+        return best
+
+    def get_weather(self, lat, lon, when):
+        epoch = int(when.timestamp())
+        for distance, station in self.nearest_stations(lat, lon):
+            if distance > self.max_distance_km:
+                break
+            observation = self.nearest_observation(station, epoch)
+            if observation is None:
+                continue
+
+            reading = {}
+            for field, value in zip(VALUE_FIELDS, self.values[observation].tolist()):
+                if math.isnan(value):
+                    reading[field] = None
+                elif field in INTEGER_FIELDS:
+                    reading[field] = round(value)
+                else:
+                    reading[field] = value
+            condition, icon = self.condition_names[int(self.conditions[observation])]
+            reading['weather_condition'] = condition
+            reading['weather_icon'] = icon
+            reading['data_timestamp'] = datetime.fromtimestamp(int(self.times[observation]), tz=dt_timezone.utc)
+            return reading
+        return None
@@ -1,21 +1,127 @@
 import os
 import logging
-from datetime import datetime
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
 import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
+from django.db import IntegrityError, connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
 
 logger = logging.getLogger(__name__)
 
+# Longest wait between retries, whatever the backoff or Retry-After says
+MAX_BACKOFF_SECONDS = 60
+
+class TokenBucket:
+    """
+    Token bucket rate limiter shared by the threads of a process.
+
+    Tokens are added at ``calls_per_minute / 60`` per second up to
+    ``capacity``; ``acquire()`` takes one, waiting until one is available.
+    """
+
+    def __init__(self, calls_per_minute, capacity=None):
+        self.rate = calls_per_minute / 60
+        # A tenth of a minute's allowance may be spent in a burst
+        self.capacity = capacity or max(1, calls_per_minute // 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+_session = None
+_limiter = None
+_client_lock = threading.RLock()
+
+def get_weather_session():
+    """Keep-alive HTTP session with a connection pool sized for the fetch workers."""
+    global _session
+    with _client_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=max(10, settings.WEATHER_FETCH_WORKERS))
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+def get_weather_limiter():
+    global _limiter
+    with _client_lock:
+        if _limiter is None:
+            _limiter = TokenBucket(settings.WEATHER_CALLS_PER_MINUTE)
+        return _limiter
+
+def retry_delay(response, attempt):
+    """Seconds to wait before retry ``attempt`` (0 based), honouring Retry-After."""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        delay = int(retry_after)
+    else:
+        # Exponential backoff with jitter so concurrent workers spread out
+        delay = settings.WEATHER_BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5)
+    return min(delay, MAX_BACKOFF_SECONDS)
+
 class WeatherAPI:
-    BASE_URL = "https://api.openweathermap.org/data/2.5/weather"
+    PATH = "/data/2.5/weather"
+    # One Call 3.0 "timemachine": the hourly reading for any time since 1979
+    HISTORY_PATH = "/data/3.0/onecall/timemachine"
     
-    def __init__(self):
+    def __init__(self, base_url=None, session=None, limiter=None):
         self.api_key = settings.OPENWEATHER_API_KEY
+        self.base_url = (base_url or settings.OPENWEATHER_BASE_URL).rstrip('/')
+        self.session = session or get_weather_session()
+        self.limiter = limiter or get_weather_limiter()
         if not self.api_key:
             logger.warning("OpenWeather API key not found in settings")
         else:
             logger.info(f"Using API key: {self.api_key[:6]}...")
     
+    def request(self, path, params):
+        """
+        GET an API path through the rate limiter, retrying 429, 5xx and
+        connection errors with exponential backoff.
+        
+        Returns:
+            requests.Response: The final response
+        
+        Raises:
+            requests.RequestException: If the last attempt failed to connect
+        """
+        url = self.base_url + path
+        for attempt in range(settings.WEATHER_MAX_RETRIES + 1):
+            self.limiter.acquire()
+            try:
+                response = self.session.get(url, params=params, timeout=settings.WEATHER_REQUEST_TIMEOUT)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == settings.WEATHER_MAX_RETRIES:
+                    raise
+                logger.warning(f"Weather request failed ({e}), retrying")
+                response = None
+            else:
+                if response.status_code != 429 and response.status_code < 500:
+                    return response
+                if attempt == settings.WEATHER_MAX_RETRIES:
+                    return response
+                logger.warning(f"Weather API returned {response.status_code}, retrying")
+            time.sleep(retry_delay(response, attempt))
+    
     def get_weather_data(self, lat, lon, timestamp=None):
         """
         Fetch weather data for a given location and time.
@@ -39,10 +145,12 @@ class WeatherAPI:
             'appid': self.api_key,
             'units': 'metric'  # Use Celsius for temperature
         }
+        if timestamp is not None:
+            params['dt'] = int(timestamp.timestamp())
         
         try:
             logger.info(f"Fetching weather data for coordinates: {lat}, {lon}")
-            response = requests.get(self.BASE_URL, params=params)
+            response = self.request(self.PATH if timestamp is None else self.HISTORY_PATH, params)
             
             if response.status_code == 401:
                 logger.error("API key unauthorized. Please check if the key is valid and activated.")
@@ -55,25 +163,226 @@ class WeatherAPI:
             data = response.json()
             
             logger.info("Successfully fetched weather data")
+            if timestamp is None:
+                return {
+                    'temperature': data['main']['temp'],
+                    'feels_like': data['main']['feels_like'],
+                    'humidity': data['main']['humidity'],
+                    'wind_speed': data['wind']['speed'],
+                    'wind_direction': data['wind'].get('deg'),
+                    'weather_condition': data['weather'][0]['description'],
+                    'weather_icon': data['weather'][0]['icon'],
+                    'data_timestamp': datetime.fromtimestamp(data['dt'], tz=dt_timezone.utc)
+                }
+            
+            hour = data['data'][0]
             return {
-                'temperature': data['main']['temp'],
-                'feels_like': data['main']['feels_like'],
-                'humidity': data['main']['humidity'],
-                'wind_speed': data['wind']['speed'],
-                'wind_direction': data['wind'].get('deg'),
-                'weather_condition': data['weather'][0]['description'],
-                'weather_icon': data['weather'][0]['icon'],
-                'data_timestamp': datetime.fromtimestamp(data['dt'])
+                'temperature': hour['temp'],
+                'feels_like': hour['feels_like'],
+                'humidity': hour['humidity'],
+                'wind_speed': hour['wind_speed'],
+                'wind_direction': hour.get('wind_deg'),
+                'weather_condition': hour['weather'][0]['description'],
+                'weather_icon': hour['weather'][0]['icon'],
+                'data_timestamp': datetime.fromtimestamp(hour['dt'], tz=dt_timezone.utc)
             }
         except requests.RequestException as e:
             logger.error(f"Error fetching weather data: {str(e)}")
             if hasattr(e.response, 'text'):
                 logger.error(f"API response: {e.response.text}")
             return None
-        except (KeyError, ValueError) as e:
+        except (KeyError, IndexError, ValueError) as e:
             logger.error(f"Error parsing weather data: {str(e)}")
             return None
 
+class WeatherProvider:
+    """
+    Source of weather readings for a location and time.
+    
+    Readings are dicts of the WeatherData fields (temperature, feels_like,
+    humidity, wind_speed, wind_direction, weather_condition, weather_icon
+    and data_timestamp), or None when nothing is available.
+    """
+    # Seconds covered by one reading; media files are grouped into slots this long
+    resolution = 3600
+    # Whether readings go through the weather cache (worth it for network providers)
+    cached = True
+    
+    def get_weather(self, lat, lon, when):
+        raise NotImplementedError
+
+class OpenWeatherProvider(WeatherProvider):
+    """
+    OpenWeather readings: current conditions for recent photos and the
+    hourly timemachine reading for older ones.
+    """
+    
+    def __init__(self, api=None):
+        self.api = api or WeatherAPI()
+    
+    def get_weather(self, lat, lon, when):
+        if abs((timezone.now() - when).total_seconds()) < self.resolution:
+            return self.api.get_weather_data(lat=lat, lon=lon)
+        return self.api.get_weather_data(lat=lat, lon=lon, timestamp=when)
+
+_provider = None
+
+def get_weather_provider():
+    """The provider named by the WEATHER_PROVIDER setting."""
+    global _provider
+    with _client_lock:
+        if _provider is None:
+            _provider = import_string(settings.WEATHER_PROVIDER)()
+        return _provider
+
+def weather_slot(when, resolution):
+    """Start of the provider slot nearest ``when``, e.g. the nearest hour."""
+    epoch = int(when.timestamp())
+    return datetime.fromtimestamp(
+        (epoch + resolution // 2) // resolution * resolution,
+        tz=dt_timezone.utc
+    )
+
+class WeatherCache:
+    """
+    Weather readings cached by grid cell and time bucket.
+
+    Cameras within the same cell of ``grid_degrees`` and photos within the
+    same ``bucket_seconds`` share one reading. Lookups go through a
+    per-process LRU, then the WeatherCacheEntry table shared by all
+    processes, and only then to the API. Concurrent lookups of the same
+    key wait for the one request in flight instead of making their own.
+    """
+
+    def __init__(self, grid_degrees, bucket_seconds, max_entries):
+        self.grid_degrees = grid_degrees
+        self.bucket_seconds = bucket_seconds
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.stats = {'memory': 0, 'database': 0, 'fetched': 0, 'coalesced': 0}
+
+    def make_key(self, lat, lon, when):
+        """(lat_cell, lon_cell, bucket start as epoch seconds) for a location and time."""
+        epoch = int(when.timestamp())
+        return (
+            round(lat / self.grid_degrees),
+            round(lon / self.grid_degrees),
+            epoch - epoch % self.bucket_seconds
+        )
+
+    def get(self, lat, lon, when, fetch):
+        """
+        Weather for a location and time, calling ``fetch()`` on a miss.
+
+        Args:
+            lat (float): Latitude
+            lon (float): Longitude
+            when (datetime): Time the reading is for
+            fetch (callable): Returns the weather dict (or None) from the API
+
+        Returns:
+            dict: Weather data or None if it could not be fetched
+        """
+        key = self.make_key(lat, lon, when)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats['memory'] += 1
+                return self.entries[key]
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_flight[key] = Future()
+            else:
+                self.stats['coalesced'] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            data = self.load(key)
+            if data is not None:
+                self.stats['database'] += 1
+            else:
+                data = fetch()
+                self.stats['fetched'] += 1
+                if data is not None:
+                    self.store(key, data)
+            if data is not None:
+                self.remember(key, data)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def remember(self, key, data):
+        with self.lock:
+            self.entries[key] = data
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def bucket_start(self, key):
+        return datetime.fromtimestamp(key[2], tz=dt_timezone.utc)
+
+    def load(self, key):
+        """Reading of a key from the database tier, or None."""
+        from .models import WeatherCacheEntry  # Import here to avoid circular imports
+
+        data = WeatherCacheEntry.objects.filter(
+            lat_cell=key[0], lon_cell=key[1], bucket=self.bucket_start(key)
+        ).values_list('data', flat=True).first()
+        if data is None:
+            return None
+        return {**data, 'data_timestamp': datetime.fromisoformat(data['data_timestamp'])}
+
+    def store(self, key, data):
+        """Write a reading to the database tier; another process may have won the race."""
+        from .models import WeatherCacheEntry  # Import here to avoid circular imports
+
+        try:
+            WeatherCacheEntry.objects.get_or_create(
+                lat_cell=key[0],
+                lon_cell=key[1],
+                bucket=self.bucket_start(key),
+                defaults={'data': {**data, 'data_timestamp': data['data_timestamp'].isoformat()}}
+            )
+        except IntegrityError:
+            pass
+
+    def clear(self):
+        """Empty the in-memory tier (the database tier is kept)."""
+        with self.lock:
+            self.entries.clear()
+
+_weather_cache = None
+_weather_cache_lock = threading.Lock()
+
+def get_weather_cache():
+    global _weather_cache
+    with _weather_cache_lock:
+        if _weather_cache is None:
+            _weather_cache = WeatherCache(
+                settings.WEATHER_GRID_DEGREES,
+                settings.WEATHER_CACHE_BUCKET_SECONDS,
+                settings.WEATHER_CACHE_MAX_ENTRIES
+            )
+        return _weather_cache
+
+def get_cached_weather(provider, lat, lon, when):
+    """Weather at a location and time through the weather cache."""
+    if not provider.cached:
+        return provider.get_weather(lat, lon, when)
+    return get_weather_cache().get(
+        lat, lon, when,
+        lambda: provider.get_weather(lat, lon, when)
+    )
+
 def fetch_weather_for_media(media_file):
     """
     Fetch and save weather data for a media file.
@@ -91,15 +400,13 @@ def fetch_weather_for_media(media_file):
         logger.warning(f"Cannot fetch weather: no location data for media file {media_file.id}")
         return None
     
-    # Use capture date if available, otherwise upload date
-    timestamp = media_file.capture_date or media_file.upload_date
-    
-    # Fetch weather data
-    weather_api = WeatherAPI()
-    weather_data = weather_api.get_weather_data(
+    # Weather for the slot the photo was taken in (capture date if known)
+    provider = get_weather_provider()
+    weather_data = get_cached_weather(
+        provider,
         lat=media_file.camera.latitude,
         lon=media_file.camera.longitude,
-        timestamp=timestamp
+        when=weather_slot(media_file.capture_date or media_file.upload_date, provider.resolution)
     )
     
     if not weather_data:
@@ -120,4 +427,62 @@ def fetch_weather_for_media(media_file):
         }
     )
     
-    return weather_obj 
\ No newline at end of file
+    return weather_obj
+
+def fetch_weather_for_batch(media_files, workers=1):
+    """
+    Fetch and save weather data for a batch of media files in bulk.
+    
+    Files are grouped by camera and by the provider slot (the nearest hour
+    for OpenWeather) of their capture date, or upload date when it is not
+    known. One lookup is made per group, served from the weather cache when
+    a nearby camera already needed the same slot, and the readings are
+    written for every member with one ``bulk_create``.
+    
+    Args:
+        media_files (list[MediaFile]): Saved media files without weather data
+        workers (int): Number of lookups made concurrently
+    
+    Returns:
+        list[WeatherData]: The created weather data objects
+    """
+    from .models import WeatherData  # Import here to avoid circular imports
+    
+    provider = get_weather_provider()
+    groups = {}
+    for media_file in media_files:
+        camera = media_file.camera
+        if not camera.latitude or not camera.longitude:
+            logger.warning(f"Cannot fetch weather: no location data for camera {camera.id}")
+            continue
+        slot = weather_slot(media_file.capture_date or media_file.upload_date, provider.resolution)
+        groups.setdefault((media_file.camera_id, slot), []).append(media_file)
+    
+    def lookup(key):
+        camera = groups[key][0].camera
+        return get_cached_weather(provider, lat=camera.latitude, lon=camera.longitude, when=key[1])
+    
+    def threaded_lookup(key):
+        try:
+            return lookup(key)
+        finally:
+            # The cache reads its database tier from this worker thread
+            connection.close()
+    
+    keys = list(groups)
+    if workers > 1 and len(keys) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(threaded_lookup, keys))
+    else:
+        results = [lookup(key) for key in keys]
+    
+    weather_objects = []
+    for key, weather_data in zip(keys, results):
+        if not weather_data:
+            continue
+        weather_objects.extend(
+            WeatherData(media_file=media_file, **weather_data)
+            for media_file in groups[key]
+        )
+    
+    return WeatherData.objects.bulk_create(weather_objects, batch_size=500)
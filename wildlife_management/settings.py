@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 import dj_database_url
 from django.core.exceptions import ImproperlyConfigured
@@ -24,6 +25,27 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 # OpenWeather API settings
 OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY')
+OPENWEATHER_BASE_URL = os.getenv('OPENWEATHER_BASE_URL', 'https://api.openweathermap.org')
+# Calls per minute allowed by the plan (60 on the free plan), enforced per process
+WEATHER_CALLS_PER_MINUTE = int(os.getenv('WEATHER_CALLS_PER_MINUTE', '60'))
+WEATHER_REQUEST_TIMEOUT = float(os.getenv('WEATHER_REQUEST_TIMEOUT', '10'))
+# 429 and 5xx responses are retried with exponential backoff from this base delay
+WEATHER_MAX_RETRIES = int(os.getenv('WEATHER_MAX_RETRIES', '5'))
+WEATHER_BACKOFF_SECONDS = float(os.getenv('WEATHER_BACKOFF_SECONDS', '1'))
+WEATHER_FETCH_WORKERS = int(os.getenv('WEATHER_FETCH_WORKERS', '4'))
+
+# Where weather readings come from: OpenWeather by default, or an offline
+# station archive built with the import_weather_stations command
+# (core.weather_stations.StationWeatherProvider; uses scipy when installed).
+WEATHER_PROVIDER = os.getenv('WEATHER_PROVIDER', 'core.weather_utils.OpenWeatherProvider')
+WEATHER_STATION_DIR = os.getenv('WEATHER_STATION_DIR', os.path.join(BASE_DIR, 'weather_stations'))
+
+# Weather lookups are cached per grid cell and time bucket (see core/weather_utils.py):
+# 0.01 degrees is about 1 km, and one reading covers a 10 minute bucket
+WEATHER_GRID_DEGREES = float(os.getenv('WEATHER_GRID_DEGREES', '0.01'))
+WEATHER_CACHE_BUCKET_SECONDS = int(os.getenv('WEATHER_CACHE_BUCKET_SECONDS', '600'))
+# Cells kept in memory per process, in front of the database tier
+WEATHER_CACHE_MAX_ENTRIES = int(os.getenv('WEATHER_CACHE_MAX_ENTRIES', '10000'))
 
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', 'django-insecure-default-key-for-development')
@@ -44,8 +66,13 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'core',
     'storages',  # For AWS S3
+    'imagekit',  # Thumbnail/preview renditions
 ]
 
+# Everything except WhiteNoise can run natively under ASGI. WhiteNoise has no
+# async support (up to 6.12), so Django runs the middleware chain below it,
+# and the views, in a thread per request. Slow request bodies are still
+# received on the event loop before any thread is used.
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # For static files
@@ -55,7 +82,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'core.middleware.DatabaseErrorMiddleware',  # Database error handling
+    'core.middleware.database_error_middleware',  # Database error handling
 ]
 
 ROOT_URLCONF = 'wildlife_management.urls'
@@ -150,6 +177,8 @@ if os.getenv('USE_S3', 'False').lower() == 'true':
     AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
     AWS_STORAGE_BUCKET_NAME = os.getenv('AWS_STORAGE_BUCKET_NAME')
     AWS_S3_REGION_NAME = os.getenv('AWS_S3_REGION_NAME', 'us-east-1')
+    # Set for S3-compatible services such as a local MinIO
+    AWS_S3_ENDPOINT_URL = os.getenv('AWS_S3_ENDPOINT_URL')
     AWS_DEFAULT_ACL = 'private'
     AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
     AWS_S3_OBJECT_PARAMETERS = {'CacheControl': 'max-age=86400'}
@@ -164,6 +193,14 @@ else:
     MEDIA_URL = '/media/'
     MEDIA_ROOT = BASE_DIR / 'media'
 
+# Image renditions (see core/renditions.py)
+IMAGEKIT_SPEC_CACHEFILE_NAMER = 'core.renditions.content_hash_namer'
+IMAGEKIT_DEFAULT_FILE_STORAGE = (
+    'core.renditions.S3RenditionStorage'
+    if os.getenv('USE_S3', 'False').lower() == 'true'
+    else 'core.renditions.LocalRenditionStorage'
+)
+
 # Security Settings
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 SECURE_SSL_REDIRECT = not DEBUG
@@ -198,6 +235,61 @@ LOGIN_URL = 'login'
 
 # AI Model Settings
 AI_MODELS_DIR = BASE_DIR / 'core' / 'ai_models'
+AI_CLASSIFICATION_ENABLED = os.getenv('AI_CLASSIFICATION_ENABLED', 'False').lower() == 'true'
+
+# Background job queue (see core/jobs.py and the run_jobs command)
+# Enrichment stages queued for every new media file. They are independent
+# jobs, claimed and run concurrently with no ordering between them
+# (EXIF is read at ingest; the 'exif' job remains for re-extraction)
+ENRICHMENT_JOBS = ['renditions', 'weather']
+if AI_CLASSIFICATION_ENABLED:
+    ENRICHMENT_JOBS.append('classify')
+# Seconds before a running job whose worker died is put back on the queue
+# (live workers refresh their jobs' locks every quarter of this)
+JOB_LOCK_TIMEOUT = int(os.getenv('JOB_LOCK_TIMEOUT', '600'))
+
+# Local disk cache for remote media read by hashing, EXIF and classification
+# (see core/storage_utils.py)
+MEDIA_CACHE_DIR = os.getenv(
+    'MEDIA_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'wildlife-management-media')
+)
+MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+# Files downloaded concurrently by batch jobs
+MEDIA_PREFETCH_WORKERS = int(os.getenv('MEDIA_PREFETCH_WORKERS', '8'))
+
+# Uploads are SHA-256 hashed while they stream in (see core/upload_handlers.py)
+FILE_UPLOAD_HANDLERS = [
+    'core.upload_handlers.HashingMemoryFileUploadHandler',
+    'core.upload_handlers.HashingTemporaryFileUploadHandler',
+]
+
+# Cache for the dashboard and camera map (see core/cache_utils.py). Entries
+# are invalidated by signals, so the cache must be shared by the web and
+# job worker processes: file based by default, Redis when REDIS_URL is set
+# (requires the redis package).
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'TIMEOUT': None,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv(
+                'CACHE_DIR',
+                os.path.join(tempfile.gettempdir(), 'wildlife-management-cache')
+            ),
+            'TIMEOUT': None,
+            'OPTIONS': {
+                'MAX_ENTRIES': 1000,
+            },
+        }
+    }
 
 # Logging Configuration
 LOGGING = {